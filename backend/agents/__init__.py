@@ -4,10 +4,37 @@ from .food_agent import (
     FoodRecognitionAgent,
     get_food_agent,
     get_food_agent_service,
+    close_food_agent_service,
     FoodAgentService,
     lookup_nutrition,
     extraction_to_response,
+    build_parse_response,
     SYSTEM_PROMPT,
+    COMPACT_SYSTEM_PROMPT,
+    COMPACT_SYSTEM_PROMPT_LOCAL,
+)
+from .llm import (
+    LLMUnavailableError,
+    ChatResult,
+    LLMBackend,
+    GroqBackend,
+    OllamaBackend,
+    OpenAICompatibleBackend,
+    BatchingScheduler,
+    create_backend,
+)
+from .structured import (
+    EXTRACTION_JSON_SCHEMA,
+    json_schema_for,
+    repair_json,
+)
+from .jobs import JOB_HANDLERS, run_parse_job, run_image_job
+from .llm_router import (
+    LLMRouter,
+    Route,
+    CircuitBreaker,
+    TokenBucket,
+    create_llm_backend,
 )
 
 # Alias for backwards compatibility
@@ -17,9 +44,32 @@ __all__ = [
     "FoodRecognitionAgent",
     "get_food_agent",
     "get_food_agent_service",
+    "close_food_agent_service",
     "FoodAgentService",
     "lookup_nutrition",
     "extraction_to_response",
+    "build_parse_response",
     "AGENT_INSTRUCTION",
     "SYSTEM_PROMPT",
+    "COMPACT_SYSTEM_PROMPT",
+    "COMPACT_SYSTEM_PROMPT_LOCAL",
+    "LLMUnavailableError",
+    "ChatResult",
+    "LLMBackend",
+    "GroqBackend",
+    "OllamaBackend",
+    "OpenAICompatibleBackend",
+    "BatchingScheduler",
+    "create_backend",
+    "EXTRACTION_JSON_SCHEMA",
+    "json_schema_for",
+    "repair_json",
+    "LLMRouter",
+    "Route",
+    "CircuitBreaker",
+    "TokenBucket",
+    "create_llm_backend",
+    "JOB_HANDLERS",
+    "run_parse_job",
+    "run_image_job",
 ]
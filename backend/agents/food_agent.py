@@ -1,13 +1,45 @@
-"""Food recognition agent using Groq LLM and Hugging Face for vision."""
+"""Food recognition agent using a pluggable LLM backend (Groq, Ollama, OpenAI-compatible)."""
 
-import json
+import asyncio
 import base64
+import functools
+import inspect
 import httpx
 from datetime import datetime
 from typing import Optional
-from groq import Groq
 
+from services.admission import SPECULATIVE, AdmissionRejected, llm_slot, request_priority, request_user
+from services.barcodes import get_barcode_index, parse_barcode_log
+from services.shared_cache import create_cache
+from services.usage import note_cache, record_completion, usage_scope
 from services.config import get_settings
+from services.food_memory import MEMORY_CONFIDENCE, FoodMemory, parse_meal_reference
+from services.mongodb import get_food_memory
+from services.nutrition_db import FoodRecord, NutritionDatabase, get_nutrition_db
+from services.nutrition_scaling import NUTRIENT_COLUMNS, FoodTable
+from .llm import LLMBackend, LLMUnavailableError, create_backend
+from .llm_router import create_llm_backend
+from .segments import (
+    Segment,
+    SegmentCache,
+    match_segments,
+    meal_mentioned,
+    scale_item,
+    split_segments,
+)
+from .semantic_cache import SemanticCache, create_embedder
+from .structured import (
+    COMPACT_JSON_SCHEMA,
+    COMPACT_LOCAL_JSON_SCHEMA,
+    EXTRACTION_JSON_SCHEMA,
+    REASK_JSON_SCHEMA,
+    build_reask_messages,
+    coerce_number,
+    expand_compact,
+    invalid_item_fields,
+    merge_reask,
+    repair_json,
+)
 from models.food import (
     FoodLogExtraction,
     FoodLogExtractionItem,
@@ -16,8 +48,12 @@ from models.food import (
     ParseFoodLogResponse,
 )
 
+MEAL_LABELS = ("Breakfast", "Lunch", "Dinner", "Snack")
+BARCODE_CONFIDENCE = 0.99
+
 # ============ Nutrition Data ============
 
+# Nutrients per 100 g; ``weight`` is grams per ``unit``.
 BASIC_NUTRITION = {
     "egg": {"calories": 155, "protein_g": 13, "carbs_g": 1.1, "fat_g": 11, "unit": "piece", "weight": 50},
     "toast": {"calories": 265, "protein_g": 9, "carbs_g": 49, "fat_g": 3.2, "unit": "slice", "weight": 30},
@@ -36,39 +72,27 @@ BASIC_NUTRITION = {
     "pizza": {"calories": 266, "protein_g": 11, "carbs_g": 33, "fat_g": 10, "unit": "slice", "weight": 107},
     "burger": {"calories": 295, "protein_g": 17, "carbs_g": 24, "fat_g": 14, "unit": "piece", "weight": 150},
 }
+# Used for foods not in BASIC_NUTRITION: a 100 g serving of an average food.
+DEFAULT_NUTRITION = {"calories": 100, "protein_g": 5, "carbs_g": 15, "fat_g": 3, "unit": "serving", "weight": 100}
+
+BASIC_FOODS = FoodTable(BASIC_NUTRITION, DEFAULT_NUTRITION)
 
 # ============ Helper Functions ============
 
-def get_nutrition_info(food_name: str, quantity: float = 1.0) -> dict:
-    """Look up nutritional information for a food item."""
-    name_lower = food_name.lower()
-
-    nutrition = None
-    for key, data in BASIC_NUTRITION.items():
-        if key in name_lower:
-            nutrition = data
-            break
-
-    if nutrition is None:
-        return {
-            "food_name": food_name,
-            "quantity": quantity,
-            "calories": round(100 * quantity, 1),
-            "protein_g": round(5 * quantity, 1),
-            "carbs_g": round(15 * quantity, 1),
-            "fat_g": round(3 * quantity, 1),
-            "note": "Default estimate - food not in database"
-        }
+def get_nutrition_info(food_name: str, quantity: float = 1.0, unit: Optional[str] = None) -> dict:
+    """Look up nutritional information for a food item.
 
-    return {
-        "food_name": food_name,
-        "quantity": quantity,
-        "calories": round(nutrition["calories"] * quantity, 1),
-        "protein_g": round(nutrition["protein_g"] * quantity, 1),
-        "carbs_g": round(nutrition["carbs_g"] * quantity, 1),
-        "fat_g": round(nutrition["fat_g"] * quantity, 1),
-        "unit": nutrition["unit"],
-    }
+    ``quantity`` is in ``unit`` (grams, cups, ...); without a unit it counts
+    the food's usual portions ("2" eggs, "1" cup of rice).
+    """
+    row, totals = BASIC_FOODS.nutrients_one(food_name, quantity, unit)
+    result = {"food_name": food_name, "quantity": quantity}
+    result.update(zip(NUTRIENT_COLUMNS, totals))
+    if row == BASIC_FOODS.default_index:
+        result["note"] = "Default estimate - food not in database"
+    else:
+        result["unit"] = unit or BASIC_NUTRITION[BASIC_FOODS.keys[row]]["unit"]
+    return result
 
 
 SYSTEM_PROMPT = '''You are a nutrition analysis expert. Your task is to analyze food descriptions and return structured nutritional information.
@@ -110,16 +134,107 @@ Rules:
 
 IMPORTANT: Return ONLY the JSON object, nothing else.'''
 
+# Short-key variant of SYSTEM_PROMPT: about a quarter of the input tokens, and the
+# response omits datetime/brand/notes/search_query, which are filled in server-side.
+# It must stay byte-identical between requests so providers and local runtimes can
+# reuse the cached prompt prefix; everything request-specific goes in the user message.
+COMPACT_SYSTEM_PROMPT = '''Extract the foods in a meal log. Reply with JSON only:
+{"m":"B|L|D|S","i":[{"n":name,"q":qty,"u":"g|ml|cup|piece|serving","k":kcal,"p":protein_g,"c":carbs_g,"f":fat_g}],"cq":null,"cf":0.9}
+One entry per food; nutrients are totals for the eaten portion; assume typical portions if none given.
+m: meal named in the log, else from local time (B 05-10h, L 11-15h, D 16-21h, S otherwise).
+cq: a short question only if the log is too vague to estimate, else null. cf: confidence 0-1.'''
+
+# Compact prompt used when a local nutrition database is imported: the model only
+# names the foods and portions (plus a gram estimate), and nutrients are computed
+# from the database, which is deterministic and saves most of the output tokens.
+COMPACT_SYSTEM_PROMPT_LOCAL = '''Extract the foods in a meal log. Reply with JSON only:
+{"m":"B|L|D|S","i":[{"n":name,"q":qty,"u":"g|ml|cup|piece|slice|serving","g":grams}],"cq":null,"cf":0.9}
+One entry per food; n is a plain food name (brand if given); g estimates the eaten weight in grams; assume typical portions if none given.
+m: meal named in the log, else from local time (B 05-10h, L 11-15h, D 16-21h, S otherwise).
+cq: a short question only if the log is too vague to estimate, else null. cf: confidence 0-1.'''
+
 
 # ============ Agent Service Class ============
 
+def _charged(endpoint: str):
+    """Charge the LLM usage of an agent method to its ``user_id`` argument and ``endpoint``.
+
+    The user also takes their turn in the global LLM queue under that id.
+    """
+    def decorate(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            user_id = signature.bind(self, *args, **kwargs).arguments.get("user_id", "default")
+            token = request_user.set(user_id)
+            try:
+                with usage_scope(user_id, endpoint):
+                    return await method(self, *args, **kwargs)
+            finally:
+                request_user.reset(token)
+        return wrapper
+    return decorate
+
+
 class FoodAgentService:
-    """Service class for food parsing using Groq LLM with vision capabilities."""
+    """Service class for food parsing using an LLM backend with vision capabilities."""
 
-    def __init__(self):
+    def __init__(
+        self,
+        text_backend: Optional[LLMBackend] = None,
+        vision_backend: Optional[LLMBackend] = None,
+        prompt_style: Optional[str] = None,
+        nutrition_db: Optional[NutritionDatabase] = None,
+    ):
         settings = get_settings()
-        self.groq_client = Groq(api_key=settings.groq_api_key)
+        self.text_backend = text_backend or create_llm_backend(settings)
+        if vision_backend is not None:
+            self.vision_backend = vision_backend
+        elif settings.llm_vision_provider.lower() == settings.llm_provider.lower() and not settings.llm_routes:
+            self.vision_backend = self.text_backend
+        else:
+            self.vision_backend = create_backend(settings.llm_vision_provider, settings)
+        self.compact = (prompt_style or settings.llm_prompt_style) == "compact"
+        if nutrition_db is None and settings.nutrition_source == "auto":
+            nutrition_db = get_nutrition_db()
+        self.nutrition_db = nutrition_db
+        # Nutrients come from the database instead of the model (compact prompt only).
+        self.local_nutrients = self.compact and self.nutrition_db is not None
+        if settings.llm_json_mode == "off":
+            self.response_schema = None
+        elif self.local_nutrients:
+            self.response_schema = COMPACT_LOCAL_JSON_SCHEMA
+        else:
+            self.response_schema = COMPACT_JSON_SCHEMA if self.compact else EXTRACTION_JSON_SCHEMA
+        self.segment_cache = SegmentCache(
+            settings.parse_segment_cache_size,
+            settings.parse_segment_cache_ttl_s,
+        ) if settings.parse_segment_cache else None
+        # Built on first use, off the event loop: it allocates the index and loads it from disk.
+        self.semantic_cache: Optional[SemanticCache] = None
+        self._semantic_cache_enabled = settings.semantic_cache
+        self._semantic_cache_lock = asyncio.Lock()
+        self.use_food_memory = settings.food_memory
+        # Draft parses keyed by user and normalized text, read back by the final parse
+        # (shared, so the final parse may land on another worker than the drafts).
+        self.draft_cache = create_cache(
+            "drafts-v1",
+            settings.draft_cache_size,
+            settings.draft_cache_ttl_s,
+            max_value_bytes=4096,
+        ) if settings.draft_parse else None
+        self.draft_llm = settings.draft_parse_llm
 
+    async def aclose(self) -> None:
+        """Persist caches and close the underlying LLM backends."""
+        if self.semantic_cache is not None:
+            await asyncio.to_thread(self.semantic_cache.save)
+        await self.text_backend.aclose()
+        if self.vision_backend is not self.text_backend:
+            await self.vision_backend.aclose()
+
+    @_charged("parse")
     async def parse_text(
         self,
         text: str,
@@ -127,9 +242,448 @@ class FoodAgentService:
         timezone: str = "UTC",
         user_id: str = "default",
     ) -> FoodLogExtraction:
-        """Parse natural language food log using Groq."""
+        """Parse natural language food log, answering from the user's food memory and the caches where possible."""
+        if not current_datetime:
+            current_datetime = datetime.now().isoformat()
+
+        barcode = self._parse_barcode(text, current_datetime)
+        if barcode is not None:
+            note_cache("barcode")
+            return barcode
+
+        drafted = self._drafted(user_id, text)
+        if drafted is not None:
+            note_cache("draft")
+            # The draft was parsed while the user was typing, maybe minutes ago.
+            drafted.datetime_local = current_datetime
+            drafted.meal = meal_mentioned(text) or self._infer_meal_from_time(_hour_of(current_datetime))
+            return drafted
+
+        memory = await self._load_food_memory(user_id)
+        personal = False
+        if memory:
+            recalled = self._recall_meal(text, current_datetime, memory)
+            if recalled is not None:
+                note_cache("memory")
+                return recalled
+            remembered = [memory.match(s.name, s.qty, s.unit) for s in split_segments(text)]
+            if remembered and all(remembered):
+                note_cache("memory")
+                return FoodLogExtraction(
+                    meal=meal_mentioned(text) or self._infer_meal_from_time(_hour_of(current_datetime)),
+                    datetime_local=current_datetime,
+                    items=[FoodLogExtractionItem(**item) for item in remembered],
+                    confidence=MEMORY_CONFIDENCE,
+                )
+            personal = any(remembered)
+
+        # Logs that use the user's own foods bypass the shared cache in both directions.
+        semantic_cache = await self._get_semantic_cache() if not personal else None
+        if semantic_cache is None:
+            extraction = await self._parse_segments(text, current_datetime, timezone, memory)
+            return await self._fill_nutrients(extraction, memory)
+
+        cached = await asyncio.to_thread(semantic_cache.lookup, text)
+        if cached is not None:
+            note_cache("semantic")
+            extraction = FoodLogExtraction(**cached)
+            extraction.datetime_local = current_datetime
+            extraction.meal = meal_mentioned(text) or self._infer_meal_from_time(_hour_of(current_datetime))
+            return await self._fill_nutrients(extraction, memory)
+
+        extraction = await self._parse_segments(text, current_datetime, timezone, memory)
+        if extraction.items and not extraction.needs_clarification:
+            await asyncio.to_thread(semantic_cache.store, text, extraction.model_dump())
+        return await self._fill_nutrients(extraction, memory)
+
+    async def _get_semantic_cache(self) -> Optional[SemanticCache]:
+        """The semantic cache (None when disabled), built in a thread by the first caller."""
+        if self.semantic_cache is None and self._semantic_cache_enabled:
+            async with self._semantic_cache_lock:
+                if self.semantic_cache is None and self._semantic_cache_enabled:
+                    settings = get_settings()
+                    embedder = await asyncio.to_thread(create_embedder, settings.semantic_cache_model)
+                    if embedder is None:
+                        self._semantic_cache_enabled = False
+                        return None
+                    self.semantic_cache = await asyncio.to_thread(
+                        lambda: SemanticCache(
+                            embedder,
+                            max_entries=settings.semantic_cache_max_entries,
+                            threshold=settings.semantic_cache_threshold,
+                            path=settings.semantic_cache_path,
+                        )
+                    )
+        return self.semantic_cache
+
+    @_charged("draft")
+    async def draft_parse(
+        self,
+        text: str,
+        current_datetime: Optional[str] = None,
+        timezone: str = "UTC",
+        user_id: str = "default",
+    ) -> Optional[FoodLogExtraction]:
+        """Speculatively parse a log the user is still typing, so the final parse finds it cached.
+
+        The food memory and segment cache are tried first; the LLM is used
+        only when a slot is free right now, and the semantic cache not at all.
+        Returns None when nothing could be parsed yet.
+        """
+        if self.draft_cache is None:
+            return None
         if not current_datetime:
             current_datetime = datetime.now().isoformat()
+        drafted = self._drafted(user_id, text)
+        if drafted is not None:
+            return drafted
+        if parse_barcode_log(text) is not None:
+            return None  # answered locally by the final parse anyway
+
+        memory = await self._load_food_memory(user_id)
+        cheap = self._parse_cheaply(text, current_datetime, memory)
+        if cheap is not None:
+            self.draft_cache.set(_draft_key(user_id, text), cheap.model_dump())
+            return cheap
+
+        if not self.draft_llm:
+            return None
+        token = request_priority.set(SPECULATIVE)
+        try:
+            # A half-typed log must never become a semantic cache entry a paraphrase could match.
+            extraction = await self._parse_segments(text, current_datetime, timezone, memory)
+        except (AdmissionRejected, LLMUnavailableError):
+            return None
+        finally:
+            request_priority.reset(token)
+        extraction = await self._fill_nutrients(extraction, memory)
+        if extraction.items and not extraction.needs_clarification:
+            self.draft_cache.set(_draft_key(user_id, text), extraction.model_dump())
+        return extraction
+
+    def _drafted(self, user_id: str, text: str) -> Optional[FoodLogExtraction]:
+        """The draft parse of exactly this text, if one is cached."""
+        if self.draft_cache is None:
+            return None
+        cached = self.draft_cache.get(_draft_key(user_id, text))
+        return FoodLogExtraction(**cached) if cached is not None else None
+
+    def _parse_cheaply(self, text: str, current_datetime: str, memory: Optional[FoodMemory]) -> Optional[FoodLogExtraction]:
+        """A parse from the food memory and segment cache alone, or None if any segment needs the LLM."""
+        if memory:
+            recalled = self._recall_meal(text, current_datetime, memory)
+            if recalled is not None:
+                note_cache("memory")
+                return recalled
+        segments = split_segments(text)
+        hits = [self._lookup_segment(segment, memory) for segment in segments]
+        if not hits or not all(hits):
+            return None
+        note_cache("segments")
+        return FoodLogExtraction(
+            meal=meal_mentioned(text) or self._infer_meal_from_time(_hour_of(current_datetime)),
+            datetime_local=current_datetime,
+            items=[item for item, _ in hits],
+            confidence=min(confidence for _, confidence in hits),
+        )
+
+    @_charged("edit")
+    async def reparse_text(
+        self,
+        text: str,
+        previous_text: str,
+        previous: ParseFoodLogResponse,
+        current_datetime: Optional[str] = None,
+        timezone: str = "UTC",
+        user_id: str = "default",
+    ) -> FoodLogExtraction:
+        """Re-parse an edited log, reusing the previous result for segments the edit left alone.
+
+        Segments whose food and unit are unchanged keep their previous item,
+        rescaled when only the quantity changed; only new or changed segments
+        are parsed. Falls back to a full parse when the previous items do not
+        map one-to-one onto the previous text's segments.
+        """
+        if not current_datetime:
+            current_datetime = datetime.now().isoformat()
+
+        old_segments = split_segments(previous_text)
+        segments = split_segments(text)
+        if (
+            previous.needs_clarification
+            or not segments
+            or len(previous.items) != len(old_segments)
+            or parse_barcode_log(text) is not None
+        ):
+            return await self.parse_text(text, current_datetime, timezone, user_id)
+
+        matches = match_segments(old_segments, segments)
+        if all(match is None for match in matches):
+            return await self.parse_text(text, current_datetime, timezone, user_id)
+
+        reused = {}
+        for index, match in enumerate(matches):
+            if match is None:
+                continue
+            factor = segments[index].scale / old_segments[match].scale
+            reused[index] = FoodLogExtractionItem(**scale_item(_extraction_item(previous.items[match]), factor))
+
+        changed = [segment for index, segment in enumerate(segments) if index not in reused]
+        parsed = None
+        new_items = iter(())
+        confidences = [previous.confidence_score]
+        if changed:
+            memory = await self._load_food_memory(user_id)
+            parsed = await self._parse_segments(", ".join(s.text for s in changed), current_datetime, timezone, memory)
+            parsed = await self._fill_nutrients(parsed, memory)
+            if len(parsed.items) == len(changed):
+                new_items = iter(parsed.items)
+            confidences.append(parsed.confidence)
+
+        items = []
+        for index in range(len(segments)):
+            if index in reused:
+                items.append(reused[index])
+                continue
+            item = next(new_items, None)
+            if item is not None:
+                items.append(item)
+        if parsed is not None and len(parsed.items) != len(changed):
+            items.extend(parsed.items)
+
+        print(f"[Agent] Re-parse reused {len(reused)} of {len(segments)} segment(s)")
+        if not changed:
+            note_cache("edit")
+        meal = meal_mentioned(text) or previous.meal_label
+        return FoodLogExtraction(
+            meal=meal if meal in MEAL_LABELS else self._infer_meal_from_time(_hour_of(current_datetime)),
+            datetime_local=previous.logged_at_iso or current_datetime,
+            items=items,
+            needs_clarification=parsed.needs_clarification if parsed else False,
+            clarification_question=parsed.clarification_question if parsed else None,
+            confidence=min(confidences),
+        )
+
+    def _parse_barcode(self, text: str, current_datetime: str) -> Optional[FoodLogExtraction]:
+        """Resolve a log that is just a scanned or typed barcode from the local product index."""
+        parsed = parse_barcode_log(text)
+        if parsed is None or (get_barcode_index() is None and get_nutrition_db() is None):
+            return None
+        key, qty, unit = parsed
+        food = self._find_product(key)
+        meal = self._infer_meal_from_time(_hour_of(current_datetime))
+        if food is None:
+            # The LLM cannot know the product either; ask instead of guessing.
+            return FoodLogExtraction(
+                meal=meal,
+                datetime_local=current_datetime,
+                items=[],
+                needs_clarification=True,
+                clarification_question=f"I couldn't find product {key}. What is it?",
+                confidence=0.0,
+            )
+
+        if unit in ("g", "ml"):
+            grams = qty
+        elif food.serving_g:
+            qty, unit = qty or 1.0, "serving"
+            grams = qty * food.serving_g
+        else:
+            # No serving size on the label: count the default as 100 g.
+            qty, unit = (qty or 1.0) * 100.0, "g"
+            grams = qty
+        factor = grams / 100.0
+        return FoodLogExtraction(
+            meal=meal,
+            datetime_local=current_datetime,
+            items=[FoodLogExtractionItem(
+                item_name=food.name,
+                qty=qty,
+                unit=unit,
+                brand=food.brand,
+                search_query=food.name,
+                calories=round(food.kcal * factor, 1),
+                protein_g=round(food.protein_g * factor, 1),
+                carbs_g=round(food.carbs_g * factor, 1),
+                fat_g=round(food.fat_g * factor, 1),
+                grams=round(grams, 1),
+            )],
+            confidence=BARCODE_CONFIDENCE,
+        )
+
+    def _find_product(self, key: int) -> Optional[FoodRecord]:
+        """Product for a barcode key from the barcode index, else the nutrition database."""
+        index = get_barcode_index()
+        if index is not None:
+            return index.lookup(key)
+        db = get_nutrition_db()
+        if db is not None:
+            code = str(key)
+            return db.get_by_code(code) or db.get_by_code(code.zfill(13))
+        return None
+
+    async def _load_food_memory(self, user_id: str) -> Optional[FoodMemory]:
+        """The user's food memory, or None when disabled, anonymous or unavailable."""
+        if not self.use_food_memory or user_id == "default":
+            return None
+        try:
+            return await get_food_memory(user_id)
+        except Exception as e:
+            print(f"[Agent] Food memory unavailable: {type(e).__name__}: {str(e)}")
+            return None
+
+    def _recall_meal(self, text: str, current_datetime: str, memory: FoodMemory) -> Optional[FoodLogExtraction]:
+        """Resolve "my usual breakfast" / "same lunch as yesterday" from the user's meal history."""
+        reference = parse_meal_reference(text)
+        if reference is None:
+            return None
+        meal, when = reference
+        try:
+            today = datetime.fromisoformat(current_datetime).date()
+        except ValueError:
+            today = datetime.now().date()
+        items = memory.meal_items(meal, when, today)
+        if not items:
+            return None
+        return FoodLogExtraction(
+            meal=meal,
+            datetime_local=current_datetime,
+            items=[FoodLogExtractionItem(**item) for item in items],
+            confidence=MEMORY_CONFIDENCE,
+        )
+
+    async def _fill_nutrients(self, extraction: FoodLogExtraction, memory: Optional[FoodMemory]) -> FoodLogExtraction:
+        """Fill items the model left without nutrients from the user's confirmed foods, then the nutrition database."""
+        if self.nutrition_db is not None and any(item.calories is None for item in extraction.items):
+            # Full-text searches on SQLite: keep them off the event loop.
+            return await asyncio.to_thread(self._fill_nutrients_sync, extraction, memory)
+        return self._fill_nutrients_sync(extraction, memory)
+
+    def _fill_nutrients_sync(self, extraction: FoodLogExtraction, memory: Optional[FoodMemory]) -> FoodLogExtraction:
+        for item in extraction.items:
+            if item.calories is not None:
+                continue
+            remembered = memory.match(item.item_name, item.qty, item.unit) if memory else None
+            if remembered is not None:
+                for field in ("calories", "protein_g", "carbs_g", "fat_g"):
+                    setattr(item, field, remembered[field])
+                if item.qty is None:
+                    item.qty, item.unit = remembered["qty"], remembered["unit"]
+            elif self.nutrition_db is not None:
+                _fill_from_database(item, self.nutrition_db)
+        return extraction
+
+    async def _parse_segments(
+        self,
+        text: str,
+        current_datetime: str,
+        timezone: str,
+        memory: Optional[FoodMemory] = None,
+    ) -> FoodLogExtraction:
+        """Parse a food log, sending only segments not found in the food memory or segment cache to the LLM."""
+        if self.segment_cache is None and not memory:
+            return await self._parse_with_llm(text, current_datetime, timezone)
+
+        segments = split_segments(text)
+        if not segments:
+            return await self._parse_with_llm(text, current_datetime, timezone)
+
+        hits = [self._lookup_segment(segment, memory) for segment in segments]
+        missing = [segment for segment, hit in zip(segments, hits) if hit is None]
+        if len(missing) == len(segments):
+            # Nothing cached: parse the original text so the LLM keeps its full context.
+            parsed = await self._parse_with_llm(text, current_datetime, timezone)
+            self._remember_segments(missing, parsed)
+            return parsed
+
+        parsed = None
+        llm_items = iter(())
+        confidences = []
+        if missing:
+            parsed = await self._parse_with_llm(
+                ", ".join(s.text for s in missing), current_datetime, timezone, cache="partial",
+            )
+            self._remember_segments(missing, parsed)
+            if len(parsed.items) == len(missing):
+                llm_items = iter(parsed.items)
+            confidences.append(parsed.confidence)
+        else:
+            note_cache("segments")
+
+        # Merge cached and freshly parsed items back into the order of the log.
+        items = []
+        for hit in hits:
+            if hit is None:
+                item = next(llm_items, None)
+                if item is not None:
+                    items.append(item)
+            else:
+                items.append(hit[0])
+                confidences.append(hit[1])
+        if parsed is not None and len(parsed.items) != len(missing):
+            items.extend(parsed.items)
+
+        meal = meal_mentioned(text) or (parsed.meal if parsed else self._infer_meal_from_time(_hour_of(current_datetime)))
+        return FoodLogExtraction(
+            meal=meal,
+            datetime_local=current_datetime,
+            items=items,
+            needs_clarification=parsed.needs_clarification if parsed else False,
+            clarification_question=parsed.clarification_question if parsed else None,
+            confidence=min(confidences),
+        )
+
+    def _lookup_segment(self, segment: Segment, memory: Optional[FoodMemory]):
+        """(item, confidence) for a segment from the user's memory, then the segment cache."""
+        if memory:
+            remembered = memory.match(segment.name, segment.qty, segment.unit)
+            if remembered is not None:
+                return FoodLogExtractionItem(**remembered), MEMORY_CONFIDENCE
+        if self.segment_cache is not None:
+            return self.segment_cache.lookup(segment)
+        return None
+
+    def _remember_segments(self, segments: list, parsed: FoodLogExtraction) -> None:
+        """Cache LLM items per segment when they map one-to-one onto the segments."""
+        if self.segment_cache is None or parsed.needs_clarification or len(parsed.items) != len(segments):
+            return
+        for segment, item in zip(segments, parsed.items):
+            self.segment_cache.store(segment, item, parsed.confidence)
+
+    async def _parse_with_llm(
+        self,
+        text: str,
+        current_datetime: str,
+        timezone: str,
+        cache: str = "miss",
+    ) -> FoodLogExtraction:
+        """Parse a food log with one LLM call (plus a targeted re-ask if fields are invalid).
+
+        ``cache`` is recorded with the call's token usage: ``partial`` when
+        ``text`` holds only the segments the caches could not answer.
+        """
+        async with llm_slot():
+            result = await self.text_backend.chat(
+                self._build_messages(text, current_datetime, timezone),
+                temperature=0.1,
+                max_tokens=512 if self.compact else 1024,
+                response_schema=self.response_schema,
+            )
+        record_completion(result, "parse", cache)
+
+        data = expand_compact(repair_json(result.content))
+        invalid = invalid_item_fields(data)
+        if invalid:
+            await self._reask_invalid_fields(text, data, invalid)
+        return self._build_extraction(data, current_datetime)
+
+    def _build_messages(self, text: str, current_datetime: str, timezone: str) -> list:
+        """Chat messages for a text parse in the configured prompt style."""
+        if self.compact:
+            return [
+                {"role": "system", "content": COMPACT_SYSTEM_PROMPT_LOCAL if self.local_nutrients else COMPACT_SYSTEM_PROMPT},
+                {"role": "user", "content": f"Local time: {current_datetime} ({timezone})\nLog: {text}"},
+            ]
 
         user_message = f"""Current datetime: {current_datetime}
 Timezone: {timezone}
@@ -137,19 +691,30 @@ Timezone: {timezone}
 User food log: {text}
 
 Parse this food log and return the JSON with nutrition information."""
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_message}
+        ]
 
-        response = self.groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_message}
-            ],
-            temperature=0.1,
-            max_tokens=1024,
-        )
-
-        return self._parse_response(response.choices[0].message.content, current_datetime)
+    async def _reask_invalid_fields(self, text: str, data: dict, invalid: dict) -> None:
+        """Ask the model again for only the item fields it got wrong, then merge them into ``data``."""
+        print(f"[Agent] Re-asking {sum(len(f) for f in invalid.values())} invalid field(s) in {len(invalid)} item(s)")
+        fixes = {}
+        try:
+            async with llm_slot():
+                result = await self.text_backend.chat(
+                    build_reask_messages(text, data, invalid),
+                    temperature=0,
+                    max_tokens=256,
+                    response_schema=REASK_JSON_SCHEMA if self.response_schema is not None else None,
+                )
+            record_completion(result, "reask")
+            fixes = repair_json(result.content)
+        except Exception as e:
+            print(f"[Agent] Re-ask failed, dropping invalid fields: {type(e).__name__}: {str(e)}")
+        merge_reask(data, invalid, fixes)
 
+    @_charged("image")
     async def analyze_image(
         self,
         image_base64: str,
@@ -158,11 +723,11 @@ Parse this food log and return the JSON with nutrition information."""
         timezone: str = "UTC",
         user_id: str = "default",
     ) -> FoodLogExtraction:
-        """Analyze food image using Groq's vision model for nutrition."""
+        """Analyze food image using the vision backend for nutrition."""
         if not current_datetime:
             current_datetime = datetime.now().isoformat()
 
-        # Use Groq's vision model to analyze the image directly
+        # Use the vision model to analyze the image directly
         image_url = f"data:image/jpeg;base64,{image_base64}"
 
         vision_prompt = f"""Look at this food image and identify all food items visible.
@@ -178,27 +743,30 @@ Additional context: {context if context else 'None'}
 List all visible food items."""
 
         try:
-            # Use Groq's vision-capable model (Llama 4 Scout)
-            response = self.groq_client.chat.completions.create(
-                model="meta-llama/llama-4-scout-17b-16e-instruct",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": vision_prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {"url": image_url},
-                            },
-                        ],
-                    }
-                ],
-                temperature=0.1,
-                max_tokens=512,
-            )
+            async with llm_slot():
+                result = await self.vision_backend.chat(
+                    [
+                        {
+                            "role": "user",
+                            "content": [
+                                {"type": "text", "text": vision_prompt},
+                                {
+                                    "type": "image_url",
+                                    "image_url": {"url": image_url},
+                                },
+                            ],
+                        }
+                    ],
+                    vision=True,
+                    temperature=0.1,
+                    max_tokens=512,
+                )
+            record_completion(result, "vision")
 
-            food_description = response.choices[0].message.content
+            food_description = result.content
             print(f"[Vision] Successfully analyzed image: {food_description[:100]}...")
+        except (LLMUnavailableError, AdmissionRejected):
+            raise
         except Exception as e:
             # Log the error and raise it so the user knows something failed
             print(f"[Vision] Error analyzing image: {type(e).__name__}: {str(e)}")
@@ -219,49 +787,99 @@ List all visible food items."""
             return "Snack"
 
     def _parse_response(self, response_text: str, current_datetime: str) -> FoodLogExtraction:
-        """Parse JSON response from Groq."""
-        text = response_text.strip()
-        if text.startswith("```json"):
-            text = text[7:]
-        if text.startswith("```"):
-            text = text[3:]
-        if text.endswith("```"):
-            text = text[:-3]
-        text = text.strip()
-
-        start = text.find("{")
-        end = text.rfind("}") + 1
-        if start == -1 or end == 0:
-            raise ValueError(f"No JSON found in response: {text[:200]}")
-
-        json_str = text[start:end]
-        data = json.loads(json_str)
+        """Parse (and if needed repair) a JSON response from the LLM without re-asking."""
+        data = expand_compact(repair_json(response_text))
+        invalid = invalid_item_fields(data)
+        if invalid:
+            merge_reask(data, invalid, {})
+        return self._build_extraction(data, current_datetime)
+
+    def _build_extraction(self, data: dict, current_datetime: str) -> FoodLogExtraction:
+        """Build a FoodLogExtraction from validated JSON, defaulting anything malformed."""
+        if not isinstance(data, dict):
+            raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
 
         items = []
         for item in data.get("items", []):
+            name = item.get("item_name") or "Unknown"
             items.append(FoodLogExtractionItem(
-                item_name=item.get("item_name", "Unknown"),
+                item_name=name,
                 qty=item.get("qty"),
-                unit=item.get("unit"),
-                brand=item.get("brand"),
-                search_query=item.get("search_query", item.get("item_name", "")),
-                notes=item.get("notes"),
+                unit=_optional_str(item.get("unit")),
+                brand=_optional_str(item.get("brand")),
+                search_query=_optional_str(item.get("search_query")) or name,
+                notes=_optional_str(item.get("notes")),
                 calories=item.get("calories"),
                 protein_g=item.get("protein_g"),
                 carbs_g=item.get("carbs_g"),
                 fat_g=item.get("fat_g"),
+                grams=item.get("grams"),
             ))
 
+        meal = data.get("meal")
+        if meal not in MEAL_LABELS:
+            meal = self._infer_meal_from_time(_hour_of(current_datetime))
+        confidence = coerce_number(data.get("confidence"))
+        datetime_local = data.get("datetime_local")
+
         return FoodLogExtraction(
-            meal=data.get("meal", self._infer_meal_from_time(datetime.now().hour)),
-            datetime_local=data.get("datetime_local", current_datetime),
+            meal=meal,
+            datetime_local=datetime_local if isinstance(datetime_local, str) and datetime_local else current_datetime,
             items=items,
-            needs_clarification=data.get("needs_clarification", False),
-            clarification_question=data.get("clarification_question"),
-            confidence=data.get("confidence", 0.8),
+            needs_clarification=data.get("needs_clarification") is True,
+            clarification_question=_optional_str(data.get("clarification_question")),
+            confidence=min(1.0, max(0.0, confidence)) if confidence is not None else 0.8,
         )
 
 
+def _fill_from_database(item: FoodLogExtractionItem, db: NutritionDatabase) -> bool:
+    """Set an item's nutrients from the nutrition database; False if no food matched."""
+    resolved = db.resolve(item.search_query or item.item_name, item.qty, item.unit, item.grams, item.brand)
+    if resolved is None and item.search_query and item.search_query != item.item_name:
+        resolved = db.resolve(item.item_name, item.qty, item.unit, item.grams, item.brand)
+    if resolved is None:
+        return False
+    item.calories = resolved.calories
+    item.protein_g = resolved.protein_g
+    item.carbs_g = resolved.carbs_g
+    item.fat_g = resolved.fat_g
+    item.grams = resolved.grams
+    return True
+
+
+def _draft_key(user_id: str, text: str) -> str:
+    """Draft cache key: the user and the log with case, spacing and trailing punctuation normalized."""
+    return f"{user_id}|{' '.join(text.lower().split()).rstrip(' .!,;')}"
+
+
+def _extraction_item(item: FoodItem) -> dict:
+    """A response item as FoodLogExtractionItem fields."""
+    nutrients = item.nutrients_total
+    return {
+        "item_name": item.name,
+        "qty": item.quantity,
+        "unit": item.unit,
+        "search_query": item.name,
+        "calories": nutrients.calories,
+        "protein_g": nutrients.protein_g,
+        "carbs_g": nutrients.carbs_g,
+        "fat_g": nutrients.fat_g,
+    }
+
+
+def _optional_str(value) -> Optional[str]:
+    if value is None:
+        return None
+    return value if isinstance(value, str) else str(value)
+
+
+def _hour_of(iso_datetime: str) -> int:
+    try:
+        return datetime.fromisoformat(iso_datetime).hour
+    except (TypeError, ValueError):
+        return datetime.now().hour
+
+
 # ============ Singleton Instance ============
 
 _agent_service: Optional[FoodAgentService] = None
@@ -275,6 +893,14 @@ def get_food_agent_service() -> FoodAgentService:
     return _agent_service
 
 
+async def close_food_agent_service():
+    """Close the food agent service's LLM clients."""
+    global _agent_service
+    if _agent_service is not None:
+        await _agent_service.aclose()
+        _agent_service = None
+
+
 # ============ Legacy Compatibility ============
 
 class FoodRecognitionAgent:
@@ -283,11 +909,17 @@ class FoodRecognitionAgent:
     def __init__(self):
         self._service = get_food_agent_service()
 
-    async def parse_text(self, text: str, current_datetime: Optional[str] = None, timezone: str = "UTC"):
-        return await self._service.parse_text(text, current_datetime, timezone)
+    async def parse_text(self, text: str, current_datetime: Optional[str] = None, timezone: str = "UTC", user_id: str = "default"):
+        return await self._service.parse_text(text, current_datetime, timezone, user_id)
+
+    async def draft_parse(self, text: str, current_datetime: Optional[str] = None, timezone: str = "UTC", user_id: str = "default"):
+        return await self._service.draft_parse(text, current_datetime, timezone, user_id)
+
+    async def reparse_text(self, text: str, previous_text: str, previous: ParseFoodLogResponse, current_datetime: Optional[str] = None, timezone: str = "UTC", user_id: str = "default"):
+        return await self._service.reparse_text(text, previous_text, previous, current_datetime, timezone, user_id)
 
-    async def analyze_image(self, image_base64: str, context: str = "", current_datetime: Optional[str] = None, timezone: str = "UTC"):
-        return await self._service.analyze_image(image_base64, context, current_datetime, timezone)
+    async def analyze_image(self, image_base64: str, context: str = "", current_datetime: Optional[str] = None, timezone: str = "UTC", user_id: str = "default"):
+        return await self._service.analyze_image(image_base64, context, current_datetime, timezone, user_id)
 
 
 def get_food_agent() -> FoodRecognitionAgent:
@@ -297,52 +929,105 @@ def get_food_agent() -> FoodRecognitionAgent:
 
 # ============ Nutrition Lookup Helper ============
 
-def lookup_nutrition(item_name: str, qty: Optional[float], unit: Optional[str]) -> NutrientTotals:
-    """Look up nutrition for a food item."""
-    result = get_nutrition_info(item_name, qty or 1.0)
+def _lookup_known_nutrition(
+    item_name: str,
+    qty: Optional[float],
+    unit: Optional[str],
+    memory: Optional[FoodMemory],
+    grams: Optional[float],
+) -> Optional[NutrientTotals]:
+    """Nutrition from the user's own confirmed values, then the nutrition database, or None."""
+    if memory:
+        remembered = memory.match(item_name, qty, unit)
+        if remembered is not None:
+            return NutrientTotals(**{f: remembered[f] or 0 for f in NUTRIENT_COLUMNS})
 
-    return NutrientTotals(
-        calories=result["calories"],
-        protein_g=result["protein_g"],
-        carbs_g=result["carbs_g"],
-        fat_g=result["fat_g"],
-    )
+    db = get_nutrition_db()
+    if db is not None:
+        resolved = db.resolve(item_name, qty, unit, grams)
+        if resolved is not None:
+            return NutrientTotals(
+                calories=resolved.calories,
+                protein_g=resolved.protein_g,
+                carbs_g=resolved.carbs_g,
+                fat_g=resolved.fat_g,
+            )
+    return None
 
 
-def extraction_to_response(extraction: FoodLogExtraction) -> ParseFoodLogResponse:
-    """Convert FoodLogExtraction to ParseFoodLogResponse with nutrition data."""
-    items = []
-    total_calories = 0
-    total_protein = 0
-    total_carbs = 0
-    total_fat = 0
+def _basic_nutrition(items: list) -> list:
+    """Basic estimates for ``(name, qty, unit, grams)`` items, computed as one array operation (or scalars for one item)."""
+    if len(items) == 1:
+        name, qty, unit, grams = items[0]
+        _, totals = BASIC_FOODS.nutrients_one(name, grams if grams else qty, "g" if grams else unit)
+        return [NutrientTotals(**dict(zip(NUTRIENT_COLUMNS, totals)))]
+    names = [name for name, _, _, _ in items]
+    # A gram estimate from the model beats the table's typical portion weight.
+    qtys = [grams if grams else qty for _, qty, _, grams in items]
+    units = ["g" if grams else unit for _, _, unit, grams in items]
+    totals = BASIC_FOODS.nutrients(names, qtys, units).tolist()
+    return [NutrientTotals(**dict(zip(NUTRIENT_COLUMNS, row))) for row in totals]
+
+
+def lookup_nutrition(
+    item_name: str,
+    qty: Optional[float],
+    unit: Optional[str],
+    memory: Optional[FoodMemory] = None,
+    grams: Optional[float] = None,
+) -> NutrientTotals:
+    """Look up nutrition for a food item: the user's own confirmed values, the nutrition database, then basic estimates."""
+    known = _lookup_known_nutrition(item_name, qty, unit, memory, grams)
+    if known is not None:
+        return known
+    return _basic_nutrition([(item_name, qty, unit, grams)])[0]
+
 
-    for ext_item in extraction.items:
+async def build_parse_response(extraction: FoodLogExtraction, memory: Optional[FoodMemory] = None) -> ParseFoodLogResponse:
+    """``extraction_to_response`` for async callers: nutrition database lookups run in a thread."""
+    if get_nutrition_db() is not None and any(item.calories is None for item in extraction.items):
+        return await asyncio.to_thread(extraction_to_response, extraction, memory)
+    return extraction_to_response(extraction, memory)
+
+
+def extraction_to_response(extraction: FoodLogExtraction, memory: Optional[FoodMemory] = None) -> ParseFoodLogResponse:
+    """Convert FoodLogExtraction to ParseFoodLogResponse with nutrition data."""
+    nutrients = []
+    unresolved = []
+    for index, ext_item in enumerate(extraction.items):
         # Use AI-provided nutrition if available, otherwise fall back to lookup
         if ext_item.calories is not None:
-            nutrients = NutrientTotals(
+            nutrients.append(NutrientTotals(
                 calories=ext_item.calories,
                 protein_g=ext_item.protein_g or 0,
                 carbs_g=ext_item.carbs_g or 0,
                 fat_g=ext_item.fat_g or 0,
-            )
-        else:
-            nutrients = lookup_nutrition(ext_item.item_name, ext_item.qty, ext_item.unit)
+            ))
+            continue
+        nutrients.append(_lookup_known_nutrition(ext_item.item_name, ext_item.qty, ext_item.unit, memory, ext_item.grams))
+        if nutrients[-1] is None:
+            unresolved.append(index)
 
-        item = FoodItem(
+    if unresolved:
+        # Everything no better source knows is estimated in one batch.
+        estimates = _basic_nutrition([
+            (item.item_name, item.qty, item.unit, item.grams)
+            for item in (extraction.items[i] for i in unresolved)
+        ])
+        for index, estimate in zip(unresolved, estimates):
+            nutrients[index] = estimate
+
+    items = [
+        FoodItem(
             name=ext_item.item_name,
             quantity=ext_item.qty or 1,
             unit=ext_item.unit or "serving",
-            nutrients_total=nutrients,
+            nutrients_total=item_nutrients,
             source="text",
             confidence=extraction.confidence,
         )
-        items.append(item)
-
-        total_calories += nutrients.calories
-        total_protein += nutrients.protein_g
-        total_carbs += nutrients.carbs_g
-        total_fat += nutrients.fat_g
+        for ext_item, item_nutrients in zip(extraction.items, nutrients)
+    ]
 
     return ParseFoodLogResponse(
         items=items,
@@ -0,0 +1,46 @@
+"""Handlers that run queued parse jobs (see services/jobs.py)."""
+
+from services.admission import BULK, AdmissionRejected, request_priority
+from services.jobs import RetryJob
+from .food_agent import build_parse_response, get_food_agent_service
+from .llm import LLMUnavailableError
+
+
+async def run_parse_job(payload: dict, user_id: str) -> dict:
+    """Parse a text food log; same result as POST /api/parse-food-log."""
+    request_priority.set(BULK)
+    try:
+        extraction = await get_food_agent_service().parse_text(
+            payload["text"],
+            payload.get("current_datetime"),
+            payload.get("timezone") or "UTC",
+            user_id,
+        )
+    except (LLMUnavailableError, AdmissionRejected) as e:
+        raise RetryJob(str(e), delay_s=max(1.0, e.retry_after_s))
+    return (await build_parse_response(extraction)).model_dump()
+
+
+async def run_image_job(payload: dict, user_id: str) -> dict:
+    """Analyze a food image; same result as POST /api/analyze-food-image."""
+    request_priority.set(BULK)
+    try:
+        extraction = await get_food_agent_service().analyze_image(
+            payload["image_base64"],
+            payload.get("context") or "",
+            payload.get("current_datetime"),
+            payload.get("timezone") or "UTC",
+            user_id,
+        )
+    except (LLMUnavailableError, AdmissionRejected) as e:
+        raise RetryJob(str(e), delay_s=max(1.0, e.retry_after_s))
+    response = await build_parse_response(extraction)
+    for item in response.items:
+        item.source = "image"
+    return response.model_dump()
+
+
+JOB_HANDLERS = {
+    "parse": run_parse_job,
+    "image": run_image_job,
+}
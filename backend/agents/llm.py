@@ -0,0 +1,406 @@
+"""Pluggable LLM backends for the food agent.
+
+Every provider exposes the same async ``chat()`` call taking OpenAI-style
+messages and returning a ``ChatResult``. Local providers (Ollama, any
+OpenAI-compatible server such as vLLM or llama.cpp) are wrapped in a
+``BatchingScheduler`` that feeds the model server's parallel slots and keeps
+the model resident.
+
+Provider clients (and the ``groq`` SDK) are created on the first call, so
+importing the app or building the agent opens no connections, and each
+worker process gets its own client after any fork.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+import httpx
+
+from services.config import Settings, get_settings
+
+
+class LLMUnavailableError(RuntimeError):
+    """No LLM provider could serve the request (all failed, open or rate-limited)."""
+
+    def __init__(self, message: str, retry_after_s: float = 5.0):
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
+
+@dataclass
+class ChatResult:
+    """A single chat completion."""
+    content: str
+    model: str
+    provider: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency_ms: float = 0.0
+
+
+class LLMBackend:
+    """Base class for chat-completion providers."""
+
+    name = "base"
+
+    def __init__(self, text_model: str, vision_model: Optional[str] = None, json_mode: str = "schema"):
+        self.text_model = text_model
+        self.vision_model = vision_model or text_model
+        self.json_mode = json_mode
+        self._client = None
+
+    @property
+    def client(self):
+        """The provider client, created on first use and shared by all calls."""
+        if self._client is None:
+            self._client = self._create_client()
+        return self._client
+
+    def _create_client(self):
+        raise NotImplementedError
+
+    async def chat(
+        self,
+        messages: List[dict],
+        *,
+        model: Optional[str] = None,
+        vision: bool = False,
+        temperature: float = 0.1,
+        max_tokens: int = 1024,
+        response_schema: Optional[dict] = None,
+    ) -> ChatResult:
+        """Run one chat completion (on the vision model when ``vision`` is set).
+
+        ``response_schema`` asks for JSON output, constrained to the schema
+        where the provider supports it (see ``llm_json_mode``).
+        """
+        raise NotImplementedError
+
+    def _model(self, model: Optional[str], vision: bool) -> str:
+        return model or (self.vision_model if vision else self.text_model)
+
+    async def warm(self) -> None:
+        """Load the model ahead of traffic (no-op for hosted providers)."""
+
+    async def aclose(self) -> None:
+        """Release network resources."""
+
+
+# ============ Hosted Providers ============
+
+class GroqBackend(LLMBackend):
+    """Groq hosted models via the async client."""
+
+    name = "groq"
+
+    def __init__(self, settings: Settings):
+        super().__init__(settings.groq_text_model, settings.groq_vision_model, settings.llm_json_mode)
+        self.settings = settings
+
+    def _create_client(self):
+        from groq import AsyncGroq
+
+        return AsyncGroq(
+            api_key=self.settings.groq_api_key,
+            base_url=self.settings.groq_base_url,
+            timeout=self.settings.llm_request_timeout_s,
+        )
+
+    async def chat(self, messages, *, model=None, vision=False, temperature=0.1, max_tokens=1024,
+                   response_schema=None) -> ChatResult:
+        from groq import BadRequestError
+
+        model = self._model(model, vision)
+        extra = {}
+        if response_schema is not None and self.json_mode != "off":
+            # Groq's Llama models support JSON mode but not strict schemas.
+            extra["response_format"] = {"type": "json_object"}
+        start = time.perf_counter()
+        try:
+            response = await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **extra,
+            )
+        except BadRequestError as e:
+            # In JSON mode Groq rejects output that isn't valid JSON but returns it as
+            # failed_generation; hand it to the repairer instead of paying for a retry.
+            failed = _failed_generation(e)
+            if failed is None:
+                raise
+            return ChatResult(
+                content=failed,
+                model=model,
+                provider=self.name,
+                latency_ms=(time.perf_counter() - start) * 1000,
+            )
+        usage = response.usage
+        return ChatResult(
+            content=response.choices[0].message.content or "",
+            model=model,
+            provider=self.name,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0,
+            latency_ms=(time.perf_counter() - start) * 1000,
+        )
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+def _failed_generation(error) -> Optional[str]:
+    body = error.body if isinstance(error.body, dict) else {}
+    details = body.get("error", body)
+    if isinstance(details, dict) and details.get("code") == "json_validate_failed":
+        return details.get("failed_generation")
+    return None
+
+
+# ============ Local Providers ============
+
+class OpenAICompatibleBackend(LLMBackend):
+    """Any server speaking ``/v1/chat/completions`` (vLLM, llama.cpp, LM Studio)."""
+
+    name = "openai"
+
+    def __init__(self, settings: Settings):
+        super().__init__(settings.openai_model, settings.openai_vision_model or None, settings.llm_json_mode)
+        self.settings = settings
+
+    def _create_client(self) -> httpx.AsyncClient:
+        settings = self.settings
+        headers = {"Authorization": f"Bearer {settings.openai_api_key}"} if settings.openai_api_key else {}
+        return httpx.AsyncClient(
+            base_url=settings.openai_base_url.rstrip("/"),
+            headers=headers,
+            timeout=settings.llm_request_timeout_s,
+        )
+
+    async def chat(self, messages, *, model=None, vision=False, temperature=0.1, max_tokens=1024,
+                   response_schema=None) -> ChatResult:
+        model = self._model(model, vision)
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        if response_schema is not None and self.json_mode == "schema":
+            # vLLM / llama.cpp compile this into grammar-constrained decoding.
+            payload["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "response", "schema": response_schema},
+            }
+        elif response_schema is not None and self.json_mode == "json":
+            payload["response_format"] = {"type": "json_object"}
+        start = time.perf_counter()
+        response = await self.client.post("/chat/completions", json=payload)
+        response.raise_for_status()
+        data = response.json()
+        usage = data.get("usage") or {}
+        return ChatResult(
+            content=data["choices"][0]["message"].get("content") or "",
+            model=model,
+            provider=self.name,
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+            latency_ms=(time.perf_counter() - start) * 1000,
+        )
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class OllamaBackend(LLMBackend):
+    """Ollama's native ``/api/chat`` API with keep-alive control."""
+
+    name = "ollama"
+
+    def __init__(self, settings: Settings):
+        super().__init__(settings.ollama_model, settings.ollama_vision_model or None, settings.llm_json_mode)
+        self.keep_alive = settings.ollama_keep_alive
+        self.num_ctx = settings.ollama_num_ctx
+        self.settings = settings
+
+    def _create_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=self.settings.ollama_host.rstrip("/"),
+            timeout=self.settings.llm_request_timeout_s,
+        )
+
+    @staticmethod
+    def _to_native(messages: List[dict]) -> List[dict]:
+        """Convert OpenAI-style multimodal content into Ollama's text + images form."""
+        native = []
+        for message in messages:
+            content = message.get("content")
+            if not isinstance(content, list):
+                native.append(message)
+                continue
+            texts, images = [], []
+            for part in content:
+                if part.get("type") == "text":
+                    texts.append(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    url = part.get("image_url", {}).get("url", "")
+                    images.append(url.split(",", 1)[1] if url.startswith("data:") else url)
+            native.append({"role": message.get("role", "user"), "content": "\n".join(texts), "images": images})
+        return native
+
+    async def chat(self, messages, *, model=None, vision=False, temperature=0.1, max_tokens=1024,
+                   response_schema=None) -> ChatResult:
+        model = self._model(model, vision)
+        payload = {
+            "model": model,
+            "messages": self._to_native(messages),
+            "stream": False,
+            "keep_alive": self.keep_alive,
+            "options": {
+                "temperature": temperature,
+                "num_predict": max_tokens,
+                "num_ctx": self.num_ctx,
+            },
+        }
+        if response_schema is not None and self.json_mode != "off":
+            # Ollama compiles a schema into a decoding grammar; "json" only forces valid JSON.
+            payload["format"] = response_schema if self.json_mode == "schema" else "json"
+        start = time.perf_counter()
+        response = await self.client.post("/api/chat", json=payload)
+        response.raise_for_status()
+        data = response.json()
+        return ChatResult(
+            content=data.get("message", {}).get("content") or "",
+            model=model,
+            provider=self.name,
+            prompt_tokens=data.get("prompt_eval_count", 0),
+            completion_tokens=data.get("eval_count", 0),
+            latency_ms=(time.perf_counter() - start) * 1000,
+        )
+
+    async def warm(self) -> None:
+        """An empty generate call loads the model and resets its keep-alive timer."""
+        response = await self.client.post("/api/generate", json={
+            "model": self.text_model,
+            "keep_alive": self.keep_alive,
+        })
+        response.raise_for_status()
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# ============ Request Scheduler ============
+
+class BatchingScheduler(LLMBackend):
+    """Feeds a local model server's parallel slots.
+
+    The server batches the requests it has in flight (Ollama's parallel
+    slots, vLLM's continuous batching); this keeps at most
+    ``max_concurrency`` of them there (match ``OLLAMA_NUM_PARALLEL`` or the
+    vLLM slot count) and queues the rest in this process, first come first
+    served, instead of letting them pile up inside the model server. When
+    idle for ``keep_alive_interval_s`` the model is re-warmed so the next
+    request does not pay a cold load.
+    """
+
+    def __init__(
+        self,
+        backend: LLMBackend,
+        max_concurrency: int = 4,
+        keep_alive_interval_s: float = 240.0,
+    ):
+        super().__init__(backend.text_model, backend.vision_model)
+        self.backend = backend
+        self.name = backend.name
+        self.max_concurrency = max(1, max_concurrency)
+        self.keep_alive_interval_s = keep_alive_interval_s
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._keep_alive: Optional[asyncio.Task] = None
+        self._closed = False
+        self._last_activity = time.monotonic()
+
+    def _ensure_started(self) -> None:
+        if self._closed:
+            raise LLMUnavailableError(f"{self.name} backend is closed")
+        if self._slots is not None:
+            return
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        if self.keep_alive_interval_s > 0:
+            self._keep_alive = asyncio.create_task(self._keep_alive_loop())
+
+    async def chat(self, messages, *, model=None, vision=False, temperature=0.1, max_tokens=1024,
+                   response_schema=None) -> ChatResult:
+        self._ensure_started()
+        async with self._slots:
+            if self._closed:
+                # Closed while this request was queued.
+                raise LLMUnavailableError(f"{self.name} backend is closed")
+            try:
+                return await self.backend.chat(
+                    messages,
+                    model=model,
+                    vision=vision,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    response_schema=response_schema,
+                )
+            except Exception as e:
+                if self._closed:
+                    raise LLMUnavailableError(f"{self.name} backend was closed during the request") from e
+                raise
+            finally:
+                self._last_activity = time.monotonic()
+
+    async def _keep_alive_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.keep_alive_interval_s)
+            if time.monotonic() - self._last_activity < self.keep_alive_interval_s:
+                continue
+            try:
+                await self.backend.warm()
+                self._last_activity = time.monotonic()
+            except Exception as e:
+                print(f"[LLM] keep-alive for {self.backend.name} failed: {type(e).__name__}: {e}")
+
+    async def warm(self) -> None:
+        await self.backend.warm()
+
+    async def aclose(self) -> None:
+        """Close the backend; requests still queued here fail with ``LLMUnavailableError``."""
+        self._closed = True
+        if self._keep_alive is not None:
+            self._keep_alive.cancel()
+            await asyncio.gather(self._keep_alive, return_exceptions=True)
+            self._keep_alive = None
+        await self.backend.aclose()
+
+
+# ============ Factory ============
+
+def create_backend(provider: str, settings: Optional[Settings] = None) -> LLMBackend:
+    """Create an LLM backend by provider name (groq, ollama, openai)."""
+    settings = settings or get_settings()
+    provider = provider.lower()
+    if provider == "groq":
+        return GroqBackend(settings)
+    if provider == "ollama":
+        backend = OllamaBackend(settings)
+    elif provider == "openai":
+        backend = OpenAICompatibleBackend(settings)
+    else:
+        raise ValueError(f"Unknown LLM provider: {provider}")
+    return BatchingScheduler(
+        backend,
+        max_concurrency=settings.llm_max_concurrency,
+        keep_alive_interval_s=settings.llm_keep_alive_interval_s,
+    )
@@ -0,0 +1,275 @@
+"""Failover, rate limiting and hedging across several LLM providers.
+
+``LLMRouter`` is itself an ``LLMBackend``: it tries an ordered list of routes
+(provider + optional model, e.g. the 70B Groq model, then a small fast Groq
+model, then a local Ollama model). Each route has its own circuit breaker,
+token bucket sized to the provider quota, timeout and latency tracker. With
+hedging enabled a backup request is fired at the next route once the primary
+has been outstanding longer than its observed p95, and the first answer wins.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from services.config import Settings, get_settings
+from services.rate_limit import TokenBucket
+from .llm import ChatResult, LLMBackend, LLMUnavailableError, create_backend
+
+
+# ============ Circuit Breaker ============
+
+class CircuitBreaker:
+    """Opens after consecutive failures; lets one probe through after ``reset_timeout_s``."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout_s: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def available(self) -> bool:
+        """Whether ``allow()`` would currently let a request through (no side effects)."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return time.monotonic() - self._opened_at >= self.reset_timeout_s
+        return not self._probe_in_flight
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now; claims the probe slot when half-open."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout_s:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker will allow a probe."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout_s - (time.monotonic() - self._opened_at))
+
+    def release_probe(self) -> None:
+        """Give back a half-open probe that was cancelled before completing."""
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies."""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if len(self._samples) < 20:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+
+# ============ Routes ============
+
+class Route:
+    """One provider/model target with its own breaker, bucket and latency stats."""
+
+    def __init__(
+        self,
+        backend: LLMBackend,
+        model: Optional[str] = None,
+        timeout_s: float = 20.0,
+        breaker: Optional[CircuitBreaker] = None,
+        bucket: Optional[TokenBucket] = None,
+    ):
+        self.backend = backend
+        self.model = model
+        self.timeout_s = timeout_s
+        self.breaker = breaker or CircuitBreaker()
+        self.bucket = bucket
+        self.latency = LatencyTracker()
+
+    @property
+    def label(self) -> str:
+        return f"{self.backend.name}:{self.model or self.backend.text_model}"
+
+
+class LLMRouter(LLMBackend):
+    """Routes chat calls across ordered ``Route``s with failover and optional hedging."""
+
+    name = "router"
+
+    def __init__(self, routes: List[Route], hedge: bool = False, hedge_min_delay_s: float = 0.3):
+        if not routes:
+            raise ValueError("LLMRouter needs at least one route")
+        super().__init__(routes[0].backend.text_model, routes[0].backend.vision_model)
+        self.routes = routes
+        self.hedge = hedge
+        self.hedge_min_delay_s = hedge_min_delay_s
+
+    async def chat(self, messages, *, model=None, vision=False, temperature=0.1, max_tokens=1024,
+                   response_schema=None) -> ChatResult:
+        kwargs = {
+            "vision": vision,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "response_schema": response_schema,
+        }
+        candidates = [r for r in self.routes if r.breaker.available()]
+        if not candidates:
+            retry_after = min(r.breaker.retry_after() for r in self.routes)
+            raise LLMUnavailableError("All LLM providers are unavailable", retry_after_s=max(1.0, retry_after))
+
+        errors = []
+        i = 0
+        while i < len(candidates):
+            primary = candidates[i]
+            is_last = i == len(candidates) - 1
+            backup = candidates[i + 1] if self.hedge and not is_last else None
+            try:
+                if backup is not None:
+                    return await self._hedged(primary, backup, messages, kwargs, is_last=i + 1 == len(candidates) - 1)
+                return await self._attempt(primary, messages, kwargs, is_last)
+            except Exception as e:
+                errors.append(e)
+            i += 2 if backup is not None else 1
+
+        summary = "; ".join(f"{type(e).__name__}: {e}" for e in errors)
+        raise LLMUnavailableError(f"All LLM providers failed ({summary})")
+
+    async def _attempt(self, route: Route, messages, kwargs, is_last: bool) -> ChatResult:
+        """Call one route, honouring its rate limit, timeout and breaker."""
+        if not route.breaker.allow():
+            raise LLMUnavailableError(f"{route.label} circuit open", retry_after_s=route.breaker.retry_after())
+        if route.bucket is not None:
+            # Spill over to the next route instead of queueing on an exhausted quota,
+            # unless this is the last option left.
+            wait = route.timeout_s if is_last else 0.0
+            if not await route.bucket.acquire(timeout=wait):
+                route.breaker.release_probe()
+                raise LLMUnavailableError(f"{route.label} rate limited", retry_after_s=route.bucket.wait_time())
+        model = None if kwargs.get("vision") else route.model
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(
+                route.backend.chat(messages, model=model, **kwargs),
+                timeout=route.timeout_s,
+            )
+        except asyncio.CancelledError:
+            route.breaker.release_probe()
+            raise
+        except Exception as e:
+            route.breaker.record_failure()
+            print(f"[LLM] {route.label} failed: {type(e).__name__}: {e}")
+            raise
+        route.breaker.record_success()
+        route.latency.record(time.monotonic() - start)
+        return result
+
+    async def _hedged(self, primary: Route, backup: Route, messages, kwargs, is_last: bool) -> ChatResult:
+        """Start ``primary``; if it hasn't answered by its p95, race ``backup`` against it."""
+        delay = max(self.hedge_min_delay_s, primary.latency.percentile(95) or 0.0)
+        first = asyncio.create_task(self._attempt(primary, messages, kwargs, is_last=False))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if first in done and first.exception() is None:
+            return first.result()
+
+        pending = {asyncio.create_task(self._attempt(backup, messages, kwargs, is_last=is_last))}
+        if first not in done:
+            pending.add(first)
+        errors = [first.exception()] if first in done else []
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(task.exception())
+        finally:
+            for task in pending:
+                task.cancel()
+        raise errors[-1]
+
+    async def warm(self) -> None:
+        for backend in self._backends():
+            await backend.warm()
+
+    async def aclose(self) -> None:
+        for backend in self._backends():
+            await backend.aclose()
+
+    def _backends(self) -> List[LLMBackend]:
+        unique: Dict[int, LLMBackend] = {}
+        for route in self.routes:
+            unique.setdefault(id(route.backend), route.backend)
+        return list(unique.values())
+
+
+# ============ Factory ============
+
+def _bucket_for(provider: str, settings: Settings) -> Optional[TokenBucket]:
+    """Token bucket matching the provider's request quota (None = unlimited)."""
+    rpm = settings.groq_requests_per_minute if provider == "groq" else 0
+    if rpm <= 0:
+        return None
+    return TokenBucket(rate_per_s=rpm / 60.0, capacity=max(1.0, rpm / 6.0))
+
+
+def create_llm_backend(settings: Optional[Settings] = None) -> LLMBackend:
+    """Build the text backend: a router when ``llm_routes`` is set, else a single provider.
+
+    ``llm_routes`` is a comma-separated ordered list of ``provider[:model]``, e.g.
+    ``groq:llama-3.3-70b-versatile,groq:llama-3.1-8b-instant,ollama``.
+    """
+    settings = settings or get_settings()
+    spec = [part.strip() for part in settings.llm_routes.split(",") if part.strip()]
+    if not spec:
+        return create_backend(settings.llm_provider, settings)
+
+    backends: Dict[str, LLMBackend] = {}
+    buckets: Dict[str, Optional[TokenBucket]] = {}
+    routes = []
+    for entry in spec:
+        provider, _, model = entry.partition(":")
+        provider = provider.lower()
+        if provider not in backends:
+            backends[provider] = create_backend(provider, settings)
+            # The quota is per provider account, so routes on one provider share a bucket.
+            buckets[provider] = _bucket_for(provider, settings)
+        routes.append(Route(
+            backend=backends[provider],
+            model=model or None,
+            timeout_s=settings.llm_route_timeout_s,
+            breaker=CircuitBreaker(settings.llm_breaker_failures, settings.llm_breaker_reset_s),
+            bucket=buckets[provider],
+        ))
+    return LLMRouter(
+        routes,
+        hedge=settings.llm_hedge_enabled,
+        hedge_min_delay_s=settings.llm_hedge_min_delay_ms / 1000.0,
+    )
@@ -0,0 +1,233 @@
+"""Food-log segmentation and a quantity-normalized per-segment result cache.
+
+A log such as "2 eggs, toast and coffee" is split into segments, each reduced
+to a quantity, a unit and a normalized food name. Parsed items are cached per
+unit of quantity, so "3 eggs" reuses the result cached for "2 eggs" scaled by
+3/2, and only segments never seen before need the LLM.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from services.shared_cache import create_cache
+from services.food_names import normalize_food_name
+from models.food import FoodLogExtractionItem
+
+NUTRIENT_FIELDS = ("calories", "protein_g", "carbs_g", "fat_g")
+
+_MEAL_PREFIX_RE = re.compile(r"^\s*(?:for\s+)?(breakfast|lunch|dinner|snack)\s*[:\-]\s*", re.IGNORECASE)
+_LEAD_IN_RE = re.compile(
+    r"^\s*(?:(?:today|this morning|tonight)\s*,?\s*)?"
+    r"(?:i\s+(?:just\s+)?(?:had|ate|drank)|had|ate|drank)\s+",
+    re.IGNORECASE,
+)
+_MEAL_SUFFIX_RE = re.compile(r"\s+(?:for|at)\s+(?:breakfast|lunch|dinner|a\s+snack|snack)\s*$", re.IGNORECASE)
+_SPLIT_RE = re.compile(r"\s*(?:,|;|\n|\+|\band\b|\bplus\b)\s*", re.IGNORECASE)
+
+# "X and Y" dishes that must not be split into two segments.
+_COMPOUND_DISHES = (
+    "mac and cheese", "macaroni and cheese", "peanut butter and jelly", "fish and chips",
+    "rice and beans", "bread and butter", "chips and salsa", "ham and cheese", "salt and pepper",
+    "sweet and sour", "biscuits and gravy", "franks and beans", "pork and beans", "cookies and cream",
+)
+_COMPOUND_RE = re.compile("|".join(re.escape(d) for d in _COMPOUND_DISHES), re.IGNORECASE)
+
+_NUMBER_WORDS = {
+    "a": 1.0, "an": 1.0, "one": 1.0, "two": 2.0, "three": 3.0, "four": 4.0, "five": 5.0,
+    "six": 6.0, "seven": 7.0, "eight": 8.0, "nine": 9.0, "ten": 10.0, "half": 0.5,
+    "a half": 0.5, "a couple of": 2.0, "couple of": 2.0, "a few": 3.0, "few": 3.0, "dozen": 12.0,
+}
+_UNITS = {
+    "g": "g", "gram": "g", "grams": "g", "gr": "g",
+    "kg": "kg", "kilogram": "kg", "kilograms": "kg",
+    "ml": "ml", "milliliter": "ml", "milliliters": "ml", "millilitre": "ml", "millilitres": "ml",
+    "l": "l", "liter": "l", "liters": "l", "litre": "l", "litres": "l",
+    "oz": "oz", "ounce": "oz", "ounces": "oz",
+    "lb": "lb", "lbs": "lb", "pound": "lb", "pounds": "lb",
+    "cup": "cup", "cups": "cup",
+    "tbsp": "tbsp", "tablespoon": "tbsp", "tablespoons": "tbsp",
+    "tsp": "tsp", "teaspoon": "tsp", "teaspoons": "tsp",
+    "slice": "slice", "slices": "slice",
+    "piece": "piece", "pieces": "piece",
+    "bowl": "bowl", "bowls": "bowl",
+    "glass": "glass", "glasses": "glass",
+    "can": "can", "cans": "can",
+    "bottle": "bottle", "bottles": "bottle",
+    "serving": "serving", "servings": "serving",
+    "scoop": "scoop", "scoops": "scoop",
+    "handful": "handful", "handfuls": "handful",
+}
+_QTY_RE = re.compile(
+    # Mixed fractions first: "1 1/2" would otherwise match as "1".
+    r"^(?P<qty>\d+\s+\d+\s*/\s*\d+|\d+(?:[.,]\d+)?(?:\s*/\s*\d+)?)\s*(?:x\s+)?",
+    re.IGNORECASE,
+)
+_WORD_QTY_RE = re.compile(
+    r"^(?P<qty>" + "|".join(sorted((re.escape(w) for w in _NUMBER_WORDS), key=len, reverse=True)) + r")\s+",
+    re.IGNORECASE,
+)
+_UNIT_RE = re.compile(
+    r"^(?P<unit>" + "|".join(sorted((re.escape(u) for u in _UNITS), key=len, reverse=True)) + r")\.?(?:\s+of)?\s+",
+    re.IGNORECASE,
+)
+
+_MEAL_MENTION_RE = re.compile(r"\b(breakfast|lunch|dinner|supper|snack)\b", re.IGNORECASE)
+
+
+def meal_mentioned(text: str) -> Optional[str]:
+    """Meal label named explicitly in the log, if any."""
+    match = _MEAL_MENTION_RE.search(text)
+    if not match:
+        return None
+    word = match.group(1).lower()
+    return "Dinner" if word == "supper" else word.capitalize()
+
+
+@dataclass
+class Segment:
+    """One food mention in a log."""
+    text: str
+    qty: Optional[float]
+    unit: Optional[str]
+    name: str
+
+    @property
+    def key(self) -> str:
+        return f"{self.unit or ''}|{self.name}"
+
+    @property
+    def scale(self) -> float:
+        return self.qty if self.qty else 1.0
+
+
+def _parse_qty(raw: str) -> Optional[float]:
+    raw = raw.replace(",", ".").strip()
+    try:
+        if " " in raw and "/" in raw:
+            whole, frac = raw.split(None, 1)
+            num, den = frac.split("/")
+            return float(whole) + float(num) / float(den)
+        if "/" in raw:
+            num, den = raw.split("/")
+            return float(num) / float(den)
+        return float(raw)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def parse_segment(text: str) -> Segment:
+    """Split one segment into quantity, unit and normalized name."""
+    rest = text.strip()
+    qty = None
+    match = _QTY_RE.match(rest)
+    if match:
+        qty = _parse_qty(match.group("qty"))
+        rest = rest[match.end():]
+    else:
+        match = _WORD_QTY_RE.match(rest)
+        if match:
+            qty = _NUMBER_WORDS[match.group("qty").lower()]
+            rest = rest[match.end():]
+
+    unit = None
+    match = _UNIT_RE.match(rest)
+    if match:
+        unit = _UNITS[match.group("unit").lower()]
+        rest = rest[match.end():]
+    return Segment(text=text.strip(), qty=qty, unit=unit, name=normalize_food_name(rest))
+
+
+def split_segments(text: str) -> List[Segment]:
+    """Split a free-text log into food segments."""
+    cleaned = _MEAL_PREFIX_RE.sub("", text.strip())
+    cleaned = _LEAD_IN_RE.sub("", cleaned)
+    cleaned = _MEAL_SUFFIX_RE.sub("", cleaned.rstrip(". !"))
+
+    # Shield compound dishes from the "and" split.
+    compounds = {}
+
+    def _shield(match):
+        token = f"\x00{len(compounds)}\x00"
+        compounds[token] = match.group(0)
+        return token
+
+    shielded = _COMPOUND_RE.sub(_shield, cleaned)
+    segments = []
+    for part in _SPLIT_RE.split(shielded):
+        for token, original in compounds.items():
+            part = part.replace(token, original)
+        part = part.strip()
+        if part:
+            segment = parse_segment(part)
+            if segment.name:
+                segments.append(segment)
+    return segments
+
+
+def scale_item(item: dict, factor: float) -> dict:
+    """Copy of an item dict with its quantity and nutrients multiplied by ``factor``."""
+    item = dict(item)
+    if item.get("qty") is not None:
+        item["qty"] = round(item["qty"] * factor, 3)
+    for field in NUTRIENT_FIELDS:
+        if item.get(field) is not None:
+            item[field] = round(item[field] * factor, 1)
+    return item
+
+
+def match_segments(old: List[Segment], new: List[Segment]) -> List[Optional[int]]:
+    """For each new segment, the index of the unused old segment with the same food and unit, or None.
+
+    Exact matches are paired first, so repeating a food in an edit pairs
+    the unchanged mention with itself and only the other one is rescaled.
+    """
+    matches: List[Optional[int]] = [None] * len(new)
+    used = set()
+    for exact in (True, False):
+        for i, segment in enumerate(new):
+            if matches[i] is not None:
+                continue
+            for j, candidate in enumerate(old):
+                if j in used or candidate.key != segment.key:
+                    continue
+                if exact and candidate.scale != segment.scale:
+                    continue
+                matches[i] = j
+                used.add(j)
+                break
+    return matches
+
+
+class SegmentCache:
+    """Per-segment parse results stored per unit of quantity, shared by the worker processes."""
+
+    def __init__(self, max_entries: int = 5000, ttl_s: float = 7 * 24 * 3600):
+        self._cache = create_cache("segments-v2", max_entries, ttl_s, max_value_bytes=1024)
+
+    def lookup(self, segment: Segment) -> Optional[Tuple[FoodLogExtractionItem, float]]:
+        """Cached item and its confidence for a segment, scaled to the segment's quantity."""
+        entry = self._cache.get(segment.key)
+        if entry is None:
+            return None
+        return FoodLogExtractionItem(**scale_item(entry["item"], segment.scale)), entry["confidence"]
+
+    def store(self, segment: Segment, item: FoodLogExtractionItem, confidence: float) -> None:
+        """Cache an LLM-parsed item for a segment, normalized to one unit of the segment's quantity.
+
+        Segments without a quantity are not cached: the model chose the
+        portion ("eggs" may come back as 2), so there is no unit to scale.
+        """
+        if item.calories is None or segment.qty is None:
+            return
+        factor = segment.scale
+        data = item.model_dump()
+        if data.get("qty") is not None:
+            data["qty"] = data["qty"] / factor
+        for field in NUTRIENT_FIELDS:
+            if data.get(field) is not None:
+                data[field] = data[field] / factor
+        self._cache.set(segment.key, {"item": data, "confidence": confidence})
+
+    def stats(self) -> dict:
+        return self._cache.stats()
@@ -0,0 +1,284 @@
+"""Embedding-similarity cache for paraphrased food logs.
+
+Previously parsed logs are embedded on the CPU and kept in an in-memory
+inverted-file (IVF) index over a NumPy matrix. A new log whose nearest
+neighbour is above the similarity threshold, and which mentions exactly the
+same quantities, is answered from the cache without an LLM call. Memory is
+bounded (least recently used entries are evicted) and the index is persisted
+to disk across restarts.
+
+The embedder is a small sentence-embedding model run by fastembed (ONNX,
+CPU). Without it the cache is disabled: surface-level embeddings (character
+n-grams) score paraphrases below near-identical logs that differ in meaning
+("with dressing" / "without dressing"), so no threshold is safe.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from typing import List, Optional, Set
+
+import numpy as np
+
+_NUMBER_TOKEN_RE = re.compile(
+    r"\d+(?:[.,]\d+)?|\b(?:a|an|one|two|three|four|five|six|seven|eight|nine|ten|half|dozen|couple)\b",
+    re.IGNORECASE,
+)
+_WORD_NUMBERS = {
+    "a": "1", "an": "1", "one": "1", "two": "2", "three": "3", "four": "4", "five": "5",
+    "six": "6", "seven": "7", "eight": "8", "nine": "9", "ten": "10", "half": "0.5",
+    "dozen": "12", "couple": "2",
+}
+
+
+def normalize_log(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def quantity_signature(text: str) -> List[str]:
+    """Sorted quantities mentioned in a log ("2 eggs and an apple" -> ["1", "2"])."""
+    tokens = []
+    for token in _NUMBER_TOKEN_RE.findall(text.lower()):
+        token = _WORD_NUMBERS.get(token, token.replace(",", "."))
+        try:
+            tokens.append(f"{float(token):g}")
+        except ValueError:
+            continue
+    return sorted(tokens)
+
+
+# ============ Embedders ============
+
+class FastEmbedEmbedder:
+    """Sentence embeddings from a small ONNX model via fastembed (CPU only)."""
+
+    def __init__(self, model_name: str):
+        from fastembed import TextEmbedding
+
+        self._model = TextEmbedding(model_name=model_name)
+        self.model_id = model_name
+        self.dim = len(next(iter(self._model.embed(["probe"]))))
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.asarray(list(self._model.embed(texts)), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-9)
+
+
+def create_embedder(model: str) -> Optional[FastEmbedEmbedder]:
+    """The fastembed ``model``, or None (cache disabled) if none is configured or fastembed is missing."""
+    if not model:
+        return None
+    try:
+        return FastEmbedEmbedder(model)
+    except ImportError:
+        print(f"[SemanticCache] fastembed not installed; semantic cache disabled (model {model})")
+        return None
+
+
+# ============ IVF Index ============
+
+class IVFIndex:
+    """Cosine-similarity inverted-file index over a fixed-capacity NumPy matrix.
+
+    Below ``min_train`` vectors search is an exact matrix-vector product.
+    Beyond that, vectors are clustered with spherical k-means into ~sqrt(n)
+    lists and a query scans only the ``nprobe`` closest lists. The
+    clustering is retrained whenever the index has doubled since the last
+    training.
+    """
+
+    def __init__(self, dim: int, capacity: int, nprobe: int = 8, min_train: int = 2048):
+        self.dim = dim
+        self.capacity = capacity
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.used = np.zeros(capacity, dtype=bool)
+        self.assignment = np.full(capacity, -1, dtype=np.int32)
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[Set[int]] = []
+        self._trained_size = 0
+
+    def __len__(self) -> int:
+        return int(self.used.sum())
+
+    def add(self, slot: int, vector: np.ndarray) -> None:
+        if self.assignment[slot] >= 0:
+            # An overwritten slot may belong in another cluster now.
+            self.lists[self.assignment[slot]].discard(slot)
+            self.assignment[slot] = -1
+        self.vectors[slot] = vector
+        self.used[slot] = True
+        if self.centroids is not None:
+            cluster = int(np.argmax(self.centroids @ vector))
+            self.assignment[slot] = cluster
+            self.lists[cluster].add(slot)
+        size = len(self)
+        if size >= self.min_train and size >= 2 * self._trained_size:
+            self.train()
+
+    def remove(self, slot: int) -> None:
+        self.used[slot] = False
+        cluster = self.assignment[slot]
+        if cluster >= 0:
+            self.lists[cluster].discard(slot)
+            self.assignment[slot] = -1
+
+    def search(self, vector: np.ndarray):
+        """(slot, similarity) of the nearest neighbour, or (None, 0.0)."""
+        if self.centroids is None:
+            candidates = np.flatnonzero(self.used)
+        else:
+            probe = np.argsort(self.centroids @ vector)[-self.nprobe:]
+            candidates = np.fromiter(
+                (slot for cluster in probe for slot in self.lists[cluster]), dtype=np.int64
+            )
+        if candidates.size == 0:
+            return None, 0.0
+        scores = self.vectors[candidates] @ vector
+        best = int(np.argmax(scores))
+        return int(candidates[best]), float(scores[best])
+
+    def train(self, iterations: int = 8) -> None:
+        slots = np.flatnonzero(self.used)
+        data = self.vectors[slots]
+        k = max(1, int(np.sqrt(len(slots))))
+        rng = np.random.default_rng(0)
+        centroids = data[rng.choice(len(slots), size=k, replace=False)]
+        for _ in range(iterations):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            for c in range(k):
+                members = data[labels == c]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[c] = centroid / max(np.linalg.norm(centroid), 1e-9)
+        labels = np.argmax(data @ centroids.T, axis=1)
+        self.centroids = centroids
+        self.lists = [set() for _ in range(k)]
+        self.assignment[:] = -1
+        for slot, label in zip(slots, labels):
+            self.assignment[slot] = label
+            self.lists[label].add(int(slot))
+        self._trained_size = len(slots)
+
+
+# ============ Cache ============
+
+class SemanticCache:
+    """Nearest-neighbour cache from food-log text to parsed extraction."""
+
+    def __init__(self, embedder, max_entries: int = 20000, threshold: float = 0.9, path: str = ""):
+        self.embedder = embedder
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.path = path
+        self.index = IVFIndex(embedder.dim, max_entries)
+        self.texts: List[Optional[str]] = [None] * max_entries
+        self.quantities: List[Optional[List[str]]] = [None] * max_entries
+        self.payloads: List[Optional[dict]] = [None] * max_entries
+        self.last_used = np.zeros(max_entries, dtype=np.float64)
+        self._by_text = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self.load()
+
+    def lookup(self, text: str) -> Optional[dict]:
+        """Cached extraction for a paraphrase of ``text``, or None."""
+        key = normalize_log(text)
+        quantities = quantity_signature(key)
+        with self._lock:
+            slot = self._by_text.get(key)
+            if slot is None and len(self.index):
+                vector = self.embedder.embed([key])[0]
+                slot, score = self.index.search(vector)
+                if slot is not None and (score < self.threshold or self.quantities[slot] != quantities):
+                    slot = None
+            if slot is None:
+                self.misses += 1
+                return None
+            self.last_used[slot] = time.time()
+            self.hits += 1
+            return self.payloads[slot]
+
+    def store(self, text: str, payload: dict) -> None:
+        key = normalize_log(text)
+        vector = self.embedder.embed([key])[0]
+        with self._lock:
+            slot = self._by_text.get(key)
+            if slot is None:
+                slot = self._free_slot()
+            self.texts[slot] = key
+            self.quantities[slot] = quantity_signature(key)
+            self.payloads[slot] = payload
+            self.last_used[slot] = time.time()
+            self._by_text[key] = slot
+            self.index.add(slot, vector)
+
+    def _free_slot(self) -> int:
+        free = np.flatnonzero(~self.index.used)
+        if free.size:
+            return int(free[0])
+        # Evict the least recently used entry.
+        slot = int(np.argmin(self.last_used))
+        self._by_text.pop(self.texts[slot], None)
+        self.index.remove(slot)
+        return slot
+
+    def save(self) -> None:
+        """Persist vectors and entries to ``path`` (npz, written atomically)."""
+        if not self.path:
+            return
+        with self._lock:
+            slots = np.flatnonzero(self.index.used)
+            meta = [
+                json.dumps({"text": self.texts[s], "quantities": self.quantities[s], "payload": self.payloads[s]})
+                for s in slots
+            ]
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp.npz"
+            np.savez(
+                tmp_path,
+                model_id=np.array(self.embedder.model_id),
+                vectors=self.index.vectors[slots],
+                last_used=self.last_used[slots],
+                meta=np.array(meta, dtype=np.str_),
+            )
+            os.replace(tmp_path, self.path)
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data["model_id"]) != self.embedder.model_id:
+                    print("[SemanticCache] Embedding model changed; discarding persisted cache")
+                    return
+                vectors, last_used, meta = data["vectors"], data["last_used"], data["meta"]
+        except (OSError, KeyError, ValueError) as e:
+            print(f"[SemanticCache] Could not load {self.path}: {e}")
+            return
+        # Keep the most recently used entries if the file holds more than fits.
+        order = np.argsort(last_used)[-self.max_entries:]
+        for slot, row in enumerate(order):
+            entry = json.loads(str(meta[row]))
+            self.texts[slot] = entry["text"]
+            self.quantities[slot] = entry["quantities"]
+            self.payloads[slot] = entry["payload"]
+            self.last_used[slot] = last_used[row]
+            self._by_text[entry["text"]] = slot
+            self.index.add(slot, vectors[row])
+        print(f"[SemanticCache] Loaded {len(order)} entries from {self.path}")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.index),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
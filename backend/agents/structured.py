@@ -0,0 +1,372 @@
+"""Structured output helpers: JSON schemas for constrained decoding and a tolerant JSON repairer."""
+
+import json
+import re
+from typing import Any, Dict, List, Literal, Optional, Type
+
+from pydantic import BaseModel, Field
+
+from models.food import FoodLogExtraction
+
+NUMERIC_ITEM_FIELDS = ("qty", "calories", "protein_g", "carbs_g", "fat_g", "grams")
+_NUMBER_RE = re.compile(r"-?\d+(?:[.,]\d+)?")
+_JSON_NUMBER_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+
+# ============ Schema Derivation ============
+
+def _inline_refs(node: Any, defs: Dict[str, Any]) -> Any:
+    """Replace ``$ref`` pointers with their definitions and drop titles."""
+    if isinstance(node, dict):
+        if "$ref" in node:
+            return _inline_refs(defs[node["$ref"].split("/")[-1]], defs)
+        return {
+            key: _inline_refs(value, defs)
+            for key, value in node.items()
+            if key not in ("title", "$defs")
+        }
+    if isinstance(node, list):
+        return [_inline_refs(value, defs) for value in node]
+    return node
+
+
+def json_schema_for(model: Type[BaseModel]) -> dict:
+    """Self-contained JSON schema for a Pydantic model.
+
+    References are inlined because grammar compilers on local runtimes
+    (Ollama / llama.cpp) handle flat schemas most reliably.
+    """
+    schema = model.model_json_schema()
+    return _inline_refs(schema, schema.get("$defs", {}))
+
+
+EXTRACTION_JSON_SCHEMA = json_schema_for(FoodLogExtraction)
+
+
+# ============ Compact Wire Format ============
+
+class CompactItem(BaseModel):
+    """Short-key item emitted by the compact prompt."""
+    n: str = Field(description="food name")
+    q: Optional[float] = Field(default=None, description="quantity")
+    u: Optional[str] = Field(default=None, description="unit")
+    k: Optional[float] = Field(default=None, description="calories")
+    p: Optional[float] = Field(default=None, description="protein g")
+    c: Optional[float] = Field(default=None, description="carbs g")
+    f: Optional[float] = Field(default=None, description="fat g")
+    g: Optional[float] = Field(default=None, description="estimated grams")
+
+
+class CompactExtraction(BaseModel):
+    """Short-key extraction emitted by the compact prompt."""
+    m: Literal["B", "L", "D", "S"]
+    i: List[CompactItem]
+    cq: Optional[str] = None
+    cf: float = 0.8
+
+
+class CompactLocalItem(BaseModel):
+    """Short-key item without nutrients, which come from the local nutrition database."""
+    n: str = Field(description="food name")
+    q: Optional[float] = Field(default=None, description="quantity")
+    u: Optional[str] = Field(default=None, description="unit")
+    g: Optional[float] = Field(default=None, description="estimated grams")
+
+
+class CompactLocalExtraction(BaseModel):
+    """Short-key extraction emitted by the local-nutrients compact prompt."""
+    m: Literal["B", "L", "D", "S"]
+    i: List[CompactLocalItem]
+    cq: Optional[str] = None
+    cf: float = 0.8
+
+
+COMPACT_JSON_SCHEMA = json_schema_for(CompactExtraction)
+COMPACT_LOCAL_JSON_SCHEMA = json_schema_for(CompactLocalExtraction)
+
+_COMPACT_MEALS = {"B": "Breakfast", "L": "Lunch", "D": "Dinner", "S": "Snack"}
+_COMPACT_ITEM_KEYS = {
+    "n": "item_name",
+    "q": "qty",
+    "u": "unit",
+    "k": "calories",
+    "p": "protein_g",
+    "c": "carbs_g",
+    "f": "fat_g",
+    "g": "grams",
+}
+
+
+def expand_compact(data: Any) -> Any:
+    """Expand a compact short-key response into the full extraction field names."""
+    if not isinstance(data, dict) or "i" not in data:
+        return data
+    items = []
+    for item in data.get("i") or []:
+        if isinstance(item, dict):
+            items.append({_COMPACT_ITEM_KEYS.get(key, key): value for key, value in item.items()})
+    question = data.get("cq")
+    meal = data.get("m")
+    return {
+        "meal": _COMPACT_MEALS.get(meal, meal),
+        "items": items,
+        "needs_clarification": bool(question),
+        "clarification_question": question or None,
+        "confidence": data.get("cf"),
+    }
+
+
+# ============ Tolerant JSON Repair ============
+
+_LITERALS = {"True": "true", "False": "false", "None": "null", "NaN": "null", "undefined": "null"}
+
+
+def repair_json(text: str) -> Any:
+    """Parse the first JSON object or array in ``text``, repairing common LLM damage.
+
+    Single pass over the characters that handles markdown fences and prose
+    around the object, single-quoted strings, unquoted keys, Python literals,
+    comments, trailing commas, raw newlines inside strings, and output that
+    was cut off mid-way (open strings, arrays and objects are closed).
+    Raises ``ValueError`` if nothing usable is found.
+    """
+    start = min((i for i in (text.find("{"), text.find("[")) if i != -1), default=-1)
+    if start == -1:
+        raise ValueError(f"No JSON found in response: {text[:200]}")
+
+    # Fast path: well-formed output (the norm with constrained decoding) skips the repair scan.
+    end = text.rfind("}" if text[start] == "{" else "]")
+    if end > start:
+        try:
+            return json.loads(text[start:end + 1])
+        except json.JSONDecodeError:
+            pass
+
+    out: List[str] = []
+    stack: List[str] = []
+    quote: Optional[str] = None
+    escape = False
+    i, n = start, len(text)
+
+    while i < n:
+        ch = text[i]
+        if quote is not None:
+            if escape:
+                if ch == "'":
+                    out[-1] = "'"  # \' is not a JSON escape; the quote needs none
+                else:
+                    out.append(ch)
+                escape = False
+            elif ch == "\\":
+                out.append(ch)
+                escape = True
+            elif ch == quote:
+                out.append('"')
+                quote = None
+            elif ch == '"':
+                out.append('\\"')
+            elif ch == "\n":
+                out.append("\\n")
+            else:
+                out.append(ch)
+            i += 1
+            continue
+
+        if ch in "\"'":
+            quote = ch
+            out.append('"')
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+        elif ch in "}]":
+            _strip_trailing_comma(out)
+            # Close anything the model forgot before this bracket.
+            while stack and stack[-1] != ch:
+                out.append(stack.pop())
+            if stack:
+                out.append(stack.pop())
+            if not stack:
+                break
+        elif ch == "/" and text.startswith("//", i) or ch == "#":
+            newline = text.find("\n", i)
+            i = n if newline == -1 else newline
+            continue
+        elif ch == "/" and text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+            continue
+        elif ch.isdigit() or ch in "-+.":
+            match = _JSON_NUMBER_RE.match(text, i)
+            if match is None:
+                out.append(ch)
+                i += 1
+                continue
+            number = match.group(0).lstrip("+")
+            if number.endswith(".") and not text.startswith(".", match.end()):
+                number = number[:-1]
+            number = re.sub(r"^(-?)\.", r"\g<1>0.", number)
+            out.append(number)
+            i = match.end()
+            continue
+        elif ch.isalpha() or ch == "_":
+            j = i
+            while j < n and (text[j].isalnum() or text[j] in "_-"):
+                j += 1
+            word = text[i:j]
+            rest = text[j:].lstrip()
+            if rest.startswith(":") and stack and stack[-1] == "}":
+                out.append(json.dumps(word))
+            else:
+                out.append(_LITERALS.get(word, word))
+            i = j
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    if quote is not None:
+        if escape:
+            out.pop()
+        out.append('"')
+    if stack:
+        _close_truncated(out, stack)
+
+    repaired = "".join(out)
+    try:
+        return json.loads(repaired)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Could not repair JSON response: {e}: {repaired[:200]}") from e
+
+
+def _strip_trailing_comma(out: List[str]) -> None:
+    j = len(out) - 1
+    while j >= 0 and out[j].isspace():
+        j -= 1
+    if j >= 0 and out[j] == ",":
+        del out[j:]
+
+
+def _close_truncated(out: List[str], stack: List[str]) -> None:
+    """Make a cut-off document parseable: drop dangling tokens, then close brackets."""
+    text = "".join(out).rstrip()
+    while True:
+        before = text
+        # Partial number or literal at the very end ("12.", "-", "tru").
+        text = re.sub(r"(?<=[\s:,\[])(-|\d+\.|\d+[eE][+-]?|t|tr|tru|f|fa|fal|fals|n|nu|nul)$", "", text).rstrip()
+        text = text.rstrip(",").rstrip()
+        if text.endswith(":"):
+            text += " null"
+        # A key with no colon/value in an object ("{... , "item_na").
+        if stack[-1] == "}":
+            text = re.sub(r'([{,])\s*"(?:[^"\\]|\\.)*"$', r"\1", text).rstrip()
+        if text == before:
+            break
+    text = text.rstrip(",").rstrip()
+    out[:] = [text, *reversed(stack)]
+
+
+# ============ Validation ============
+
+def coerce_number(value: Any) -> Optional[float]:
+    """Turn a model-emitted number ("120 kcal", "1,5", 3) into a float, or None if impossible."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = _NUMBER_RE.search(value)
+        if match:
+            return float(match.group(0).replace(",", "."))
+    return None
+
+
+def invalid_item_fields(data: Any) -> Dict[int, List[str]]:
+    """Coerce item fields in place and return the ones that could not be salvaged.
+
+    Keys are item indexes; values are the field names the model has to
+    re-emit. Missing nutrition values are not invalid because the nutrition
+    lookup fills them in. Anything but an object is left for the caller to
+    reject.
+    """
+    if not isinstance(data, dict):
+        return {}
+    items = data.get("items")
+    if not isinstance(items, list):
+        data["items"] = []
+        return {}
+
+    # Empty objects are what's left of an item cut off mid-key; drop them.
+    data["items"] = [item for item in items if isinstance(item, dict) and item]
+    invalid: Dict[int, List[str]] = {}
+    for index, item in enumerate(data["items"]):
+        bad = []
+        name = item.get("item_name")
+        if not isinstance(name, str) or not name.strip():
+            bad.append("item_name")
+        for field in NUMERIC_ITEM_FIELDS:
+            value = item.get(field)
+            if value is None:
+                continue
+            number = coerce_number(value)
+            if number is None or number < 0:
+                bad.append(field)
+            else:
+                item[field] = number
+        if bad:
+            invalid[index] = bad
+    return invalid
+
+
+REASK_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"index": {"type": "integer"}},
+                "required": ["index"],
+            },
+        },
+    },
+    "required": ["items"],
+}
+
+REASK_PROMPT = '''You fix individual fields of a food log extraction.
+For each listed item return the requested fields with corrected values (numbers for quantities and nutrients, per the full listed portion).
+Respond with ONLY a JSON object: {"items": [{"index": <index>, "<field>": <value>, ...}]}'''
+
+
+def build_reask_messages(text: str, data: dict, invalid: Dict[int, List[str]]) -> List[dict]:
+    """A minimal prompt asking only for the invalid fields of the invalid items."""
+    targets = [
+        {
+            "index": index,
+            "item": {k: v for k, v in data["items"][index].items() if k not in fields},
+            "fields": fields,
+        }
+        for index, fields in invalid.items()
+    ]
+    return [
+        {"role": "system", "content": REASK_PROMPT},
+        {"role": "user", "content": f"Food log: {text}\nItems to fix: {json.dumps(targets)}"},
+    ]
+
+
+def merge_reask(data: dict, invalid: Dict[int, List[str]], fixes: Any) -> None:
+    """Apply re-asked field values; fields still invalid are dropped from their item."""
+    patches = fixes.get("items", []) if isinstance(fixes, dict) else []
+    by_index = {p.get("index"): p for p in patches if isinstance(p, dict)}
+    for index, fields in invalid.items():
+        item = data["items"][index]
+        patch = by_index.get(index, {})
+        for field in fields:
+            value = patch.get(field)
+            if field == "item_name":
+                item[field] = value if isinstance(value, str) and value.strip() else "Unknown"
+                continue
+            number = coerce_number(value)
+            if number is not None and number >= 0:
+                item[field] = number
+            else:
+                item.pop(field, None)
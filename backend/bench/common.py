@@ -0,0 +1,102 @@
+"""Shared timing, stats and result-file helpers for the benchmarks."""
+
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, int(round(pct / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(latencies_s: List[float], wall_s: float, errors: int = 0) -> dict:
+    """Summarize per-call latencies (seconds) into throughput and percentiles (ms)."""
+    count = len(latencies_s)
+    return {
+        "count": count,
+        "errors": errors,
+        "wall_s": round(wall_s, 4),
+        "throughput_per_s": round(count / wall_s, 2) if wall_s > 0 else 0.0,
+        "mean_ms": round(sum(latencies_s) / count * 1000, 4) if count else 0.0,
+        "p50_ms": round(percentile(latencies_s, 50) * 1000, 4),
+        "p99_ms": round(percentile(latencies_s, 99) * 1000, 4),
+        "max_ms": round(max(latencies_s) * 1000, 4) if count else 0.0,
+    }
+
+
+def microbench(fn: Callable[[], object], iterations: int, warmup: int = 50) -> dict:
+    """Time a synchronous callable call-by-call."""
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    result = summarize(latencies, time.perf_counter() - start)
+    result["mean_us"] = round(result["mean_ms"] * 1000, 3)
+    return result
+
+
+def rss_mb() -> dict:
+    """Current and peak resident set size of this process in MB."""
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_kb //= 1024
+    current_kb = None
+    try:
+        with open("/proc/self/statm") as f:
+            current_kb = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError):
+        pass
+    return {
+        "current_mb": round(current_kb / 1024, 1) if current_kb is not None else None,
+        "peak_mb": round(peak_kb / 1024, 1),
+    }
+
+
+def git_revision() -> str:
+    """Short git SHA of the working tree (suffixed with -dirty if modified)."""
+    try:
+        sha = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+        dirty = subprocess.check_output(
+            ["git", "status", "--porcelain", "--untracked-files=no"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+        return f"{sha}-dirty" if dirty else sha
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def write_results(name: str, results: dict, out_path: Optional[str] = None) -> str:
+    """Write a results document to bench/results/<name>-<rev>.json and return its path."""
+    revision = git_revision()
+    document = {
+        "benchmark": name,
+        "revision": revision,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        **results,
+    }
+    if out_path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out_path = os.path.join(RESULTS_DIR, f"{name}-{revision}.json")
+    with open(out_path, "w") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    return out_path
@@ -0,0 +1,66 @@
+"""Compare two benchmark result files and flag regressions.
+
+Usage (from ``backend/``)::
+
+    python -m bench.compare bench/results/backend-abc123.json bench/results/backend-def456.json
+"""
+
+import argparse
+import json
+import sys
+
+# Metric name -> True if higher is better
+METRICS = {"throughput_per_s": True, "p50_ms": False, "p99_ms": False}
+
+
+def _sections(doc: dict) -> dict:
+    """Flatten {section: {name: stats}} into {"section.name": stats}."""
+    flat = {}
+    for section, entries in doc.items():
+        if not isinstance(entries, dict):
+            continue
+        for name, stats in entries.items():
+            if isinstance(stats, dict) and "p50_ms" in stats:
+                flat[f"{section}.{name}"] = stats
+    return flat
+
+
+def compare(base: dict, head: dict, threshold: float) -> list:
+    """Return rows of (benchmark, metric, base, head, change, regressed)."""
+    rows = []
+    base_flat, head_flat = _sections(base), _sections(head)
+    for key in sorted(base_flat.keys() & head_flat.keys()):
+        for metric, higher_is_better in METRICS.items():
+            old, new = base_flat[key].get(metric), head_flat[key].get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            regressed = change < -threshold if higher_is_better else change > threshold
+            rows.append((key, metric, old, new, change, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark JSON files")
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+
+    print(f"base {base.get('revision')}  ->  head {head.get('revision')}")
+    rows = compare(base, head, args.threshold)
+    for key, metric, old, new, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{key:36} {metric:18} {old:>12.3f} -> {new:>12.3f}  {change:+7.1%}{flag}")
+
+    if any(row[-1] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
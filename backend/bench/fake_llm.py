@@ -0,0 +1,185 @@
+"""Deterministic fake of an OpenAI-compatible chat completions server.
+
+Serves the Groq path (``/openai/v1/chat/completions``) and the plain OpenAI path
+(``/v1/chat/completions``) so the backend can be benchmarked without network
+access, API keys or rate limits. Output is derived only from the request text and
+latency is ``latency_ms`` plus a deterministic jitter (and optionally ``ms_per_token`` per
+completion token), so runs are reproducible.
+
+Run standalone with::
+
+    python -m bench.fake_llm --port 8765 --latency-ms 150
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+
+from fastapi import FastAPI, Request
+
+from agents.food_agent import COMPACT_SYSTEM_PROMPT, COMPACT_SYSTEM_PROMPT_LOCAL
+
+LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "0"))
+JITTER_MS = float(os.getenv("FAKE_LLM_JITTER_MS", "0"))
+# Simulated decode time per completion token, so output size shows up in latency.
+MS_PER_TOKEN = float(os.getenv("FAKE_LLM_MS_PER_TOKEN", "0"))
+
+VISION_DESCRIPTION = "2 scrambled eggs, 1 slice of toast and 1 cup of coffee"
+
+_NUTRITION = {
+    "egg": (155, 13, 1.1, 11),
+    "toast": (265, 9, 49, 3.2),
+    "rice": (130, 2.7, 28, 0.3),
+    "chicken": (165, 31, 0, 3.6),
+    "apple": (52, 0.3, 14, 0.2),
+    "banana": (89, 1.1, 23, 0.3),
+    "coffee": (2, 0.3, 0, 0),
+    "yogurt": (59, 10, 3.6, 0.4),
+}
+# Rough grams per unit for the local-nutrients prompt's "g" estimate.
+_GRAMS_PER_UNIT = {"g": 1, "ml": 1, "cup": 240, "slice": 30, "piece": 100, "serving": 150}
+_SPLIT_RE = re.compile(r"\s*(?:,|;|\band\b|\bwith\b)\s*", re.IGNORECASE)
+_QTY_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(g|ml|cups?|slices?|pieces?)?\s+(.+)$", re.IGNORECASE)
+
+app = FastAPI(title="fake-llm")
+
+
+def _food_log_from_messages(messages: list) -> str:
+    """Pull the user's food text out of the prompt the agent sent."""
+    content = messages[-1].get("content", "")
+    if isinstance(content, list):
+        return ""
+    for line in content.splitlines():
+        if line.lower().startswith(("user food log:", "log:")):
+            return line.split(":", 1)[1].strip()
+    return content.strip()
+
+
+def _extract(text: str) -> dict:
+    """Deterministically turn a food log into the agent's JSON schema."""
+    items = []
+    for segment in filter(None, (s.strip() for s in _SPLIT_RE.split(text))):
+        qty, unit, name = 1.0, "serving", segment
+        m = _QTY_RE.match(segment)
+        if m:
+            qty, unit, name = float(m.group(1)), (m.group(2) or "piece").rstrip("s"), m.group(3)
+        macros = next((v for k, v in _NUTRITION.items() if k in name.lower()), (100, 5, 15, 3))
+        items.append({
+            "item_name": name,
+            "qty": qty,
+            "unit": unit,
+            "brand": None,
+            "search_query": name.lower(),
+            "notes": None,
+            "calories": round(macros[0] * qty, 1),
+            "protein_g": round(macros[1] * qty, 1),
+            "carbs_g": round(macros[2] * qty, 1),
+            "fat_g": round(macros[3] * qty, 1),
+        })
+    return {
+        "meal": "Breakfast",
+        "datetime_local": "2024-01-01T08:00:00",
+        "items": items,
+        "needs_clarification": False,
+        "clarification_question": None,
+        "confidence": 0.9,
+    }
+
+
+def _compact(extraction: dict) -> dict:
+    """The same extraction in the compact prompt's short-key format."""
+    return {
+        "m": extraction["meal"][0],
+        "i": [
+            {"n": i["item_name"], "q": i["qty"], "u": i["unit"], "k": i["calories"],
+             "p": i["protein_g"], "c": i["carbs_g"], "f": i["fat_g"]}
+            for i in extraction["items"]
+        ],
+        "cq": None,
+        "cf": extraction["confidence"],
+    }
+
+
+def _compact_local(extraction: dict) -> dict:
+    """The extraction in the local-nutrients prompt's format: portions only, no nutrients."""
+    compact = _compact(extraction)
+    compact["i"] = [
+        {"n": i["n"], "q": i["q"], "u": i["u"], "g": round(i["q"] * _GRAMS_PER_UNIT.get(i["u"], 100), 1)}
+        for i in compact["i"]
+    ]
+    return compact
+
+
+def _jitter_ms(key: str) -> float:
+    if JITTER_MS <= 0:
+        return 0.0
+    digest = hashlib.sha1(key.encode("utf-8")).digest()
+    return JITTER_MS * digest[0] / 255.0
+
+
+@app.post("/openai/v1/chat/completions")
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    """OpenAI-compatible chat completion with deterministic content."""
+    body = await request.json()
+    messages = body.get("messages", [])
+    is_vision = isinstance(messages[-1].get("content"), list) if messages else False
+
+    if is_vision:
+        content = VISION_DESCRIPTION
+    elif messages[0].get("content") == COMPACT_SYSTEM_PROMPT:
+        content = json.dumps(_compact(_extract(_food_log_from_messages(messages))), separators=(",", ":"))
+    elif messages[0].get("content") == COMPACT_SYSTEM_PROMPT_LOCAL:
+        content = json.dumps(_compact_local(_extract(_food_log_from_messages(messages))), separators=(",", ":"))
+    else:
+        content = "```json\n" + json.dumps(_extract(_food_log_from_messages(messages))) + "\n```"
+
+    # Rough 4-characters-per-token estimate in lieu of a tokenizer.
+    prompt_chars = sum(len(json.dumps(m.get("content", ""))) for m in messages)
+    prompt_tokens = max(1, prompt_chars // 4)
+    completion_tokens = max(1, len(content) // 4)
+
+    delay = LATENCY_MS + _jitter_ms(json.dumps(messages[-1:])) + MS_PER_TOKEN * completion_tokens
+    if delay > 0:
+        await asyncio.sleep(delay / 1000.0)
+
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def main():
+    global LATENCY_MS, JITTER_MS, MS_PER_TOKEN
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Deterministic fake LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=LATENCY_MS)
+    parser.add_argument("--jitter-ms", type=float, default=JITTER_MS)
+    parser.add_argument("--ms-per-token", type=float, default=MS_PER_TOKEN)
+    args = parser.parse_args()
+
+    LATENCY_MS, JITTER_MS, MS_PER_TOKEN = args.latency_ms, args.jitter_ms, args.ms_per_token
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Tokens-in / tokens-out and latency per text parse for each prompt style.
+
+Compares the full ``SYSTEM_PROMPT``, the compact short-key prompt and the
+local-nutrients compact prompt (nutrients from a small sample nutrition
+database instead of the model) on the same logs. Offline it runs against ``bench.fake_llm`` (token counts are a
+4-chars-per-token estimate and decode time is simulated per output token);
+with ``--live`` it uses the configured provider and its reported usage.
+
+Usage (from ``backend/``)::
+
+    python -m bench.prompt_tokens
+    python -m bench.prompt_tokens --live --repeat 3
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from bench.common import summarize, write_results
+from bench.run import SAMPLE_LOGS, start_fake_llm
+
+STYLES = ("full", "compact", "local")
+
+# Per 100 g, with grams per household portion.
+SAMPLE_FOODS = [
+    ("egg", 143, 12.6, 0.7, 9.5, {"medium": 44, "large": 50}),
+    ("toast", 293, 9.0, 54.4, 4.0, {"slice": 30}),
+    ("coffee", 1, 0.1, 0.0, 0.0, {"cup": 237}),
+    ("apple", 52, 0.3, 13.8, 0.2, {"medium": 182}),
+    ("rice", 130, 2.7, 28.2, 0.3, {"cup": 158}),
+    ("chicken", 165, 31.0, 0.0, 3.6, {"piece": 120}),
+    ("banana", 89, 1.1, 22.8, 0.3, {"medium": 118}),
+    ("yogurt", 61, 3.5, 4.7, 3.3, {"cup": 245}),
+    ("chicken salad sandwich", 240, 11.0, 24.0, 11.0, {"piece": 180}),
+]
+
+
+def build_sample_nutrition_db(path: str):
+    from services.nutrition_db import NutritionDatabase, create_database, insert_foods, rebuild_search_index
+
+    conn = create_database(path)
+    insert_foods(conn, (
+        {"source": "bench", "source_id": name, "name": name, "generic": True, "kcal": kcal,
+         "protein_g": protein, "carbs_g": carbs, "fat_g": fat, "portions": portions}
+        for name, kcal, protein, carbs, fat, portions in SAMPLE_FOODS
+    ))
+    rebuild_search_index(conn)
+    conn.close()
+    return NutritionDatabase(path)
+
+
+async def measure(style: str, repeat: int) -> dict:
+    from agents.food_agent import FoodAgentService
+    from agents.llm import LLMBackend
+    from agents.llm_router import create_llm_backend
+
+    class RecordingBackend(LLMBackend):
+        """Pass-through backend that keeps every ChatResult."""
+
+        def __init__(self, inner: LLMBackend):
+            super().__init__(inner.text_model, inner.vision_model, inner.json_mode)
+            self.inner = inner
+            self.results = []
+
+        async def chat(self, messages, **kwargs):
+            result = await self.inner.chat(messages, **kwargs)
+            self.results.append(result)
+            return result
+
+        async def aclose(self):
+            await self.inner.aclose()
+
+    backend = RecordingBackend(create_llm_backend())
+    nutrition_db = None
+    if style == "local":
+        nutrition_db = build_sample_nutrition_db(os.path.join(tempfile.mkdtemp(), "nutrition.sqlite"))
+    service = FoodAgentService(
+        text_backend=backend,
+        vision_backend=backend,
+        prompt_style="full" if style == "full" else "compact",
+        nutrition_db=nutrition_db,
+    )
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in SAMPLE_LOGS:
+            t0 = time.perf_counter()
+            await service.parse_text(text, "2024-01-01T08:00:00")
+            latencies.append(time.perf_counter() - t0)
+    wall = time.perf_counter() - start
+    await service.aclose()
+
+    calls = backend.results
+    stats = summarize(latencies, wall)
+    stats.update({
+        "llm_calls": len(calls),
+        "prompt_tokens_per_parse": round(sum(r.prompt_tokens for r in calls) / len(latencies), 1),
+        "completion_tokens_per_parse": round(sum(r.completion_tokens for r in calls) / len(latencies), 1),
+    })
+    return stats
+
+
+async def run(args) -> dict:
+    results = {}
+    for style in STYLES:
+        results[style] = await measure(style, args.repeat)
+    keys = ("prompt_tokens_per_parse", "completion_tokens_per_parse", "p50_ms", "p99_ms")
+    full, compact, local = results["full"], results["compact"], results["local"]
+    results["reduction"] = {key: round(1 - compact[key] / full[key], 3) if full[key] else 0.0 for key in keys}
+    results["local_reduction"] = {key: round(1 - local[key] / compact[key], 3) if compact[key] else 0.0 for key in keys}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare prompt styles by tokens and latency")
+    parser.add_argument("--live", action="store_true", help="use the configured LLM provider instead of the fake")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--llm-latency-ms", type=float, default=80.0)
+    parser.add_argument("--ms-per-token", type=float, default=4.0, help="fake decode time per output token")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    if not args.live:
+        os.environ["GROQ_BASE_URL"] = start_fake_llm(args.llm_latency_ms, 0.0, args.ms_per_token)
+        os.environ.setdefault("GROQ_API_KEY", "bench")
+        os.environ["LLM_PROVIDER"] = "groq"
+        os.environ["LLM_ROUTES"] = ""
+    # Only the "local" style uses a nutrition database (the bench's own sample),
+    # and every parse goes to the model so the styles are compared like for like.
+    os.environ["NUTRITION_SOURCE"] = "llm"
+    os.environ["SEMANTIC_CACHE"] = "false"
+    os.environ["PARSE_SEGMENT_CACHE"] = "false"
+
+    results = asyncio.run(run(args))
+    results["config"] = {"live": args.live, "repeat": args.repeat, "logs": len(SAMPLE_LOGS)}
+    path = write_results("prompt-tokens", results, args.out)
+
+    for style in STYLES:
+        s = results[style]
+        print(f"{style:8} in {s['prompt_tokens_per_parse']:>7} tok  out {s['completion_tokens_per_parse']:>6} tok  "
+              f"p50 {s['p50_ms']:>8.1f} ms  p99 {s['p99_ms']:>8.1f} ms")
+    print("reduction " + "  ".join(f"{k} {v:.0%}" for k, v in results["reduction"].items()))
+    print("local vs compact " + "  ".join(f"{k} {v:.0%}" for k, v in results["local_reduction"].items()))
+    print(f"[bench] results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Check that every entries query shape is answered from an index.
+
+Seeds a user with entries in a real mongod (mongomock has no query
+planner), runs the migrations, then explains each filter
+``get_food_entries`` can build, and the archive compaction scan. The check fails if a winning plan contains a
+``COLLSCAN`` or lacks an ``IXSCAN``. A sort done in memory also fails it, except
+for item text searches: a prefix range on the multikey ``item_terms`` cannot
+also give ``logged_at`` order, and only matching entries are sorted.
+
+Usage (from ``backend/``)::
+
+    python -m bench.query_plans --mongo mongodb://localhost:27017/nutritrack_plans
+
+Exits non-zero when a query shape is not index-backed.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from datetime import date
+from typing import Iterator, List
+
+QUERY_SHAPES = {
+    "latest": {},
+    "date_range": {"start": date(2024, 3, 1), "end": date(2024, 3, 31)},
+    "meal": {"meal": "Dinner"},
+    "meal_and_day": {"start": date(2024, 3, 6), "end": date(2024, 3, 6), "meal": "Dinner"},
+    "item_text": {"text": "chick"},
+    "item_text_two_words": {"text": "chicken bre"},
+    "item_text_and_range": {"text": "rice", "start": date(2024, 1, 1), "end": date(2024, 6, 30)},
+}
+IN_MEMORY_SORT_ALLOWED = {"item_text", "item_text_two_words", "item_text_and_range"}
+
+
+def plan_stages(plan: dict) -> Iterator[dict]:
+    """Every stage of an explain plan tree."""
+    yield plan
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from plan_stages(child)
+
+
+async def seed(db, user_id: str, count: int) -> None:
+    from services.mongodb import item_terms
+
+    foods = [["Chicken breast", "Rice"], ["Oatmeal", "Banana"], ["Salmon", "Broccoli"], ["Greek yogurt"]]
+    meals = ["Breakfast", "Lunch", "Dinner", "Snack"]
+    docs = []
+    for i in range(count):
+        items = [{"name": name, "quantity": 1, "unit": "serving"} for name in foods[i % len(foods)]]
+        docs.append({
+            "user_id": user_id if i % 5 else f"other-{i % 50}",
+            "logged_at": f"2024-{1 + i % 12:02d}-{1 + i % 27:02d}T{i % 24:02d}:00:00",
+            "meal_label": meals[i % len(meals)],
+            "raw_text": " and ".join(foods[i % len(foods)]),
+            "items": items,
+            "item_terms": item_terms(items),
+        })
+    await db.food_entries.insert_many(docs)
+
+
+async def check(mongo_uri: str, count: int) -> List[str]:
+    from services import mongodb, run_migrations
+    from services.mongodb import entries_filter
+
+    os.environ["MONGODB_URI"] = mongo_uri
+    await mongodb.connect_to_mongodb()
+    db = mongodb.get_database()
+    await db.food_entries.drop()
+    await db.migrations.drop()
+    await mongodb.connect_to_mongodb()  # recreate the connection indexes on the dropped collection
+    user_id = "plans-user"
+    await seed(db, user_id, count)
+    await run_migrations()
+
+    shapes = [(name, entries_filter(user_id, **params), {"logged_at": -1}) for name, params in QUERY_SHAPES.items()]
+    # compact_archives looks for old entries across all users.
+    shapes.append(("archive_compaction", {"logged_at": {"$lt": "2024-03-01"}, "image_base64": None}, None))
+
+    failures = []
+    for name, query, sort in shapes:
+        find = {"find": "food_entries", "filter": query, "limit": 100}
+        if sort:
+            find["sort"] = sort
+        explain = await db.command("explain", find, verbosity="executionStats")
+        stages = list(plan_stages(explain["queryPlanner"]["winningPlan"]))
+        names = [stage.get("stage") for stage in stages]
+        indexes = sorted({stage["indexName"] for stage in stages if "indexName" in stage})
+        stats = explain.get("executionStats", {})
+        ok = (
+            "COLLSCAN" not in names and "IXSCAN" in names
+            and ("SORT" not in names or name in IN_MEMORY_SORT_ALLOWED)
+        )
+        print(
+            f"{'ok  ' if ok else 'FAIL'} {name:22} {'>'.join(reversed(names)):40} "
+            f"index {','.join(indexes) or '-':45} keys {stats.get('totalKeysExamined')} "
+            f"docs {stats.get('totalDocsExamined')} returned {stats.get('nReturned')}"
+        )
+        if not ok:
+            failures.append(name)
+    await db.food_entries.drop()
+    await mongodb.close_mongodb_connection()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Explain the entries query shapes")
+    parser.add_argument("--mongo", required=True, help="mongodb:// URI of a scratch database")
+    parser.add_argument("--entries", type=int, default=20000)
+    args = parser.parse_args()
+
+    failures = asyncio.run(check(args.mongo, args.entries))
+    if failures:
+        print(f"[plans] not index-backed: {', '.join(failures)}")
+        sys.exit(1)
+    print("[plans] every query shape uses an index scan")
+
+
+if __name__ == "__main__":
+    main()
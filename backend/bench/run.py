@@ -0,0 +1,416 @@
+"""End-to-end and micro benchmarks for the FastAPI backend.
+
+Drives the real app in-process (httpx ASGI transport) against the deterministic
+fake LLM in ``bench.fake_llm`` and either mongomock or a local mongod, then
+microbenchmarks the parsing/nutrition hot paths. Results are written as JSON to
+``bench/results/`` so they can be diffed between commits with ``bench.compare``.
+
+Usage (from ``backend/``)::
+
+    python -m bench.run --mongo mongomock --llm-latency-ms 50
+    python -m bench.run --mongo mongodb://localhost:27017/nutritrack_bench
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable
+
+import numpy as np
+
+from bench.common import microbench, rss_mb, summarize, write_results
+
+SAMPLE_LOGS = [
+    "2 eggs, toast and coffee",
+    "an apple",
+    "200 g rice with chicken",
+    "1 banana and 1 cup yogurt",
+    "Chicken salad sandwich for lunch",
+]
+
+# 1x1 transparent PNG
+TINY_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+SAMPLE_RESPONSE = """```json
+{"meal": "Breakfast", "datetime_local": "2024-01-01T08:00:00", "items": [
+ {"item_name": "egg", "qty": 2, "unit": "piece", "brand": null, "search_query": "egg", "notes": null,
+  "calories": 155, "protein_g": 13, "carbs_g": 1.1, "fat_g": 11},
+ {"item_name": "toast", "qty": 1, "unit": "slice", "brand": null, "search_query": "toast", "notes": null,
+  "calories": 80, "protein_g": 3, "carbs_g": 15, "fat_g": 1},
+ {"item_name": "coffee", "qty": 1, "unit": "cup", "brand": null, "search_query": "coffee", "notes": null,
+  "calories": 2, "protein_g": 0.3, "carbs_g": 0, "fat_g": 0}
+], "needs_clarification": false, "clarification_question": null, "confidence": 0.9}
+```"""
+
+
+# Truncated, single-quoted, trailing-comma output that needs the JSON repairer.
+DAMAGED_RESPONSE = (
+    "Here you go: {'meal': 'Breakfast', items: [{'item_name': 'egg', qty: 2, calories: 155,},"
+    " {'item_name': 'toast', 'qty': 1, 'calories': 80, 'notes': None}, {'item_name': 'cof"
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_fake_llm(latency_ms: float, jitter_ms: float, ms_per_token: float = 0.0) -> str:
+    """Start the fake LLM server on a background thread and return its base URL."""
+    import uvicorn
+    from bench import fake_llm
+
+    fake_llm.LATENCY_MS = latency_ms
+    fake_llm.JITTER_MS = jitter_ms
+    fake_llm.MS_PER_TOKEN = ms_per_token
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(fake_llm.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}"
+
+
+async def connect_mongo(target: str):
+    """Connect the services layer to mongomock or a real mongod."""
+    from services import mongodb, run_migrations
+
+    if target == "mongomock":
+        from mongomock_motor import AsyncMongoMockClient
+
+        mongodb._client = AsyncMongoMockClient()
+        mongodb._db = mongodb._client.get_database("nutritrack_bench")
+        await mongodb._db.users.create_index("email", unique=True)
+        await mongodb._db.food_entries.create_index([("user_id", 1), ("logged_at", -1)])
+    else:
+        os.environ["MONGODB_URI"] = target
+        await mongodb.connect_to_mongodb()
+    await run_migrations()
+
+
+async def run_load(
+    requests: int,
+    concurrency: int,
+    call: Callable[[int], Awaitable[object]],
+) -> dict:
+    """Run ``call(i)`` ``requests`` times with bounded concurrency and summarize."""
+    latencies = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            t0 = time.perf_counter()
+            try:
+                response = await call(i)
+                if getattr(response, "status_code", 200) >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+async def http_benchmarks(args) -> dict:
+    """Drive the HTTP routes through the ASGI app."""
+    import httpx
+    from main import app
+
+    await connect_mongo(args.mongo)
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        run_id = uuid.uuid4().hex[:8]
+        password = "bench-password"
+
+        async def register(i):
+            return await client.post("/api/auth/register", json={
+                "email": f"bench-{run_id}-{i}@example.com", "password": password, "name": "Bench",
+            })
+
+        results["auth_register"] = await run_load(args.auth_requests, args.concurrency, register)
+
+        async def login(i):
+            return await client.post("/api/auth/login", json={
+                "email": f"bench-{run_id}-{i % args.auth_requests}@example.com", "password": password,
+            })
+
+        results["auth_login"] = await run_load(args.auth_requests, args.concurrency, login)
+
+        token = (await login(0)).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        async def me(i):
+            return await client.get("/api/auth/me", headers=headers)
+
+        results["auth_me"] = await run_load(args.requests, args.concurrency, me)
+
+        async def parse(i):
+            return await client.post("/api/parse-food-log", headers=headers, json={
+                "text": SAMPLE_LOGS[i % len(SAMPLE_LOGS)],
+                "current_datetime": "2024-01-01T08:00:00",
+            })
+
+        results["parse_food_log"] = await run_load(args.requests, args.concurrency, parse)
+
+        async def analyze(i):
+            return await client.post(
+                "/api/analyze-food-image",
+                headers=headers,
+                files={"image": ("meal.png", TINY_PNG, "image/png")},
+                data={"current_datetime": "2024-01-01T08:00:00"},
+            )
+
+        results["analyze_food_image"] = await run_load(args.requests, args.concurrency, analyze)
+
+        # Async mode: submit (202) then long-poll the job until it is done.
+        from agents import JOB_HANDLERS
+        from services import JobWorkerPool, ensure_job_indexes, get_settings
+
+        await ensure_job_indexes()
+        pool = JobWorkerPool(JOB_HANDLERS, get_settings().parse_job_workers)
+        pool.start()
+
+        async def analyze_async(i):
+            accepted = await client.post(
+                "/api/analyze-food-image",
+                headers=headers,
+                params={"async": "true"},
+                files={"image": ("meal.png", TINY_PNG, "image/png")},
+                data={"current_datetime": "2024-01-01T08:00:00"},
+            )
+            if accepted.status_code != 202:
+                return accepted
+            job = await client.get(accepted.headers["Location"], headers=headers, params={"wait": 30})
+            if job.json().get("status") != "done":
+                raise RuntimeError(f"job not done: {job.json()}")
+            return job
+
+        try:
+            results["analyze_food_image_async"] = await run_load(args.requests, args.concurrency, analyze_async)
+        finally:
+            await pool.stop()
+
+        parsed = (await parse(0)).json()
+
+        async def create_entry(i):
+            return await client.post("/api/entries", headers=headers, json={
+                "logged_at": f"2024-01-{1 + i % 28:02d}T08:00:00",
+                "raw_text": SAMPLE_LOGS[i % len(SAMPLE_LOGS)],
+                "meal_label": parsed.get("meal_label"),
+                "items": parsed["items"],
+                "totals": {"calories": 500, "protein_g": 30, "carbs_g": 40, "fat_g": 20},
+            })
+
+        results["entries_create"] = await run_load(args.requests, args.concurrency, create_entry)
+
+        async def list_entries(i):
+            return await client.get("/api/entries", headers=headers, params={"limit": 100})
+
+        results["entries_list"] = await run_load(args.requests, args.concurrency, list_entries)
+
+        etag = (await list_entries(0)).headers["etag"]
+
+        async def revalidate_entries(i):
+            # An idle refresh: the list has not changed since the client's copy.
+            return await client.get("/api/entries", params={"limit": 100},
+                                    headers={**headers, "If-None-Match": etag})
+
+        results["entries_list_not_modified"] = await run_load(args.requests, args.concurrency, revalidate_entries)
+
+        results.update(await abuse_benchmark(client, args, run_id, password))
+
+    return results
+
+
+async def abuse_benchmark(client, args, run_id: str, password: str) -> dict:
+    """Latency of a well-behaved user's LLM-bound parses, alone and while another user floods the API."""
+    from services import admission, Settings
+
+    defaults = Settings.model_fields
+
+    def default_limits():
+        admission._user_limiter = admission.UserLimiter(
+            defaults["admission_user_rate_per_min"].default,
+            defaults["admission_user_burst"].default,
+            defaults["admission_user_max_concurrency"].default,
+        )
+
+    async def token_for(name):
+        email = f"bench-{run_id}-{name}@example.com"
+        await client.post("/api/auth/register", json={"email": email, "password": password, "name": name})
+        login = await client.post("/api/auth/login", json={"email": email, "password": password})
+        return {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    polite, abuser = await token_for("polite"), await token_for("abuser")
+    # Unique food names miss every cache, so each parse is an LLM call.
+    requests = max(5, min(args.requests // 10, 10))
+
+    async def polite_parse(i):
+        return await client.post("/api/parse-food-log", headers=polite, json={
+            "text": f"a bowl of food{uuid.uuid4().hex[:8]}", "current_datetime": "2024-01-01T08:00:00",
+        })
+
+    default_limits()
+    results = {"parse_polite_alone": await run_load(requests, 1, polite_parse)}
+    default_limits()
+
+    stop = asyncio.Event()
+    rejected = 0
+
+    async def flood():
+        nonlocal rejected
+        while not stop.is_set():
+            response = await client.post("/api/parse-food-log", headers=abuser, json={
+                "text": f"a bowl of food{uuid.uuid4().hex[:8]}", "current_datetime": "2024-01-01T08:00:00",
+            })
+            if response.status_code == 429:
+                rejected += 1
+            # A retry loop with no backoff; kept finite because the flood shares this process's CPU.
+            await asyncio.sleep(0.02)
+
+    flooders = [asyncio.create_task(flood()) for _ in range(32)]
+    try:
+        results["parse_polite_under_abuse"] = await run_load(requests, 1, polite_parse)
+    finally:
+        stop.set()
+        await asyncio.gather(*flooders, return_exceptions=True)
+    results["parse_polite_under_abuse"]["abuser_rejected"] = rejected
+    admission._user_limiter = None
+    return results
+
+
+def sample_barcode_index(count: int):
+    """A barcode index of ``count`` synthetic products (valid EAN-13s) in a temp dir; returns (index, codes)."""
+    import random
+    import tempfile
+    from services.barcodes import BarcodeIndex, build_barcode_index
+    from services.nutrition_db import create_database, insert_foods
+
+    def ean13(base: int) -> str:
+        digits = f"{base:012d}"
+        total = sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(digits))
+        return digits + str((10 - total % 10) % 10)
+
+    rng = random.Random(7)
+    codes = [ean13(rng.randrange(10**11, 10**12)) for _ in range(count)]
+    directory = tempfile.mkdtemp()
+    conn = create_database(os.path.join(directory, "nutrition.sqlite"))
+    with conn:
+        insert_foods(conn, (
+            {"source": "bench", "source_id": code, "code": code, "name": f"Product {i}", "brand": "Bench",
+             "kcal": 100 + i % 400, "protein_g": 5.0, "carbs_g": 20.0, "fat_g": 3.0, "serving_g": 30.0}
+            for i, code in enumerate(codes)
+        ))
+    path = os.path.join(directory, "barcodes.idx")
+    build_barcode_index(conn, path)
+    conn.close()
+    return BarcodeIndex(path), codes
+
+
+def micro_benchmarks(iterations: int) -> dict:
+    """Microbenchmark the pure-Python parsing and nutrition helpers."""
+    from agents.food_agent import BASIC_FOODS, get_nutrition_info, extraction_to_response, get_food_agent_service
+    from services import barcodes
+    from services.nutrition_scaling import encode_units, quantities
+
+    service = get_food_agent_service()
+    # A bulk import's worth of mentions: 10k items across every unit kind.
+    batch_names = [name for name in ("2 eggs", "rice", "milk", "dragonfruit", "chicken") for _ in range(2000)]
+    batch_qtys = [2, 200, 1.5, None, 150] * 2000
+    batch_units = [None, "g", "cup", None, "g"] * 2000
+    batch_rows = np.array([BASIC_FOODS.match(name) for name in batch_names])
+    batch_qty = quantities(batch_qtys)
+    batch_kinds, batch_factors = encode_units(batch_units)
+    extraction = service._parse_response(SAMPLE_RESPONSE, "2024-01-01T08:00:00")
+    barcodes._barcode_index, codes = sample_barcode_index(200_000)
+    barcodes._barcode_index_loaded = True
+    return {
+        "barcode_parse": microbench(
+            lambda: extraction_to_response(service._parse_barcode(codes[12345], "2024-01-01T08:00:00")), iterations
+        ),
+        "get_nutrition_info_hit": microbench(lambda: get_nutrition_info("2 scrambled eggs", 2), iterations),
+        "get_nutrition_info_miss": microbench(lambda: get_nutrition_info("dragonfruit smoothie", 1), iterations),
+        "get_nutrition_info_grams": microbench(lambda: get_nutrition_info("rice", 200, "g"), iterations),
+        # Per call = 10k items; divide by 10k for the per-item cost.
+        "nutrients_batch_10k": microbench(
+            lambda: BASIC_FOODS.nutrients(batch_names, batch_qtys, batch_units), max(1, iterations // 100)
+        ),
+        "nutrients_batch_10k_encoded": microbench(
+            lambda: BASIC_FOODS.nutrients_for_rows(batch_rows, batch_qty, batch_kinds, batch_factors),
+            max(1, iterations // 100),
+        ),
+        "parse_response": microbench(
+            lambda: service._parse_response(SAMPLE_RESPONSE, "2024-01-01T08:00:00"), iterations
+        ),
+        "parse_response_repair": microbench(
+            lambda: service._parse_response(DAMAGED_RESPONSE, "2024-01-01T08:00:00"), iterations
+        ),
+        "extraction_to_response": microbench(lambda: extraction_to_response(extraction), iterations),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the NutriTrack backend hot paths")
+    parser.add_argument("--mongo", default="mongomock", help="'mongomock' or a mongodb:// URI for a local mongod")
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=10.0)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--auth-requests", type=int, default=20, help="bcrypt makes auth slow; keep this small")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--micro-iterations", type=int, default=20000)
+    parser.add_argument("--skip-http", action="store_true")
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--out", default=None, help="output path (default: bench/results/backend-<rev>.json)")
+    args = parser.parse_args()
+
+    os.environ["GROQ_BASE_URL"] = start_fake_llm(args.llm_latency_ms, args.llm_jitter_ms)
+    os.environ.setdefault("GROQ_API_KEY", "bench")
+    # Throughput runs come from one user; per-user limits are exercised separately in the abuse run.
+    os.environ.setdefault("ADMISSION_USER_RATE_PER_MIN", "1000000")
+    os.environ.setdefault("ADMISSION_USER_BURST", "1000000")
+    os.environ.setdefault("ADMISSION_USER_MAX_CONCURRENCY", "100000")
+    # Start every run with cold parse caches (shm caches outlive the process).
+    os.environ.setdefault("CACHE_BACKEND", "local")
+
+    rss_start = rss_mb()
+    results = {
+        "config": {
+            "mongo": "mongomock" if args.mongo == "mongomock" else "mongod",
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_jitter_ms": args.llm_jitter_ms,
+            "requests": args.requests,
+            "auth_requests": args.auth_requests,
+            "concurrency": args.concurrency,
+            "micro_iterations": args.micro_iterations,
+        },
+    }
+    if not args.skip_micro:
+        results["micro"] = micro_benchmarks(args.micro_iterations)
+    if not args.skip_http:
+        results["http"] = asyncio.run(http_benchmarks(args))
+    results["rss"] = {"start": rss_start, "end": rss_mb()}
+
+    path = write_results("backend", results, args.out)
+    for section in ("micro", "http"):
+        for name, stats in results.get(section, {}).items():
+            print(f"{section:5} {name:26} {stats['throughput_per_s']:>10}/s  "
+                  f"p50 {stats['p50_ms']:>9.3f} ms  p99 {stats['p99_ms']:>9.3f} ms  errors {stats['errors']}")
+    print(f"rss peak {results['rss']['end']['peak_mb']} MB")
+    print(f"[bench] results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Serialization CPU per entries page: response_model validation vs the fast path.
+
+Serves the same page of stored entries three ways from an in-process ASGI
+app (no network, no database):
+
+- ``validated``: ``response_model=List[FoodEntry]`` with the raw documents,
+  i.e. FastAPI validates them and encodes with the stdlib encoder (the
+  entries routes before the fast path)
+- ``fast``: ``FastJSONResponse(entries_view(...))``
+- ``fast_compact``: the same with ``compact=True``
+
+and also times the encoding step alone, outside the ASGI stack.
+
+Usage (from ``backend/``)::
+
+    python -m bench.serialization [--entries 100] [--iterations 2000]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from bench.common import microbench, summarize, write_results
+
+
+def sample_entries(count: int) -> List[dict]:
+    """Stored-entry documents as ``serialize_doc`` returns them."""
+    now = datetime(2024, 1, 1, 8, 0, 0, 123000)
+    foods = [("Scrambled eggs", 2, "piece", 155), ("Toast", 1, "slice", 80), ("Coffee", 1, "cup", 2)]
+    entries = []
+    for i in range(count):
+        items = [
+            {
+                "name": name,
+                "quantity": qty,
+                "unit": unit,
+                "nutrients_total": {"calories": kcal, "protein_g": 6.5, "carbs_g": 12.0, "fat_g": 5.5},
+                "source": "text",
+                "confidence": 0.9,
+            }
+            for name, qty, unit, kcal in foods
+        ]
+        entries.append({
+            "id": f"65a1b2c3d4e5f6a7b8c9{i:04d}",
+            "logged_at": (now - timedelta(hours=i)).isoformat(),
+            "raw_text": "2 eggs, toast and coffee",
+            "meal_label": "Breakfast",
+            "items": items,
+            "totals": {"calories": 237, "protein_g": 19.5, "carbs_g": 36.0, "fat_g": 16.5},
+            "user_id": "65a1b2c3d4e5f6a7b8c90000",
+            "created_at": now - timedelta(hours=i),
+            "updated_at": now - timedelta(hours=i),
+            # Every tenth entry was logged from a photo.
+            "image_base64": "/9j/" + "A" * 20_000 if i % 10 == 0 else None,
+        })
+    return entries
+
+
+def build_app(entries: List[dict]):
+    from fastapi import FastAPI
+
+    from models import FoodEntry
+    from services.serialization import FastJSONResponse, entries_view
+
+    app = FastAPI()
+
+    @app.get("/validated", response_model=List[FoodEntry])
+    async def validated():
+        return entries
+
+    @app.get("/fast", response_model=List[FoodEntry])
+    async def fast():
+        return FastJSONResponse(entries_view(entries))
+
+    @app.get("/fast_compact", response_model=List[FoodEntry])
+    async def fast_compact():
+        return FastJSONResponse(entries_view(entries, compact=True))
+
+    return app
+
+
+async def http_benchmarks(entries: List[dict], iterations: int) -> dict:
+    import httpx
+
+    transport = httpx.ASGITransport(app=build_app(entries))
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for path in ("validated", "fast", "fast_compact"):
+            for _ in range(50):
+                await client.get(f"/{path}")
+            latencies = []
+            start = time.perf_counter()
+            for _ in range(iterations):
+                t0 = time.perf_counter()
+                response = await client.get(f"/{path}")
+                latencies.append(time.perf_counter() - t0)
+            results[path] = summarize(latencies, time.perf_counter() - start)
+            results[path]["bytes"] = len(response.content)
+    return results
+
+
+def encode_benchmarks(entries: List[dict], iterations: int) -> dict:
+    from pydantic import TypeAdapter
+
+    from models import FoodEntry
+    from services.serialization import dumps, entries_view
+
+    adapter = TypeAdapter(List[FoodEntry])
+
+    def validated():
+        # What FastAPI does for response_model: validate, dump in JSON mode, json.dumps.
+        content = adapter.dump_python(adapter.validate_python(entries), mode="json")
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+    return {
+        "validated": microbench(validated, iterations),
+        "fast": microbench(lambda: dumps(entries_view(entries)), iterations),
+        "fast_compact": microbench(lambda: dumps(entries_view(entries, compact=True)), iterations),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark entries page serialization")
+    parser.add_argument("--entries", type=int, default=100, help="entries per page")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    entries = sample_entries(args.entries)
+    results = {
+        "http": asyncio.run(http_benchmarks(entries, args.iterations)),
+        "encode": encode_benchmarks(entries, args.iterations),
+    }
+    results["speedup"] = {
+        f"{section}.{name}": round(results[section]["validated"]["mean_ms"] / results[section][name]["mean_ms"], 2)
+        for section in ("http", "encode")
+        for name in ("fast", "fast_compact")
+    }
+    results["config"] = {"entries": args.entries, "iterations": args.iterations}
+    path = write_results("serialization", results, args.out)
+
+    for section in ("http", "encode"):
+        for name, s in results[section].items():
+            extra = f"  {s['bytes']} B" if "bytes" in s else ""
+            print(f"{section:6} {name:14} mean {s['mean_ms']:>8.3f} ms  p99 {s['p99_ms']:>8.3f} ms{extra}")
+    print("speedup " + "  ".join(f"{k} {v}x" for k, v in results["speedup"].items()))
+    print(f"[bench] results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Parse-cache hit rate and latency across worker processes, per cache backend.
+
+``--workers`` forked processes serve one stream of segment lookups between
+them (keys drawn from a Zipf distribution over ``--keys`` foods, like the
+segment cache sees): each lookup that misses stores the entry, as a parse
+would after its LLM call. With ``local`` caches every worker has to miss
+on each food itself; with ``shm`` one miss fills the cache for all of them.
+``get``/``set`` latencies are timed in a single process.
+
+Usage (from ``backend/``)::
+
+    python -m bench.shared_cache [--workers 4] [--lookups 20000] [--keys 2000]
+    python -m bench.shared_cache --backends local,shm,redis   # redis: CACHE_REDIS_URL
+"""
+
+import argparse
+import os
+import random
+import tempfile
+from typing import List
+
+from bench.common import microbench, write_results
+
+ENTRY = {
+    "item": {
+        "item_name": "Scrambled eggs", "qty": 1.0, "unit": "large", "brand": None,
+        "search_query": "scrambled eggs", "notes": None, "calories": 91.0,
+        "protein_g": 6.1, "carbs_g": 1.0, "fat_g": 6.7, "grams": 61.0,
+    },
+    "confidence": 0.9,
+}
+
+
+def _zipf_keys(count: int, keys: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) for rank in range(keys)]
+    return [f"large|food {k}" for k in rng.choices(range(keys), weights=weights, k=count)]
+
+
+def _make_cache(backend: str, keys: int):
+    os.environ["CACHE_BACKEND"] = backend
+    from services.config import get_settings
+    from services.shared_cache import create_cache
+
+    get_settings.cache_clear()
+    return create_cache(f"bench-{os.getpid()}", keys * 2, 3600, max_value_bytes=1024)
+
+
+def hit_rate(backend: str, workers: int, lookups: int, keys: int) -> dict:
+    """Hit rate of ``lookups`` lookups split over ``workers`` processes."""
+    cache = _make_cache(backend, keys)  # opened before forking, like the app's caches under serve.py
+    cache.clear()
+    read_fd, write_fd = os.pipe()
+    pids = []
+    for worker in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            hits = 0
+            for key in _zipf_keys(lookups // workers, keys, seed=worker):
+                if cache.get(key) is not None:
+                    hits += 1
+                else:
+                    cache.set(key, ENTRY)
+            os.write(write_fd, f"{hits}\n".encode())
+            os._exit(0)
+        pids.append(pid)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        hits = sum(int(line) for line in f.read().split())
+    total = (lookups // workers) * workers
+    return {"workers": workers, "lookups": total, "hits": hits, "hit_rate": round(hits / total, 3)}
+
+
+def latency(backend: str, iterations: int, keys: int) -> dict:
+    cache = _make_cache(backend, keys)
+    cache.clear()
+    stored = _zipf_keys(iterations + 100, keys, seed=0)
+    for key in set(stored):
+        cache.set(key, ENTRY)
+    hits, sets = iter(stored), iter(stored)
+    return {
+        "get": microbench(lambda: cache.get(next(hits)), iterations),
+        "set": microbench(lambda: cache.set(next(sets), ENTRY), iterations),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark shared parse-cache backends")
+    parser.add_argument("--backends", default="local,shm")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--keys", type=int, default=2000)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--out", default=None, help="output path (default: bench/results/shared_cache-<rev>.json)")
+    args = parser.parse_args()
+
+    results = {"config": vars(args).copy(), "backends": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        # A scratch directory: the app's own cache files are left alone and nothing outlives the run.
+        os.environ["CACHE_SHM_DIR"] = tmp
+        for backend in args.backends.split(","):
+            results["backends"][backend] = {
+                "single_worker": hit_rate(backend, 1, args.lookups, args.keys),
+                "all_workers": hit_rate(backend, args.workers, args.lookups, args.keys),
+                "latency": latency(backend, args.iterations, args.keys),
+            }
+    path = write_results("shared_cache", results, args.out)
+    for backend, result in results["backends"].items():
+        print(
+            f"{backend:6} hit rate 1 worker {result['single_worker']['hit_rate']:.3f}  "
+            f"{args.workers} workers {result['all_workers']['hit_rate']:.3f}  "
+            f"get {result['latency']['get']['mean_us']:.1f} us  set {result['latency']['set']['mean_us']:.1f} us"
+        )
+    print(f"[bench] results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
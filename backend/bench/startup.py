@@ -0,0 +1,221 @@
+"""Start-up benchmark: import time and time to first request.
+
+- ``import``: ``import main`` in fresh interpreters, next to a bare
+  interpreter start, and which heavy dependencies the import pulled in
+  (they should all be imported on first use instead)
+- ``first_request``: ``serve.py`` started as a subprocess; time until
+  ``/api/health`` answers, then the first and a warm parse against the fake
+  LLM (the first builds the LLM client and caches on demand) and the time
+  to shut down
+
+Each measurement is repeated ``--runs`` times and reported as min/median.
+Results are written as JSON to ``bench/results/`` like ``bench.run``.
+
+Usage (from ``backend/``)::
+
+    python -m bench.startup --runs 10 --workers 2
+    python -m bench.startup --mongo mongodb://localhost:27017/nutritrack_startup
+"""
+
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+import httpx
+
+from bench.common import write_results
+
+HEAVY_MODULES = ("groq", "motor", "pymongo", "jose", "bcrypt")
+
+# CPU time is reported next to wall time: it is far less noisy on a shared machine.
+_IMPORT_SCRIPT = f"""
+import json, resource, sys, time
+def cpu():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+start, start_cpu = time.perf_counter(), cpu()
+import main
+elapsed, elapsed_cpu = time.perf_counter() - start, cpu() - start_cpu
+print(json.dumps({{
+    "ms": elapsed * 1000,
+    "cpu_ms": elapsed_cpu * 1000,
+    "heavy": [m for m in {HEAVY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def _stats(samples: List[float]) -> dict:
+    return {
+        "runs": len(samples),
+        "min_ms": round(min(samples), 1),
+        "median_ms": round(statistics.median(samples), 1),
+        "max_ms": round(max(samples), 1),
+    }
+
+
+def import_benchmark(runs: int) -> dict:
+    """``import main`` and a bare interpreter start, each in fresh processes."""
+    bare, wall, imports, imports_cpu = [], [], [], []
+    heavy = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        bare.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", _IMPORT_SCRIPT], check=True, capture_output=True, text=True)
+        wall.append((time.perf_counter() - start) * 1000)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        imports.append(result["ms"])
+        imports_cpu.append(result["cpu_ms"])
+        heavy = result["heavy"]
+    return {
+        "interpreter": _stats(bare),
+        "import_main": _stats(imports),
+        "import_main_cpu": _stats(imports_cpu),
+        "process_wall": _stats(wall),
+        "heavy_modules_loaded": heavy,
+    }
+
+
+def _wait_healthy(base_url: str, proc: subprocess.Popen, timeout_s: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}")
+        try:
+            if httpx.get(f"{base_url}/api/health", timeout=0.5).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.005)
+    raise RuntimeError("server did not become healthy in time")
+
+
+def first_request_benchmark(runs: int, workers: int, mongo: str, llm_url: str) -> dict:
+    """Time ``serve.py`` from process start to its first answers."""
+    from bench.run import SAMPLE_LOGS, _free_port
+
+    ready, first_parse, warm_parse, shutdown = [], [], [], []
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "GROQ_BASE_URL": llm_url,
+            "GROQ_API_KEY": os.environ.get("GROQ_API_KEY", "bench"),
+            "PARSE_JOB_WORKERS": "0",
+        }
+        for run in range(runs):
+            # A fresh path per run: a cache saved at the last shutdown would make the first parse warm.
+            env["SEMANTIC_CACHE_PATH"] = os.path.join(tmp, f"semantic_cache-{run}.npz")
+            env["CACHE_PREFIX"] = f"startup-{run}"
+            env["CACHE_SHM_DIR"] = tmp
+            port = _free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            start = time.perf_counter()
+            proc = subprocess.Popen(
+                [sys.executable, "-m", "bench.startup", "--child", "--port", str(port),
+                 "--workers", str(workers), "--mongo", mongo],
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                _wait_healthy(base_url, proc)
+                ready.append((time.perf_counter() - start) * 1000)
+
+                with httpx.Client(base_url=base_url, timeout=60) as client:
+                    email = f"startup-{os.getpid()}-{run}@example.com"
+                    client.post("/api/auth/register", json={"email": email, "password": "startup-pass", "name": "S"})
+                    token = client.post("/api/auth/login", json={"email": email, "password": "startup-pass"}).json()["access_token"]
+                    headers = {"Authorization": f"Bearer {token}"}
+                    for samples, text in ((first_parse, SAMPLE_LOGS[0]), (warm_parse, SAMPLE_LOGS[1])):
+                        t0 = time.perf_counter()
+                        response = client.post("/api/parse-food-log", headers=headers, json={
+                            "text": text, "current_datetime": "2024-01-01T08:00:00",
+                        })
+                        response.raise_for_status()
+                        samples.append((time.perf_counter() - t0) * 1000)
+            finally:
+                t0 = time.perf_counter()
+                proc.send_signal(signal.SIGTERM)
+                try:
+                    proc.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+                    proc.wait()
+                shutdown.append((time.perf_counter() - t0) * 1000)
+    return {
+        "workers": workers,
+        "time_to_healthy": _stats(ready),
+        "first_parse": _stats(first_parse),
+        "warm_parse": _stats(warm_parse),
+        "shutdown": _stats(shutdown),
+    }
+
+
+def run_child(port: int, workers: int, mongo: str) -> None:
+    """The server under test: ``serve.py``, on mongomock unless a mongod URI is given."""
+    import serve
+
+    app = serve.preload()
+    if mongo == "mongomock":
+        # Imported before forking, like the app's own dependencies, so workers don't pay for the mock.
+        from mongomock_motor import AsyncMongoMockClient
+
+        import main
+        from services import mongodb
+
+        async def connect_mongomock():
+            mongodb._client = AsyncMongoMockClient()
+            mongodb._db = mongodb._client.get_database("nutritrack_startup")
+            await mongodb._db.users.create_index("email", unique=True)
+
+        main.connect_to_mongodb = connect_mongomock
+    else:
+        os.environ["MONGODB_URI"] = mongo
+    serve.serve(app, serve.bind("127.0.0.1", port), workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark backend start-up")
+    parser.add_argument("--mongo", default="mongomock", help="'mongomock' or a mongodb:// URI for a local mongod")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0)
+    parser.add_argument("--out", default=None, help="output path (default: bench/results/startup-<rev>.json)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.port, args.workers, args.mongo)
+        return
+
+    # Imported here so the --child server process does not load the HTTP benchmark's dependencies.
+    from bench.run import start_fake_llm
+
+    llm_url = start_fake_llm(args.llm_latency_ms, 0.0)
+    results = {
+        "config": {"mongo": "mongomock" if args.mongo == "mongomock" else "mongod", "runs": args.runs,
+                   "llm_latency_ms": args.llm_latency_ms},
+        "import": import_benchmark(args.runs),
+        "first_request": first_request_benchmark(args.runs, args.workers, args.mongo, llm_url),
+    }
+    path = write_results("startup", results, args.out)
+    for section in ("import", "first_request"):
+        for name, stats in results[section].items():
+            if isinstance(stats, dict):
+                print(f"{section:13} {name:16} min {stats['min_ms']:>8.1f} ms  median {stats['median_ms']:>8.1f} ms")
+    print(f"heavy modules loaded by `import main`: {results['import']['heavy_modules_loaded'] or 'none'}")
+    print(f"[bench] results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
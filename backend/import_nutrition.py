@@ -0,0 +1,72 @@
+"""Build the local nutrition database from OpenFoodFacts / FoodData Central dumps.
+
+    python import_nutrition.py off en.openfoodfacts.org.products.csv.gz
+    python import_nutrition.py off openfoodfacts-products.jsonl.gz
+    python import_nutrition.py fdc FoodData_Central_foundation_food_json_2024-10-31.json
+    python import_nutrition.py fdc FoodData_Central_csv_2024-10-31/ [--fdc-types foundation_food,sr_legacy_food]
+
+Imports are upserts keyed by (source, source id), so several dumps can be
+loaded into one file and re-running an import refreshes it. The database
+goes to NUTRITION_DB_PATH unless --db is given, and the barcode index for
+the parse fast path is rewritten to NUTRITION_BARCODE_INDEX_PATH (--barcodes)
+from every food with a barcode. Restart the API afterwards.
+"""
+
+import argparse
+import itertools
+import os
+import time
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from services.barcodes import build_barcode_index
+from services.config import get_settings
+from services.nutrition_db import create_database, insert_foods, rebuild_search_index
+from services.nutrition_import import iter_fdc_csv, iter_fdc_json, iter_off
+
+BATCH_SIZE = 5000
+
+
+def foods_from(source: str, path: str, fdc_types=None):
+    if source == "off":
+        return iter_off(path)
+    if os.path.isdir(path):
+        return iter_fdc_csv(path, fdc_types)
+    return iter_fdc_json(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a nutrition dataset into the local nutrition database.")
+    parser.add_argument("source", choices=("off", "fdc"), help="off = OpenFoodFacts, fdc = USDA FoodData Central")
+    parser.add_argument("path", help="dump file (CSV/JSONL/JSON, optionally .gz) or unpacked FDC CSV directory")
+    parser.add_argument("--db", default=get_settings().nutrition_db_path, help="database file to create or update")
+    parser.add_argument("--barcodes", default=get_settings().nutrition_barcode_index_path, help="barcode index file to write")
+    parser.add_argument("--fdc-types", default=None, help="comma-separated FDC data_type values to keep (CSV only)")
+    args = parser.parse_args()
+
+    fdc_types = set(args.fdc_types.split(",")) if args.fdc_types else None
+    foods = foods_from(args.source, args.path, fdc_types)
+    conn = create_database(args.db)
+    start = time.perf_counter()
+    total = 0
+    while True:
+        batch = list(itertools.islice(foods, BATCH_SIZE))
+        if not batch:
+            break
+        with conn:
+            total += insert_foods(conn, batch)
+        print(f"[Nutrition] {total} foods imported ({time.perf_counter() - start:.0f}s)")
+
+    print("[Nutrition] Rebuilding search index...")
+    rebuild_search_index(conn)
+    count = conn.execute("SELECT COUNT(*) FROM foods").fetchone()[0]
+    barcodes = build_barcode_index(conn, args.barcodes) if args.barcodes else 0
+    conn.close()
+    print(f"[Nutrition] Done: {total} foods from {args.path}; {count} foods in {args.db}, {barcodes} barcodes in {args.barcodes}")
+
+
+if __name__ == "__main__":
+    main()
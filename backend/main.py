@@ -9,8 +9,22 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
-from services import connect_to_mongodb, close_mongodb_connection
-from routers import auth_router, food_router, entries_router
+from services import (
+    connect_to_mongodb,
+    close_mongodb_connection,
+    ensure_job_indexes,
+    run_migrations,
+    get_settings,
+    JobWorkerPool,
+    ArchiveCompactor,
+    get_database,
+    CompressionMiddleware,
+    close_change_feed,
+    get_loop_monitor,
+    get_usage_recorder,
+)
+from routers import auth_router, food_router, entries_router, jobs_router, sync_router, admin_router
+from agents import close_food_agent_service, JOB_HANDLERS
 
 
 @asynccontextmanager
@@ -18,10 +32,31 @@ async def lifespan(app: FastAPI):
     """Application lifespan - startup and shutdown events."""
     # Startup
     print("Starting NutriTrack AI Backend...")
+    if get_settings().diagnostics:
+        get_loop_monitor().start()
     await connect_to_mongodb()
+    await ensure_job_indexes()
+    await run_migrations()
+    get_usage_recorder().start()
+    workers = None
+    if get_settings().parse_job_workers > 0:
+        workers = JobWorkerPool(JOB_HANDLERS, get_settings().parse_job_workers)
+        workers.start()
+    compactor = None
+    if get_settings().archive_after_months > 0:
+        compactor = ArchiveCompactor(get_database, get_settings().archive_after_months, get_settings().archive_interval_s)
+        compactor.start()
     yield
     # Shutdown
+    if workers is not None:
+        await workers.stop()
+    if compactor is not None:
+        await compactor.stop()
+    await close_change_feed()
+    await close_food_agent_service()
+    await get_usage_recorder().stop()
     await close_mongodb_connection()
+    await get_loop_monitor().stop()
     print("NutriTrack AI Backend stopped.")
 
 
@@ -40,12 +75,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+# Compress large responses (entry lists); ETag revalidation makes idle refreshes 304s
+if get_settings().response_compression:
+    app.add_middleware(CompressionMiddleware, minimum_size=get_settings().response_compression_min_size)
+
 # Include routers
 app.include_router(auth_router)
 app.include_router(food_router)
 app.include_router(entries_router)
+app.include_router(jobs_router)
+app.include_router(sync_router)
+app.include_router(admin_router)
 
 
 @app.get("/api/health")
@@ -69,6 +112,7 @@ async def root():
 
 
 if __name__ == "__main__":
+    # Development server with auto-reload; run `python serve.py` in production.
     import uvicorn
 
     port = int(os.getenv("PORT", 8000))
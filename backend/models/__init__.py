@@ -8,6 +8,8 @@ from .food import (
     FoodLogExtractionItem,
     ParseFoodLogRequest,
     ParseFoodLogResponse,
+    ReparseFoodLogRequest,
+    ParseJob,
     AnalyzeImageRequest,
     UserGoals,
     UserSettings,
@@ -28,6 +30,8 @@ __all__ = [
     "FoodLogExtractionItem",
     "ParseFoodLogRequest",
     "ParseFoodLogResponse",
+    "ReparseFoodLogRequest",
+    "ParseJob",
     "AnalyzeImageRequest",
     "UserGoals",
     "UserSettings",
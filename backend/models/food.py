@@ -50,6 +50,8 @@ class FoodLogExtractionItem(BaseModel):
     protein_g: Optional[float] = None
     carbs_g: Optional[float] = None
     fat_g: Optional[float] = None
+    # Model's estimate of the eaten weight, used to resolve counts against the nutrition database
+    grams: Optional[float] = None
 
 
 class FoodLogExtraction(BaseModel):
@@ -80,6 +82,24 @@ class ParseFoodLogResponse(BaseModel):
     confidence_score: float = 1.0
 
 
+class ReparseFoodLogRequest(ParseFoodLogRequest):
+    """Request to re-parse an edited food log; ``text`` is the edited log."""
+    previous_text: str
+    previous: ParseFoodLogResponse
+
+
+class ParseJob(BaseModel):
+    """Asynchronous parse job; ``result`` is set once ``status`` is "done"."""
+    id: str
+    kind: Literal["parse", "image"]
+    status: Literal["queued", "running", "done", "failed"]
+    result: Optional[ParseFoodLogResponse] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    created_at: datetime
+    updated_at: datetime
+
+
 class AnalyzeImageRequest(BaseModel):
     """Request to analyze a food image."""
     context: Optional[str] = ""
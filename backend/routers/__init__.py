@@ -3,5 +3,8 @@
 from .auth import router as auth_router
 from .food import router as food_router
 from .entries import router as entries_router
+from .jobs import router as jobs_router
+from .sync import router as sync_router
+from .admin import router as admin_router
 
-__all__ = ["auth_router", "food_router", "entries_router"]
+__all__ = ["auth_router", "food_router", "entries_router", "jobs_router", "sync_router", "admin_router"]
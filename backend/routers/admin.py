@@ -0,0 +1,84 @@
+"""Admin-only diagnostics and LLM usage API routes."""
+
+import asyncio
+import os
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import PlainTextResponse
+
+from services import (
+    get_admin_user,
+    get_database,
+    get_loop_monitor,
+    get_settings,
+    get_usage_recorder,
+    aggregate_usage,
+    day_range,
+    folded_text,
+    profile_stacks,
+    ProfilerBusy,
+    USAGE_GROUPS,
+)
+
+router = APIRouter(prefix="/api/admin", tags=["Admin"])
+
+
+@router.get("/loop")
+async def event_loop_stats(admin: dict = Depends(get_admin_user)):
+    """Event-loop lag of the worker that answers and its recent stalls (``DIAGNOSTICS=true``)."""
+    return {"pid": os.getpid(), **get_loop_monitor().stats()}
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(5.0, gt=0, description="How long to sample (capped by DIAGNOSTICS_PROFILE_MAX_S)"),
+    interval_ms: float = Query(5.0, ge=1, le=1000),
+    admin: dict = Depends(get_admin_user),
+):
+    """
+    Sample the stacks of every thread in the worker that answers.
+
+    Returns folded stacks ("thread;outer;...;inner count" per line) for
+    flamegraph.pl, inferno or speedscope. The worker keeps serving while it
+    is sampled; one profile runs at a time per worker.
+    """
+    duration = min(seconds, get_settings().diagnostics_profile_max_s)
+    try:
+        folded = await asyncio.to_thread(profile_stacks, duration, interval_ms / 1000)
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already running in this worker")
+    return PlainTextResponse(
+        folded_text(folded),
+        headers={"X-Worker-Pid": str(os.getpid()), "X-Profile-Samples": str(sum(folded.values()))},
+    )
+
+
+@router.get("/usage")
+async def llm_usage(
+    start: Optional[date] = Query(None, alias="from", description="First day (YYYY-MM-DD, UTC); default a week before `to`"),
+    end: Optional[date] = Query(None, alias="to", description="Last day, inclusive; default today"),
+    by: str = Query("day,model", description="Comma-separated groups: user, day, model, endpoint, cache"),
+    user_id: Optional[str] = Query(None, description="Only this user's usage"),
+    admin: dict = Depends(get_admin_user),
+):
+    """
+    LLM completions, tokens and cost, and parses answered from caches, per group.
+
+    Cost uses LLM_PRICES; tokens of models without a price are reported as
+    ``unpriced_tokens``. Rows without completions are parses that never
+    reached the LLM (``by=cache`` shows what answered them).
+    """
+    groups = [group.strip() for group in by.split(",") if group.strip()]
+    unknown = [group for group in groups if group not in USAGE_GROUPS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown group(s): {', '.join(unknown)}")
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=6)
+    if start > end:
+        raise HTTPException(status_code=400, detail="`from` is after `to`")
+    # Records still buffered in this worker are included; other workers flush within USAGE_FLUSH_INTERVAL_S.
+    await get_usage_recorder().flush()
+    first, last = day_range(start, end)
+    return await aggregate_usage(get_database(), first, last, groups, user_id)
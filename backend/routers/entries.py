@@ -1,19 +1,34 @@
 """Food entries CRUD API routes."""
 
-from typing import List
-from fastapi import APIRouter, HTTPException, Depends
+from datetime import date
+from typing import List, Literal, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
 
 from models import FoodEntry, UserGoals, UserSettings
 from services import (
     get_current_user,
     create_food_entry,
     get_food_entries,
+    iter_food_entries,
+    get_daily_totals,
     get_food_entry_by_id,
     delete_food_entry,
     get_user_goals,
     update_user_goals,
     get_user_settings,
     update_user_settings,
+    FastJSONResponse,
+    entries_view,
+    entry_projection,
+    entry_view,
+    cache_headers,
+    etag_matches,
+    make_etag,
+    not_modified,
+    MEDIA_TYPES,
+    export_chunks,
+    gzip_chunks,
 )
 
 router = APIRouter(prefix="/api", tags=["Entries"])
@@ -23,12 +38,33 @@ router = APIRouter(prefix="/api", tags=["Entries"])
 
 @router.get("/entries", response_model=List[FoodEntry])
 async def list_entries(
+    request: Request,
     limit: int = 100,
+    compact: bool = False,
+    start: Optional[date] = Query(None, alias="from", description="First day (YYYY-MM-DD)"),
+    end: Optional[date] = Query(None, alias="to", description="Last day, inclusive"),
+    meal: Optional[Literal["Breakfast", "Lunch", "Dinner", "Snack"]] = None,
+    q: Optional[str] = Query(None, max_length=100, description="Words that start item names"),
     current_user: dict = Depends(get_current_user),
 ):
-    """Get all food entries for the current user."""
-    entries = await get_food_entries(current_user["id"], limit=limit)
-    return entries
+    """Get the current user's latest food entries, optionally filtered by day range, meal and item names.
+
+    With ``compact=true`` null fields, ``user_id`` and ``image_base64`` are
+    left out of each entry. Answers ``304`` when ``If-None-Match`` is current.
+    """
+    etag = make_etag(current_user, "entries", f"{limit}|{compact}|{start}|{end}|{meal}|{q}")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    entries = await get_food_entries(
+        current_user["id"],
+        limit=limit,
+        projection=entry_projection(compact),
+        start=start,
+        end=end,
+        meal=meal,
+        text=q,
+    )
+    return FastJSONResponse(entries_view(entries, compact), headers=cache_headers(etag))
 
 
 @router.post("/entries", response_model=FoodEntry)
@@ -39,19 +75,68 @@ async def create_entry(
     """Create a new food entry."""
     entry_dict = entry.model_dump(exclude={"id", "user_id", "created_at", "updated_at"})
     created = await create_food_entry(current_user["id"], entry_dict)
-    return created
+    return FastJSONResponse(entry_view(created))
+
+
+@router.get("/entries/export")
+async def export_entries(
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    start: Optional[date] = Query(None, alias="from", description="First day (YYYY-MM-DD)"),
+    end: Optional[date] = Query(None, alias="to", description="Last day, inclusive"),
+    gzip: bool = False,
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Stream the user's food history, oldest first, as NDJSON or CSV.
+
+    Entries are read from a cursor in batches, so memory use does not grow
+    with the history. Images are left out. With ``gzip=true`` the download
+    is a ``.gz`` file.
+    """
+    entries = iter_food_entries(current_user["id"], start, end, projection={"image_base64": 0})
+    chunks = export_chunks(entries, fmt)
+    filename = f"food-entries.{fmt}"
+    media_type = MEDIA_TYPES[fmt]
+    if gzip:
+        chunks = gzip_chunks(chunks)
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/entries/summary")
+async def summarize_entries(
+    request: Request,
+    start: Optional[date] = Query(None, alias="from", description="First day (YYYY-MM-DD)"),
+    end: Optional[date] = Query(None, alias="to", description="Last day, inclusive"),
+    current_user: dict = Depends(get_current_user),
+):
+    """Nutrient totals and entry counts per day, archived months included."""
+    etag = make_etag(current_user, "entries", f"summary|{start}|{end}")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    days = await get_daily_totals(current_user["id"], start, end)
+    return FastJSONResponse(days, headers=cache_headers(etag))
 
 
 @router.get("/entries/{entry_id}", response_model=FoodEntry)
 async def get_entry(
     entry_id: str,
+    request: Request,
     current_user: dict = Depends(get_current_user),
 ):
     """Get a specific food entry."""
+    etag = make_etag(current_user, "entries", entry_id)
+    if etag_matches(request, etag):
+        return not_modified(etag)
     entry = await get_food_entry_by_id(entry_id, current_user["id"])
     if not entry:
         raise HTTPException(status_code=404, detail="Entry not found")
-    return entry
+    return FastJSONResponse(entry_view(entry), headers=cache_headers(etag))
 
 
 @router.delete("/entries/{entry_id}")
@@ -69,9 +154,17 @@ async def remove_entry(
 # ============ Goals ============
 
 @router.get("/goals", response_model=UserGoals)
-async def get_goals(current_user: dict = Depends(get_current_user)):
+async def get_goals(
+    request: Request,
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+):
     """Get user's nutritional goals."""
+    etag = make_etag(current_user, "goals")
+    if etag_matches(request, etag):
+        return not_modified(etag)
     goals = await get_user_goals(current_user["id"])
+    response.headers.update(cache_headers(etag))
     return goals
 
 
@@ -89,9 +182,17 @@ async def set_goals(
 # ============ Settings ============
 
 @router.get("/settings", response_model=UserSettings)
-async def get_settings(current_user: dict = Depends(get_current_user)):
+async def get_settings(
+    request: Request,
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+):
     """Get user's app settings."""
+    etag = make_etag(current_user, "settings")
+    if etag_matches(request, etag):
+        return not_modified(etag)
     settings = await get_user_settings(current_user["id"])
+    response.headers.update(cache_headers(etag))
     return settings
 
 
@@ -2,25 +2,77 @@
 
 import base64
 from datetime import datetime
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends
-
-from models import ParseFoodLogRequest, ParseFoodLogResponse
-from agents import get_food_agent, extraction_to_response
-from services import get_current_user
+from typing import Optional
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends, Header, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from models import ParseFoodLogRequest, ParseFoodLogResponse, ReparseFoodLogRequest, ParseJob
+from agents import get_food_agent, build_parse_response, LLMUnavailableError
+from services import (
+    enqueue_job,
+    admit_draft_request,
+    admit_parse_request,
+    admission_rejected,
+    parse_barcode_log,
+    AdmissionRejected,
+)
 
 router = APIRouter(prefix="/api", tags=["Food Analysis"])
 
 
-@router.post("/parse-food-log", response_model=ParseFoodLogResponse)
+def llm_unavailable(error: LLMUnavailableError) -> HTTPException:
+    """503 with Retry-After when no LLM provider can take the request."""
+    return HTTPException(
+        status_code=503,
+        detail=f"Food analysis is temporarily unavailable: {str(error)}",
+        headers={"Retry-After": str(max(1, int(round(error.retry_after_s))))},
+    )
+
+
+def wants_async(async_param: bool, prefer: Optional[str]) -> bool:
+    """Async mode via ``?async=true`` or ``Prefer: respond-async`` (RFC 7240)."""
+    return async_param or (prefer is not None and "respond-async" in prefer.lower())
+
+
+async def accepted_job(user_id: str, kind: str, payload: dict) -> JSONResponse:
+    """Enqueue a parse job and answer 202 with its id and polling URL."""
+    job = await enqueue_job(user_id, kind, payload)
+    status_url = f"/api/jobs/{job['id']}"
+    return JSONResponse(
+        status_code=202,
+        content=jsonable_encoder(ParseJob(**job)),
+        headers={"Location": status_url, "Retry-After": "1"},
+    )
+
+
+@router.post(
+    "/parse-food-log",
+    response_model=ParseFoodLogResponse,
+    responses={202: {"model": ParseJob, "description": "Queued (async mode); poll /api/jobs/{id}"}},
+)
 async def parse_food_log(
     request: ParseFoodLogRequest,
-    current_user: dict = Depends(get_current_user),
+    async_mode: bool = Query(False, alias="async"),
+    prefer: Optional[str] = Header(None),
+    current_user: dict = Depends(admit_parse_request),
 ):
     """
     Parse a natural language food log entry.
 
     Example: "I had 2 eggs and toast for breakfast"
+
+    With ``?async=true`` (or ``Prefer: respond-async``) the parse is queued
+    and a 202 with the job id is returned immediately. Barcodes are always
+    answered inline from the local product index.
     """
+    if wants_async(async_mode, prefer) and parse_barcode_log(request.text) is None:
+        return await accepted_job(current_user["id"], "parse", {
+            "text": request.text,
+            "current_datetime": request.current_datetime or datetime.now().isoformat(),
+            "timezone": request.timezone or "UTC",
+        })
+
     try:
         agent = get_food_agent()
 
@@ -34,12 +86,17 @@ async def parse_food_log(
             text=request.text,
             current_datetime=current_datetime,
             timezone=request.timezone or "UTC",
+            user_id=current_user["id"],
         )
 
         # Convert to response with nutrition
-        response = extraction_to_response(extraction)
+        response = await build_parse_response(extraction)
         return response
 
+    except LLMUnavailableError as e:
+        raise llm_unavailable(e)
+    except AdmissionRejected as e:
+        raise admission_rejected(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -47,18 +104,96 @@ async def parse_food_log(
         )
 
 
-@router.post("/analyze-food-image", response_model=ParseFoodLogResponse)
+@router.post(
+    "/parse-food-log/draft",
+    response_model=ParseFoodLogResponse,
+    responses={204: {"description": "Nothing could be parsed cheaply yet"}},
+)
+async def draft_food_log(
+    request: ParseFoodLogRequest,
+    current_user: dict = Depends(admit_draft_request),
+):
+    """
+    Parse a food log the user is still typing, at the lowest priority.
+
+    Call it with debounced partial text; the result is cached so that
+    ``/api/parse-food-log`` with the same text answers at once. Only the
+    food memory and caches are used unless an LLM slot is free right now.
+    Answers 204 when nothing could be parsed yet.
+    """
+    try:
+        extraction = await get_food_agent().draft_parse(
+            text=request.text,
+            current_datetime=request.current_datetime or datetime.now().isoformat(),
+            timezone=request.timezone or "UTC",
+            user_id=current_user["id"],
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to parse food log: {str(e)}"
+        )
+    if extraction is None:
+        return Response(status_code=204)
+    return await build_parse_response(extraction)
+
+
+@router.post("/parse-food-log/edit", response_model=ParseFoodLogResponse)
+async def reparse_food_log(
+    request: ReparseFoodLogRequest,
+    current_user: dict = Depends(admit_parse_request),
+):
+    """
+    Re-parse a food log the user edited after parsing it.
+
+    Send the edited ``text`` with the ``previous_text`` and the ``previous``
+    response. Foods the edit left alone keep their previous values (scaled
+    when only the quantity changed, e.g. "2 eggs" to "3 eggs"); only new or
+    changed foods are parsed.
+    """
+    try:
+        agent = get_food_agent()
+        extraction = await agent.reparse_text(
+            text=request.text,
+            previous_text=request.previous_text,
+            previous=request.previous,
+            current_datetime=request.current_datetime or datetime.now().isoformat(),
+            timezone=request.timezone or "UTC",
+            user_id=current_user["id"],
+        )
+        return await build_parse_response(extraction)
+
+    except LLMUnavailableError as e:
+        raise llm_unavailable(e)
+    except AdmissionRejected as e:
+        raise admission_rejected(e)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to parse food log: {str(e)}"
+        )
+
+
+@router.post(
+    "/analyze-food-image",
+    response_model=ParseFoodLogResponse,
+    responses={202: {"model": ParseJob, "description": "Queued (async mode); poll /api/jobs/{id}"}},
+)
 async def analyze_food_image(
     image: UploadFile = File(...),
     context: str = Form(""),
     current_datetime: str = Form(None),
     timezone: str = Form("UTC"),
-    current_user: dict = Depends(get_current_user),
+    async_mode: bool = Query(False, alias="async"),
+    prefer: Optional[str] = Header(None),
+    current_user: dict = Depends(admit_parse_request),
 ):
     """
     Analyze a food image and identify items.
 
-    Upload a JPEG/PNG image of food to get nutrition analysis.
+    Upload a JPEG/PNG image of food to get nutrition analysis. With
+    ``?async=true`` (or ``Prefer: respond-async``) the analysis is queued
+    and a 202 with the job id is returned immediately.
     """
     # Validate file type
     if image.content_type not in ["image/jpeg", "image/png", "image/webp"]:
@@ -72,6 +207,14 @@ async def analyze_food_image(
         contents = await image.read()
         image_base64 = base64.b64encode(contents).decode("utf-8")
 
+        if wants_async(async_mode, prefer):
+            return await accepted_job(current_user["id"], "image", {
+                "image_base64": image_base64,
+                "context": context,
+                "current_datetime": current_datetime or datetime.now().isoformat(),
+                "timezone": timezone,
+            })
+
         agent = get_food_agent()
 
         # Use current time if not provided
@@ -84,15 +227,20 @@ async def analyze_food_image(
             context=context,
             current_datetime=current_datetime,
             timezone=timezone,
+            user_id=current_user["id"],
         )
 
         # Mark items as from image
-        response = extraction_to_response(extraction)
+        response = await build_parse_response(extraction)
         for item in response.items:
             item.source = "image"
 
         return response
 
+    except LLMUnavailableError as e:
+        raise llm_unavailable(e)
+    except AdmissionRejected as e:
+        raise admission_rejected(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
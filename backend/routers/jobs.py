@@ -0,0 +1,30 @@
+"""Asynchronous parse job API routes."""
+
+from fastapi import APIRouter, HTTPException, Depends, Query
+
+from models import ParseJob
+from services import get_current_user, get_job, wait_for_job, get_settings
+
+router = APIRouter(prefix="/api", tags=["Jobs"])
+
+
+@router.get("/jobs/{job_id}", response_model=ParseJob)
+async def get_parse_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, description="Seconds to long-poll for the job to finish"),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Get the status (and, once done, the result) of a queued parse job.
+
+    With ``wait`` the request is held until the job finishes or the wait
+    elapses (capped by PARSE_JOB_MAX_WAIT_S), so clients need not poll.
+    """
+    if wait > 0:
+        timeout = min(wait, get_settings().parse_job_max_wait_s)
+        job = await wait_for_job(job_id, current_user["id"], timeout)
+    else:
+        job = await get_job(job_id, current_user["id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -0,0 +1,85 @@
+"""Real-time sync API routes (WebSocket and Server-Sent Events)."""
+
+import asyncio
+
+from fastapi import APIRouter, Depends, Request, WebSocket
+from fastapi.responses import StreamingResponse
+
+from services import (
+    get_current_user,
+    get_user_by_id,
+    decode_token,
+    get_database,
+    get_settings,
+    get_change_feed,
+    dumps,
+)
+
+router = APIRouter(prefix="/api", tags=["Sync"])
+
+PING = {"type": "ping"}
+
+
+def _hello(user: dict) -> dict:
+    """First message: the data versions the client's ETags can be compared against."""
+    return {"type": "hello", "versions": user.get("data_versions") or {}}
+
+
+@router.websocket("/sync")
+async def sync_socket(websocket: WebSocket, token: str = ""):
+    """
+    Push entry, goal and settings deltas to a connected device.
+
+    The access token is passed as ``?token=`` because browsers cannot set
+    headers on WebSocket requests. Messages are JSON objects (see
+    ``services/sync.py``); a ``ping`` is sent after ``SYNC_HEARTBEAT_S`` idle
+    seconds.
+    """
+    user_id = decode_token(token) if token else None
+    user = await get_user_by_id(user_id) if user_id else None
+    if user is None:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+
+    feed = get_change_feed()
+    sub = feed.subscribe(user["id"], get_database())
+    heartbeat = get_settings().sync_heartbeat_s
+
+    async def push():
+        await websocket.send_text(dumps(_hello(user)).decode())
+        while True:
+            event = await sub.get(heartbeat)
+            await websocket.send_text(dumps(event or PING).decode())
+
+    sender = asyncio.create_task(push())
+    try:
+        # Clients only listen; reading here notices the disconnect at once.
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        sender.cancel()
+        feed.unsubscribe(sub)
+
+
+@router.get("/sync/events")
+async def sync_events(current_user: dict = Depends(get_current_user)):
+    """The same deltas as ``/api/sync`` as a ``text/event-stream``."""
+    feed = get_change_feed()
+    sub = feed.subscribe(current_user["id"], get_database())
+    heartbeat = get_settings().sync_heartbeat_s
+
+    async def stream():
+        try:
+            yield b"data: " + dumps(_hello(current_user)) + b"\n\n"
+            while True:
+                event = await sub.get(heartbeat)
+                yield b"data: " + dumps(event) + b"\n\n" if event is not None else b": ping\n\n"
+        finally:
+            feed.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,135 @@
+"""Production launcher: pre-forked workers sharing one preloaded app.
+
+    python serve.py [--workers N] [--host 0.0.0.0] [--port 8000]
+
+The parent imports the app and every dependency the app imports lazily,
+binds the listening socket and then forks the workers. A worker starts
+from the parent's already-imported modules (shared copy-on-write) and only
+runs the app's startup, so adding or replacing a worker takes milliseconds
+instead of a fresh interpreter start. There is no reloader; a worker that
+exits unexpectedly is replaced, and SIGTERM/SIGINT stop all workers
+gracefully.
+
+For development use ``python main.py`` (auto-reload).
+"""
+
+import argparse
+import importlib
+import os
+import signal
+import socket
+import time
+import traceback
+from typing import Dict
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Imported on first use by the app (or by uvicorn's event loop setup); loaded once here,
+# before forking, so workers share them.
+PRELOAD_MODULES = ("motor.motor_asyncio", "jose.jwt", "bcrypt", "groq", "uvloop")
+
+
+def preload():
+    """Import the app and its lazily imported dependencies; returns the app."""
+    from main import app
+
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    return app
+
+
+def bind(host: str, port: int) -> socket.socket:
+    """The listening socket every worker accepts on."""
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def serve(app, sock: socket.socket, workers: int) -> None:
+    """Fork ``workers`` processes serving ``app`` on ``sock`` and keep them running."""
+    import uvicorn
+
+    # Loading the config imports the protocol implementations; do it once, before forking.
+    config = uvicorn.Config(app, lifespan="on")
+    config.load()
+    children: Dict[int, float] = {}
+    stopping = False
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            # Own process group: a terminal Ctrl-C reaches the parent only, which forwards it once.
+            os.setpgid(0, 0)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                uvicorn.Server(config).run(sockets=[sock])
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"[Serve] Starting {workers} worker(s) on {sock.getsockname()[:2]}")
+    for _ in range(workers):
+        spawn()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        print(f"[Serve] Worker {pid} exited with {os.waitstatus_to_exitcode(status)}; starting a new one")
+        if time.monotonic() - started < 1.0:
+            time.sleep(1.0)  # don't spin on a worker that crashes at startup
+        spawn()
+    print("[Serve] Stopped.")
+
+
+def main():
+    from services import get_settings
+
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Run the API with pre-forked, preloaded workers.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", settings.port)))
+    parser.add_argument("--workers", type=int, default=settings.web_concurrency or os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        # No fork (Windows): uvicorn's spawned workers each import the app themselves.
+        import uvicorn
+
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+        return
+    app = preload()
+    serve(app, bind(args.host, args.port), max(1, args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,19 +10,70 @@ from .mongodb import (
     get_user_by_id,
     create_food_entry,
     get_food_entries,
+    iter_food_entries,
+    get_daily_totals,
     get_food_entry_by_id,
     delete_food_entry,
+    record_food_memory,
+    get_food_memory,
     get_user_goals,
     update_user_goals,
     get_user_settings,
     update_user_settings,
+    bump_data_version,
 )
+from .food_memory import FoodMemory, parse_meal_reference
+from .nutrition_db import FoodRecord, NutritionDatabase, ResolvedNutrients, get_nutrition_db
+from .barcodes import BarcodeIndex, get_barcode_index, parse_barcode_log
+from .jobs import (
+    JobWorkerPool,
+    RetryJob,
+    ensure_job_indexes,
+    enqueue_job,
+    get_job,
+    wait_for_job,
+)
+from .admission import (
+    INTERACTIVE,
+    BULK,
+    SPECULATIVE,
+    AdmissionRejected,
+    PriorityGate,
+    UserLimiter,
+    admission_rejected,
+    admit_draft_request,
+    admit_parse_request,
+    get_llm_gate,
+    llm_slot,
+    request_priority,
+    request_user,
+)
+from .rate_limit import TokenBucket
+from .serialization import FastJSONResponse, dumps, entries_view, entry_projection, entry_view
+from .http_cache import cache_headers, etag_matches, make_etag, not_modified
+from .compression import CompressionMiddleware
+from .sync import ChangeFeed, close_change_feed, get_change_feed
+from .migrations import run_migrations
+from .archive import ArchiveCompactor, compact_archives
+from .export import EXPORT_FORMATS, MEDIA_TYPES, export_chunks, gzip_chunks
+from .usage import (
+    USAGE_GROUPS,
+    UsageRecorder,
+    aggregate_usage,
+    day_range,
+    get_usage_recorder,
+    note_cache,
+    record_completion,
+    usage_scope,
+)
+from .diagnostics import LoopLagMonitor, ProfilerBusy, folded_text, get_loop_monitor, profile_stacks
 from .auth import (
     hash_password,
     verify_password,
     create_access_token,
     decode_token,
     get_current_user,
+    get_admin_user,
     authenticate_user,
 )
 
@@ -37,16 +88,84 @@ __all__ = [
     "get_user_by_id",
     "create_food_entry",
     "get_food_entries",
+    "iter_food_entries",
+    "get_daily_totals",
     "get_food_entry_by_id",
     "delete_food_entry",
+    "record_food_memory",
+    "get_food_memory",
     "get_user_goals",
     "update_user_goals",
     "get_user_settings",
     "update_user_settings",
+    "bump_data_version",
+    "FoodMemory",
+    "parse_meal_reference",
+    "FoodRecord",
+    "NutritionDatabase",
+    "ResolvedNutrients",
+    "get_nutrition_db",
+    "BarcodeIndex",
+    "get_barcode_index",
+    "parse_barcode_log",
+    "JobWorkerPool",
+    "RetryJob",
+    "ensure_job_indexes",
+    "enqueue_job",
+    "get_job",
+    "wait_for_job",
+    "INTERACTIVE",
+    "BULK",
+    "SPECULATIVE",
+    "AdmissionRejected",
+    "PriorityGate",
+    "UserLimiter",
+    "admission_rejected",
+    "admit_draft_request",
+    "admit_parse_request",
+    "get_llm_gate",
+    "llm_slot",
+    "request_priority",
+    "request_user",
+    "TokenBucket",
+    "FastJSONResponse",
+    "dumps",
+    "entries_view",
+    "entry_projection",
+    "entry_view",
+    "cache_headers",
+    "etag_matches",
+    "make_etag",
+    "not_modified",
+    "CompressionMiddleware",
+    "ChangeFeed",
+    "close_change_feed",
+    "get_change_feed",
+    "run_migrations",
+    "ArchiveCompactor",
+    "compact_archives",
+    "EXPORT_FORMATS",
+    "MEDIA_TYPES",
+    "export_chunks",
+    "gzip_chunks",
+    "USAGE_GROUPS",
+    "UsageRecorder",
+    "aggregate_usage",
+    "day_range",
+    "get_usage_recorder",
+    "note_cache",
+    "record_completion",
+    "usage_scope",
+    "LoopLagMonitor",
+    "ProfilerBusy",
+    "folded_text",
+    "get_loop_monitor",
+    "profile_stacks",
     "hash_password",
     "verify_password",
     "create_access_token",
     "decode_token",
     "get_current_user",
+    "get_admin_user",
     "authenticate_user",
 ]
@@ -0,0 +1,363 @@
+"""Admission control for LLM-bound work.
+
+Two layers keep one user (or a buggy client retrying in a loop) from
+degrading everyone else:
+
+- per user, at the HTTP edge: a token bucket and a cap on concurrent
+  parse requests; over the limit is an immediate 429 with Retry-After
+- globally, around each LLM call: at most ``max_inflight`` calls run at
+  once, the rest wait in a bounded priority queue (interactive requests
+  before bulk/async jobs, users served in turn within a priority) with a
+  per-priority queue-time deadline. Work
+  that cannot start before its deadline is shed at once rather than left
+  to time out, and surfaces as 503 with Retry-After.
+
+Speculative work (draft parses while the user types) has the lowest
+priority and a zero deadline: it only gets an LLM slot that is free right
+now, and is rate limited separately so drafts never use up a user's parse
+budget.
+"""
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Optional
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials
+
+from .auth import decode_token, get_current_user, security
+from .cache import TTLCache
+from .config import get_settings
+from .rate_limit import TokenBucket
+
+INTERACTIVE = 0
+BULK = 1
+SPECULATIVE = 2
+
+# Priority of the LLM work done by the current task; job workers set BULK.
+request_priority: ContextVar[int] = ContextVar("request_priority", default=INTERACTIVE)
+# User the current task's LLM work is for, so the global queue can take turns between users.
+request_user: ContextVar[Optional[str]] = ContextVar("request_user", default=None)
+
+
+class AdmissionRejected(Exception):
+    """LLM work was shed because the queue is full or could not start in time."""
+
+    def __init__(self, message: str, retry_after_s: float = 1.0):
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
+
+def _retry_after_header(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, int(math.ceil(seconds))))}
+
+
+# ============ Per-User Limits ============
+
+class UserLimiter:
+    """Per-user request rate (token bucket) and concurrency limits."""
+
+    def __init__(self, rate_per_min: float, burst: int, max_concurrency: int):
+        self.rate_per_s = rate_per_min / 60.0
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        # Idle users' buckets are refilled anyway, so forgetting them is harmless.
+        self._buckets = TTLCache(max_entries=100_000, ttl_s=3600)
+        self._inflight: Dict[str, int] = {}
+
+    def admit(self, user_id: str) -> None:
+        """Count a request against the user's limits; raises 429 when over them."""
+        if self._inflight.get(user_id, 0) >= self.max_concurrency:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Too many concurrent requests (limit {self.max_concurrency})",
+                headers=_retry_after_header(1),
+            )
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self.rate_per_s, self.burst)
+            self._buckets.set(user_id, bucket)
+        if not bucket.try_acquire():
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded",
+                headers=_retry_after_header(bucket.wait_time()),
+            )
+        self._inflight[user_id] = self._inflight.get(user_id, 0) + 1
+
+    def release(self, user_id: str) -> None:
+        remaining = self._inflight.get(user_id, 0) - 1
+        if remaining > 0:
+            self._inflight[user_id] = remaining
+        else:
+            self._inflight.pop(user_id, None)
+
+
+# ============ Global Priority Queue ============
+
+class _Waiter:
+    __slots__ = ("priority", "user", "future")
+
+    def __init__(self, priority: int, user: Optional[str], future: asyncio.Future):
+        self.priority = priority
+        self.user = user
+        self.future = future
+
+
+class PriorityGate:
+    """At most ``max_inflight`` holders; waiters served by priority, then round-robin across users.
+
+    Each priority has one FIFO queue per user, and a freed slot goes to the
+    next user in turn, so a user with many queued calls waits behind their
+    own calls rather than pushing everyone else back.
+    """
+
+    def __init__(self, max_inflight: int, max_queue: int, deadlines_s: Dict[int, float]):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.deadlines_s = deadlines_s
+        self.inflight = 0
+        self.shed = 0
+        # priority -> user -> that user's waiters, oldest first; users in turn order
+        self._queues: Dict[int, "OrderedDict[Optional[str], Deque[_Waiter]]"] = {}
+        self._queued = 0  # entries in the queues, including abandoned ones
+        self._waiting = 0
+        self._service_time_s = 1.0  # EWMA of how long a slot is held
+
+    def estimated_wait(self, ahead: int) -> float:
+        """Rough seconds until a slot frees up for a waiter with ``ahead`` waiters in front."""
+        return (ahead + 1) * self._service_time_s / max(1, self.max_inflight)
+
+    def _ahead_of(self, priority: int, user: Optional[str]) -> int:
+        ahead = 0
+        for level, users in self._queues.items():
+            if level < priority:
+                ahead += sum(_live(q) for q in users.values())
+            elif level == priority:
+                # Round-robin: every other user gets one turn per turn of this user's.
+                turns = _live(users.get(user, ())) + 1
+                ahead += sum(min(_live(q), turns) for u, q in users.items() if u != user) + turns - 1
+        return ahead
+
+    async def acquire(self, priority: int = INTERACTIVE, user: Optional[str] = None) -> None:
+        """Wait for a slot; raises ``AdmissionRejected`` if it cannot be had in time."""
+        if self.inflight < self.max_inflight and self._waiting == 0:
+            self.inflight += 1
+            return
+
+        deadline = self.deadlines_s.get(priority, self.deadlines_s[INTERACTIVE])
+        ahead = self._ahead_of(priority, user)
+        estimate = self.estimated_wait(ahead)
+        if estimate > deadline:
+            self.shed += 1
+            raise AdmissionRejected("LLM queue wait exceeds the deadline", retry_after_s=estimate)
+        if self._waiting >= self.max_queue and not self._evict_lower_than(priority):
+            self.shed += 1
+            raise AdmissionRejected("LLM queue is full", retry_after_s=estimate)
+
+        if self._queued > 2 * self.max_queue:
+            self._drop_abandoned()
+        waiter = _Waiter(priority, user, asyncio.get_running_loop().create_future())
+        self._queues.setdefault(priority, OrderedDict()).setdefault(user, deque()).append(waiter)
+        self._queued += 1
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=deadline)
+        except asyncio.TimeoutError:
+            self.shed += 1
+            raise AdmissionRejected("Timed out waiting for an LLM slot", retry_after_s=self.estimated_wait(ahead))
+        finally:
+            if not waiter.future.done():
+                waiter.future.cancel()
+                self._waiting -= 1
+            elif waiter.future.exception() is None and asyncio.current_task().cancelling():
+                # Granted a slot just as we were cancelled: pass it on.
+                self.release()
+
+    def _drop_abandoned(self) -> None:
+        """Drop waiters left behind by timeouts."""
+        for level in list(self._queues):
+            users = self._queues[level]
+            for user in list(users):
+                live = deque(w for w in users[user] if not w.future.done())
+                if live:
+                    users[user] = live
+                else:
+                    del users[user]
+            if not users:
+                del self._queues[level]
+        self._queued = self._waiting
+
+    def _evict_lower_than(self, priority: int) -> bool:
+        """Reject the newest waiter of the user queueing most at the lowest priority below ``priority``."""
+        for level in sorted((p for p in self._queues if p > priority), reverse=True):
+            users = self._queues[level]
+            live = {user: _live(q) for user, q in users.items()}
+            user = max(live, key=live.get, default=None)
+            if user is None or live[user] == 0:
+                continue
+            queue = users[user]
+            while queue:
+                victim = queue.pop()
+                self._queued -= 1
+                if not victim.future.done():
+                    break
+            if not queue:
+                del users[user]
+            victim.future.set_exception(AdmissionRejected(
+                "Displaced by higher-priority work",
+                retry_after_s=self.estimated_wait(self._waiting),
+            ))
+            self._waiting -= 1
+            self.shed += 1
+            return True
+        return False
+
+    def release(self, held_s: Optional[float] = None) -> None:
+        """Free a slot, handing it straight to the next waiter."""
+        if held_s is not None:
+            self._service_time_s += 0.1 * (held_s - self._service_time_s)
+        for level in sorted(self._queues):
+            users = self._queues[level]
+            while users:
+                user, queue = next(iter(users.items()))
+                waiter = queue.popleft()
+                self._queued -= 1
+                if queue:
+                    users.move_to_end(user)  # this user's next waiter goes to the back of the line
+                else:
+                    del users[user]
+                if not waiter.future.done():
+                    self._waiting -= 1
+                    waiter.future.set_result(None)  # slot transfers; inflight unchanged
+                    return
+        self.inflight -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[int] = None):
+        await self.acquire(request_priority.get() if priority is None else priority, request_user.get())
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def stats(self) -> dict:
+        return {
+            "inflight": self.inflight,
+            "waiting": self._waiting,
+            "shed": self.shed,
+            "service_time_s": round(self._service_time_s, 3),
+        }
+
+
+def _live(queue) -> int:
+    return sum(1 for w in queue if not w.future.done())
+
+
+# ============ Singletons ============
+
+_user_limiter: Optional[UserLimiter] = None
+_draft_limiter: Optional[UserLimiter] = None
+_llm_gate: Optional[PriorityGate] = None
+
+
+def get_user_limiter() -> UserLimiter:
+    global _user_limiter
+    if _user_limiter is None:
+        settings = get_settings()
+        _user_limiter = UserLimiter(
+            settings.admission_user_rate_per_min,
+            settings.admission_user_burst,
+            settings.admission_user_max_concurrency,
+        )
+    return _user_limiter
+
+
+def get_draft_limiter() -> UserLimiter:
+    global _draft_limiter
+    if _draft_limiter is None:
+        settings = get_settings()
+        _draft_limiter = UserLimiter(
+            settings.admission_draft_rate_per_min,
+            settings.admission_draft_burst,
+            1,
+        )
+    return _draft_limiter
+
+
+def get_llm_gate() -> PriorityGate:
+    global _llm_gate
+    if _llm_gate is None:
+        settings = get_settings()
+        _llm_gate = PriorityGate(
+            settings.admission_llm_max_inflight,
+            settings.admission_llm_queue_size,
+            {
+                INTERACTIVE: settings.admission_interactive_deadline_s,
+                BULK: settings.admission_bulk_deadline_s,
+                SPECULATIVE: 0.0,
+            },
+        )
+    return _llm_gate
+
+
+@asynccontextmanager
+async def llm_slot():
+    """Hold a global LLM slot at the current task's priority (no-op when admission is off)."""
+    if not get_settings().admission_control:
+        if request_priority.get() == SPECULATIVE:
+            # Without the gate there is no way to tell that the LLM is idle.
+            raise AdmissionRejected("Speculative LLM work needs admission control")
+        yield
+        return
+    async with get_llm_gate().slot():
+        yield
+
+
+@asynccontextmanager
+async def _admitted(credentials: HTTPAuthorizationCredentials, limiter: UserLimiter):
+    user_id = decode_token(credentials.credentials)
+    if user_id is None:
+        yield await get_current_user(credentials)  # raises 401
+        return
+    limiter.admit(user_id)
+    try:
+        yield await get_current_user(credentials)
+    finally:
+        limiter.release(user_id)
+
+
+async def admit_parse_request(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Dependency applying the per-user limits to an LLM-bound endpoint; yields the current user.
+
+    Limits are checked on the signed token's user id before the user is
+    loaded, so a rejected request costs no database round trip.
+    """
+    if not get_settings().admission_control:
+        yield await get_current_user(credentials)
+        return
+    async with _admitted(credentials, get_user_limiter()) as user:
+        yield user
+
+
+async def admit_draft_request(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Like ``admit_parse_request`` with the draft limits: one draft at a time per user."""
+    if not get_settings().admission_control:
+        yield await get_current_user(credentials)
+        return
+    async with _admitted(credentials, get_draft_limiter()) as user:
+        yield user
+
+
+def admission_rejected(error: AdmissionRejected) -> HTTPException:
+    """503 with Retry-After for shed LLM work."""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=f"Server is busy: {str(error)}",
+        headers=_retry_after_header(error.retry_after_s),
+    )
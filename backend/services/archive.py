@@ -0,0 +1,424 @@
+"""Tiered storage: old food entries rolled into per-user per-month buckets.
+
+Entries logged before the last ``ARCHIVE_AFTER_MONTHS`` calendar months move
+from ``food_entries`` to ``food_entry_archive``. Each bucket holds one user's
+entries for one month (split into ``seq`` chunks of at most
+``MAX_BUCKET_ENTRIES``) as columns: one per entry field with a value per
+entry, and one per item field over all the month's items. Numbers are
+packed little-endian float64 blobs, timestamps int64 milliseconds. Times and
+texts are one zlib-compressed blob per column plus each value's byte length. Units, sources, meals and item
+names are dictionary-encoded (a list of distinct values plus uint16 codes).
+Field names
+are stored once per bucket rather than once per entry and item. Besides
+``_id``, the archive has one index key per bucket and one per entry id,
+instead of the four entry indexes. Entries with an image stay in
+``food_entries``, so a bucket stays far below the document size limit.
+
+Reads (``get_food_entries``, the export, daily totals, lookups and deletes
+by id) merge the hot collection with the buckets, and the entry dicts they
+return look the same either way. Compaction is idempotent: a bucket is
+rebuilt from its old contents plus the new entries, deduplicated by id, and
+only then are the hot copies deleted. A crash in between leaves duplicates,
+which reads drop (the hot copy wins) and the next run removes.
+"""
+
+import asyncio
+import os
+import re
+import socket
+import zlib
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from bson import Binary, ObjectId
+
+MAX_BUCKET_ENTRIES = 1000
+NUTRIENTS = ("calories", "protein_g", "carbs_g", "fat_g")
+ENTRY_COLUMNS = ("id", "logged_at", "meal_label", "raw_text", "created_at", "updated_at", "item_count")
+ITEM_COLUMNS = ("name", "quantity", "unit", *NUTRIENTS, "source", "confidence")
+# Column encodings (anything else is a plain array).
+NUMERIC_COLUMNS = {"item_count", "quantity", "confidence", *NUTRIENTS}
+DICTIONARY_COLUMNS = {"meal_label", "name", "unit", "source"}
+TEXT_COLUMNS = {"logged_at", "raw_text"}
+TIME_COLUMNS = {"created_at", "updated_at"}
+_NO_TIME = np.iinfo(np.int64).min
+_EPOCH = datetime(1970, 1, 1)
+_TERM_RE = re.compile(r"\w+")
+
+
+# ============ Bucket Codec ============
+
+def _encode_column(name: str, values: list):
+    if name in NUMERIC_COLUMNS:
+        packed = np.array([np.nan if v is None else v for v in values], dtype="<f8")
+        return Binary(packed.tobytes())
+    if name in DICTIONARY_COLUMNS:
+        distinct = list(dict.fromkeys(values))
+        index = {value: code for code, value in enumerate(distinct)}
+        codes = np.array([index[v] for v in values], dtype="<u2")
+        return {"values": distinct, "codes": Binary(codes.tobytes())}
+    if name in TEXT_COLUMNS:
+        # Texts are user input and may hold any character, so the blob is
+        # split by byte lengths rather than a separator; -1 marks ``None``.
+        encoded = [None if v is None else v.encode("utf-8") for v in values]
+        lengths = np.array([-1 if b is None else len(b) for b in encoded], dtype="<i4")
+        return {
+            "text": Binary(zlib.compress(b"".join(b for b in encoded if b is not None))),
+            "lengths": Binary(lengths.tobytes()),
+        }
+    if name in TIME_COLUMNS:
+        millis = [_NO_TIME if v is None else (v - _EPOCH) // timedelta(milliseconds=1) for v in values]
+        return Binary(np.array(millis, dtype="<i8").tobytes())
+    return values
+
+
+def _decode_column(name: str, column) -> list:
+    if name in NUMERIC_COLUMNS:
+        values = np.frombuffer(column, dtype="<f8")
+        return [None if np.isnan(v) else float(v) for v in values]
+    if name in DICTIONARY_COLUMNS:
+        distinct = column["values"]
+        return [distinct[code] for code in np.frombuffer(column["codes"], dtype="<u2").tolist()]
+    if name in TEXT_COLUMNS:
+        if not isinstance(column, dict):
+            # Buckets written before lengths were stored: NUL-separated.
+            return zlib.decompress(column).decode("utf-8").split("\0")
+        blob = zlib.decompress(column["text"])
+        texts, start = [], 0
+        for length in np.frombuffer(column["lengths"], dtype="<i4").tolist():
+            if length < 0:
+                texts.append(None)
+                continue
+            texts.append(blob[start:start + length].decode("utf-8"))
+            start += length
+        return texts
+    if name in TIME_COLUMNS:
+        millis = np.frombuffer(column, dtype="<i8").tolist()
+        return [None if ms == _NO_TIME else _EPOCH + timedelta(milliseconds=ms) for ms in millis]
+    return column
+
+
+def month_of(logged_at: str) -> str:
+    """``YYYY-MM`` of an ISO ``logged_at``."""
+    return logged_at[:7]
+
+
+def encode_bucket(user_id: str, month: str, seq: int, entries: List[dict]) -> dict:
+    """Columnar bucket document for entries (raw documents, ``_id`` or ``id``) sorted by ``logged_at``."""
+    cols: Dict[str, list] = {name: [] for name in (*ENTRY_COLUMNS, *NUTRIENTS)}
+    items: Dict[str, list] = {name: [] for name in ITEM_COLUMNS}
+    terms, meals = set(), set()
+    for entry in entries:
+        entry_id = entry.get("_id", entry.get("id"))
+        cols["id"].append(ObjectId(entry_id))
+        for name in ("logged_at", "meal_label", "raw_text", "created_at", "updated_at"):
+            cols[name].append(entry.get(name))
+        totals = entry.get("totals") or {}
+        for name in NUTRIENTS:
+            cols[name].append(totals.get(name, 0))
+        entry_items = entry.get("items") or []
+        cols["item_count"].append(len(entry_items))
+        for item in entry_items:
+            nutrients = item.get("nutrients_total") or {}
+            items["name"].append(item.get("name"))
+            items["quantity"].append(item.get("quantity"))
+            items["unit"].append(item.get("unit"))
+            for name in NUTRIENTS:
+                items[name].append(nutrients.get(name, 0))
+            items["source"].append(item.get("source", "text"))
+            items["confidence"].append(item.get("confidence", 1.0))
+            terms.update(_TERM_RE.findall((item.get("name") or "").lower()))
+        if entry.get("meal_label"):
+            meals.add(entry["meal_label"])
+    return {
+        "user_id": user_id,
+        "month": month,
+        "seq": seq,
+        "count": len(entries),
+        "first_logged_at": cols["logged_at"][0] if entries else None,
+        "last_logged_at": cols["logged_at"][-1] if entries else None,
+        "meal_labels": sorted(meals),
+        "item_terms": sorted(terms),
+        "entries": {name: _encode_column(name, values) for name, values in cols.items()},
+        "items": {name: _encode_column(name, values) for name, values in items.items()},
+    }
+
+
+def decode_bucket(bucket: dict) -> List[dict]:
+    """Entries of a bucket as ``serialize_doc`` returns hot entries, oldest first."""
+    cols = {name: _decode_column(name, column) for name, column in bucket["entries"].items()}
+    items = {name: _decode_column(name, column) for name, column in bucket["items"].items()}
+    decoded = []
+    offset = 0
+    for i in range(bucket["count"]):
+        count = int(cols["item_count"][i])
+        entry_items = [
+            {
+                "name": items["name"][j],
+                "quantity": items["quantity"][j],
+                "unit": items["unit"][j],
+                "nutrients_total": {name: items[name][j] for name in NUTRIENTS},
+                "source": items["source"][j],
+                "confidence": items["confidence"][j],
+            }
+            for j in range(offset, offset + count)
+        ]
+        offset += count
+        decoded.append({
+            "id": str(cols["id"][i]),
+            "user_id": bucket["user_id"],
+            "logged_at": cols["logged_at"][i],
+            "raw_text": cols["raw_text"][i],
+            "meal_label": cols["meal_label"][i],
+            "items": entry_items,
+            "totals": {name: cols[name][i] for name in NUTRIENTS},
+            "image_base64": None,
+            "created_at": cols["created_at"][i],
+            "updated_at": cols["updated_at"][i],
+        })
+    return decoded
+
+
+def entry_matches(entry: dict, start: Optional[str], end: Optional[str], meal: Optional[str],
+                  words: List[str]) -> bool:
+    """The ``entries_filter`` conditions, applied to a decoded entry."""
+    logged_at = entry["logged_at"] or ""
+    if (start is not None and logged_at < start) or (end is not None and logged_at >= end):
+        return False
+    if meal is not None and entry["meal_label"] != meal:
+        return False
+    if words:
+        terms = {t for item in entry["items"] for t in _TERM_RE.findall((item["name"] or "").lower())}
+        return all(any(t.startswith(word) for t in terms) for word in words)
+    return True
+
+
+# ============ Reads ============
+
+def bucket_filter(user_id: str, start: Optional[str] = None, end: Optional[str] = None,
+                  meal: Optional[str] = None, words: Iterable[str] = ()) -> dict:
+    """Query for buckets that can hold entries matching the filters."""
+    query: dict = {"user_id": user_id}
+    if start is not None:
+        query["last_logged_at"] = {"$gte": start}
+    if end is not None:
+        query["first_logged_at"] = {"$lt": end}
+    if meal is not None:
+        query["meal_labels"] = meal
+    words = list(words)
+    if words:
+        query["$and"] = [{"item_terms": {"$regex": "^" + re.escape(word)}} for word in words]
+    return query
+
+
+async def archived_entries(db, user_id: str, limit: int, start: Optional[str] = None,
+                           end: Optional[str] = None, meal: Optional[str] = None,
+                           words: List[str] = (), not_before: Optional[str] = None) -> List[dict]:
+    """Up to ``limit`` newest archived entries matching the filters.
+
+    ``not_before`` skips buckets whose entries are all older than it (the
+    oldest of a full page of hot entries).
+    """
+    query = bucket_filter(user_id, start, end, meal, words)
+    if not_before is not None:
+        query.setdefault("last_logged_at", {})["$gte"] = max(not_before, start or "")
+    found: List[dict] = []
+    async for bucket in db.food_entry_archive.find(query).sort([("month", -1), ("seq", -1)]):
+        matching = [e for e in decode_bucket(bucket) if entry_matches(e, start, end, meal, words)]
+        found.extend(reversed(matching))
+        # Later buckets only hold older entries.
+        if len(found) >= limit:
+            break
+    return found[:limit]
+
+
+async def iter_archived_entries(db, user_id: str, start: Optional[str] = None,
+                                end: Optional[str] = None) -> AsyncIterator[dict]:
+    """Archived entries oldest first, one bucket in memory at a time."""
+    query = bucket_filter(user_id, start, end)
+    async for bucket in db.food_entry_archive.find(query).sort([("month", 1), ("seq", 1)]):
+        for entry in decode_bucket(bucket):
+            if entry_matches(entry, start, end, None, []):
+                yield entry
+
+
+async def find_archived_entry(db, entry_id: str, user_id: str) -> Optional[dict]:
+    oid = ObjectId(entry_id)
+    bucket = await db.food_entry_archive.find_one({"user_id": user_id, "entries.id": oid})
+    if bucket is None:
+        return None
+    return next((e for e in decode_bucket(bucket) if e["id"] == entry_id), None)
+
+
+async def delete_archived_entry(db, entry_id: str, user_id: str) -> bool:
+    """Remove one entry from its bucket (the bucket is rewritten, or dropped when emptied)."""
+    oid = ObjectId(entry_id)
+    bucket = await db.food_entry_archive.find_one({"user_id": user_id, "entries.id": oid})
+    if bucket is None:
+        return False
+    remaining = [e for e in decode_bucket(bucket) if e["id"] != entry_id]
+    if remaining:
+        doc = encode_bucket(user_id, bucket["month"], bucket["seq"], remaining)
+        await db.food_entry_archive.replace_one({"_id": bucket["_id"]}, doc)
+    else:
+        await db.food_entry_archive.delete_one({"_id": bucket["_id"]})
+    return True
+
+
+def merge_newest(hot: List[dict], archived: List[dict], limit: int) -> List[dict]:
+    """Newest ``limit`` of two newest-first lists; an id in both keeps its hot copy."""
+    hot_ids = {e["id"] for e in hot}
+    merged = hot + [e for e in archived if e["id"] not in hot_ids]
+    merged.sort(key=lambda e: e["logged_at"] or "", reverse=True)
+    return merged[:limit]
+
+
+async def merge_oldest(hot: AsyncIterator[dict], archived: AsyncIterator[dict]) -> AsyncIterator[dict]:
+    """Merge two oldest-first entry streams; an id in both keeps its hot copy."""
+    streams = [hot, archived]
+    heads = [await anext(stream, None) for stream in streams]
+    # Copies of one entry share its logged_at, and the hot one comes first.
+    hot_at, hot_ids = None, set()
+    while heads[0] is not None or heads[1] is not None:
+        pick = 0 if heads[1] is None or (
+            heads[0] is not None and (heads[0]["logged_at"] or "") <= (heads[1]["logged_at"] or "")
+        ) else 1
+        entry = heads[pick]
+        if pick == 0:
+            if entry["logged_at"] != hot_at:
+                hot_at, hot_ids = entry["logged_at"], set()
+            hot_ids.add(entry["id"])
+            yield entry
+        elif entry["logged_at"] != hot_at or entry["id"] not in hot_ids:
+            yield entry
+        heads[pick] = await anext(streams[pick], None)
+
+
+# ============ Compaction ============
+
+def archive_cutoff(after_months: int, today: Optional[date] = None) -> str:
+    """First day of the oldest month kept hot (entries before it are archived)."""
+    today = today or datetime.utcnow().date()
+    months = today.year * 12 + today.month - 1 - after_months
+    return date(months // 12, months % 12 + 1, 1).isoformat()
+
+
+async def compact_month(db, user_id: str, month: str, cutoff: str) -> int:
+    """Move one user's eligible entries for ``month`` into its buckets; returns how many moved."""
+    hot_query = {
+        "user_id": user_id,
+        "logged_at": {"$gte": month, "$lt": min(_next_month(month), cutoff)},
+        "image_base64": None,
+    }
+    hot = await db.food_entries.find(hot_query).to_list(length=None)
+    if not hot:
+        return 0
+    hot_ids = [doc["_id"] for doc in hot]
+    # Flag the hot copies first so the sync feed does not report them deleted.
+    await db.food_entries.update_many({"_id": {"$in": hot_ids}}, {"$set": {"archiving": True}})
+
+    existing = await db.food_entry_archive.find({"user_id": user_id, "month": month}).to_list(length=None)
+    merged = {doc["_id"]: doc for doc in hot}
+    for bucket in existing:
+        for entry in decode_bucket(bucket):
+            merged.setdefault(ObjectId(entry["id"]), entry)
+    entries = sorted(merged.values(), key=lambda e: (e.get("logged_at") or "", str(e.get("_id", e.get("id")))))
+
+    chunks = [entries[i:i + MAX_BUCKET_ENTRIES] for i in range(0, len(entries), MAX_BUCKET_ENTRIES)]
+    for seq, chunk in enumerate(chunks):
+        await db.food_entry_archive.replace_one(
+            {"user_id": user_id, "month": month, "seq": seq},
+            encode_bucket(user_id, month, seq, chunk),
+            upsert=True,
+        )
+    await db.food_entry_archive.delete_many({"user_id": user_id, "month": month, "seq": {"$gte": len(chunks)}})
+    # Entries the user deleted since the find above must not come back from the buckets; later
+    # deletions of a flagged entry remove the archived copy themselves (see delete_food_entry).
+    still_hot = {doc["_id"] async for doc in db.food_entries.find({"_id": {"$in": hot_ids}}, {"_id": 1})}
+    for oid in hot_ids:
+        if oid not in still_hot:
+            await delete_archived_entry(db, str(oid), user_id)
+    await db.food_entries.delete_many({"_id": {"$in": hot_ids}})
+    return len(still_hot)
+
+
+async def compact_archives(db, after_months: int, max_months: int = 500) -> Tuple[int, int]:
+    """Archive entries older than ``after_months`` months; returns (buckets touched, entries moved)."""
+    cutoff = archive_cutoff(after_months)
+    pending = set()
+    # Backed by the logged_at index (migration 4): only entries before the cutoff are read.
+    cursor = db.food_entries.find(
+        {"logged_at": {"$lt": cutoff}, "image_base64": None},
+        {"user_id": 1, "logged_at": 1},
+    )
+    async for doc in cursor:
+        pending.add((doc["user_id"], month_of(doc["logged_at"])))
+        if len(pending) >= max_months:
+            break
+    moved = 0
+    for user_id, month in sorted(pending):
+        moved += await compact_month(db, user_id, month, cutoff)
+    return len(pending), moved
+
+
+def _next_month(month: str) -> str:
+    year, mon = int(month[:4]), int(month[5:7])
+    return f"{year + mon // 12:04d}-{mon % 12 + 1:02d}"
+
+
+class ArchiveCompactor:
+    """Background task that periodically archives old entries.
+
+    A lease in the ``maintenance`` collection lets only one process compact
+    at a time when several API processes run it.
+    """
+
+    def __init__(self, get_db: Callable[[], object], after_months: int, interval_s: float):
+        self.get_db = get_db
+        self.after_months = after_months
+        self.interval_s = interval_s
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+        print(f"[Archive] Compacting entries older than {self.after_months} months every {self.interval_s:.0f}s")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self) -> Tuple[int, int]:
+        db = self.get_db()
+        if not await self._acquire(db):
+            return 0, 0
+        buckets, moved = await compact_archives(db, self.after_months)
+        if moved:
+            print(f"[Archive] Moved {moved} entries into {buckets} monthly bucket(s)")
+        return buckets, moved
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"[Archive] Compaction failed: {type(e).__name__}: {str(e)}")
+            await asyncio.sleep(self.interval_s)
+
+    async def _acquire(self, db) -> bool:
+        """Take or extend the lease; other errors propagate so ``_run`` logs them."""
+        from pymongo.errors import DuplicateKeyError
+
+        now = datetime.utcnow()
+        try:
+            await db.maintenance.update_one(
+                {"_id": "archive", "$or": [{"lease_until": {"$lt": now}}, {"owner": self.owner}]},
+                {"$set": {"owner": self.owner, "lease_until": now + timedelta(seconds=self.interval_s)}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False  # another process holds the lease
@@ -1,9 +1,11 @@
-"""Authentication service with JWT tokens."""
+"""Authentication service with JWT tokens.
+
+``jose`` and ``bcrypt`` are imported on first use, keeping them out of
+the app's import time.
+"""
 
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
-import bcrypt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
@@ -16,6 +18,8 @@ security = HTTPBearer()
 
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt."""
+    import bcrypt
+
     password_bytes = password.encode('utf-8')
     salt = bcrypt.gensalt()
     hashed = bcrypt.hashpw(password_bytes, salt)
@@ -24,6 +28,8 @@ def hash_password(password: str) -> str:
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
+    import bcrypt
+
     try:
         password_bytes = plain_password.encode('utf-8')
         hashed_bytes = hashed_password.encode('utf-8')
@@ -34,6 +40,8 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def create_access_token(user_id: str) -> str:
     """Create a JWT access token."""
+    from jose import jwt
+
     settings = get_settings()
     expire = datetime.utcnow() + timedelta(hours=settings.jwt_expiration_hours)
     to_encode = {
@@ -50,6 +58,8 @@ def create_access_token(user_id: str) -> str:
 
 def decode_token(token: str) -> Optional[str]:
     """Decode a JWT token and return the user_id."""
+    from jose import JWTError, jwt
+
     settings = get_settings()
     try:
         payload = jwt.decode(
@@ -89,6 +99,14 @@ async def get_current_user(
     return user
 
 
+async def get_admin_user(current_user: dict = Depends(get_current_user)) -> dict:
+    """The current user, if their email is listed in ADMIN_EMAILS."""
+    admins = {email.strip().lower() for email in get_settings().admin_emails.split(",") if email.strip()}
+    if (current_user.get("email") or "").lower() not in admins:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
+
+
 async def authenticate_user(email: str, password: str) -> Optional[dict]:
     """Authenticate a user by email and password."""
     user = await mongodb.get_user_by_email(email)
@@ -0,0 +1,193 @@
+"""Barcode (EAN/UPC/GTIN) fast path backed by a memory-mapped product index.
+
+``import_nutrition.py`` writes the index next to the nutrition database from
+every imported food that has a barcode. The file is::
+
+    header   b"NTBCIDX1" + uint64 count
+    codes    count x uint64, sorted (GTIN as an integer, so UPC-A and its
+             EAN-13 form with a leading zero are the same key)
+    rows     count x record (database id, kcal/protein/carbs/fat per 100 g,
+             serving grams, offset and lengths of name and brand)
+    strings  UTF-8 names and brands
+
+It is opened with ``numpy.memmap``, so a lookup is a binary search touching a
+handful of pages and nothing is loaded up front.
+"""
+
+import os
+import re
+import sqlite3
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .config import get_settings
+from .nutrition_db import FoodRecord
+
+MAGIC = b"NTBCIDX1"
+HEADER_SIZE = 16
+ROW_DTYPE = np.dtype([
+    ("id", "<u4"),
+    ("kcal", "<f4"),
+    ("protein_g", "<f4"),
+    ("carbs_g", "<f4"),
+    ("fat_g", "<f4"),
+    ("serving_g", "<f4"),
+    ("name_offset", "<u4"),
+    ("name_len", "<u2"),
+    ("brand_len", "<u2"),
+])
+
+_PREFIX_RE = re.compile(r"^(?:barcode|ean|upc|gtin|code|scan(?:ned)?)\s*[:#]?\s*", re.IGNORECASE)
+_BARCODE_LOG_RE = re.compile(
+    r"^(?:(?P<lead>\d+(?:\.\d+)?)\s*(?P<lead_unit>g|ml|x|×)?\s+)?"
+    r"(?P<code>\d{8,14})"
+    r"(?:\s*(?:x|×)\s*(?P<times>\d+(?:\.\d+)?))?$",
+    re.IGNORECASE,
+)
+
+
+def gtin_check_digit_ok(code: str) -> bool:
+    """GS1 check digit validation (EAN-8, UPC-A, EAN-13, GTIN-14)."""
+    digits = [int(c) for c in code]
+    total = sum(d * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(digits[:-1])))
+    return (10 - total % 10) % 10 == digits[-1]
+
+
+def barcode_key(code: Optional[str]) -> Optional[int]:
+    """Index key for a barcode, or None if it is not a valid GTIN."""
+    if not code:
+        return None
+    code = code.strip()
+    if not code.isdigit() or not 8 <= len(code) <= 14 or not gtin_check_digit_ok(code):
+        return None
+    return int(code)
+
+
+def parse_barcode_log(text: str) -> Optional[Tuple[int, Optional[float], Optional[str]]]:
+    """``(key, qty, unit)`` if a log is just a barcode, optionally with an amount.
+
+    Accepts "3017620422003", "barcode: 3017620422003", "2x 3017620422003",
+    "3017620422003 x2" and "30 g 3017620422003". ``unit`` is "g"/"ml" for
+    an amount, "serving" for a count, and None when no amount was given.
+    """
+    cleaned = _PREFIX_RE.sub("", " ".join(text.strip().rstrip(".").split()))
+    match = _BARCODE_LOG_RE.match(cleaned)
+    if match is None:
+        return None
+    key = barcode_key(match.group("code"))
+    if key is None:
+        return None
+    lead, lead_unit, times = match.group("lead"), (match.group("lead_unit") or "").lower(), match.group("times")
+    if lead is not None and lead_unit in ("g", "ml"):
+        return key, float(lead), lead_unit
+    if lead is not None:
+        return key, float(lead), "serving"
+    if times is not None:
+        return key, float(times), "serving"
+    return key, None, None
+
+
+# ============ Index ============
+
+class BarcodeIndex:
+    """Read-only, memory-mapped sorted barcode index."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if header[:8] != MAGIC:
+            raise ValueError(f"{path} is not a barcode index")
+        self.count = int.from_bytes(header[8:16], "little")
+        if self.count == 0:
+            self.codes, self.rows, self._strings = np.zeros(0, "<u8"), np.zeros(0, ROW_DTYPE), np.zeros(0, np.uint8)
+            return
+        rows_offset = HEADER_SIZE + 8 * self.count
+        self.codes = np.memmap(path, dtype="<u8", mode="r", offset=HEADER_SIZE, shape=(self.count,))
+        self.rows = np.memmap(path, dtype=ROW_DTYPE, mode="r", offset=rows_offset, shape=(self.count,))
+        self._strings = np.memmap(path, dtype=np.uint8, mode="r", offset=rows_offset + ROW_DTYPE.itemsize * self.count)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def lookup(self, key: int) -> Optional[FoodRecord]:
+        """Food for a barcode key (see ``barcode_key``), or None."""
+        i = int(np.searchsorted(self.codes, np.uint64(key)))
+        if i >= self.count or int(self.codes[i]) != key:
+            return None
+        row = self.rows[i]
+        start, name_len, brand_len = int(row["name_offset"]), int(row["name_len"]), int(row["brand_len"])
+        name = bytes(self._strings[start:start + name_len]).decode("utf-8")
+        brand = bytes(self._strings[start + name_len:start + name_len + brand_len]).decode("utf-8") or None
+        serving = float(row["serving_g"])
+        return FoodRecord(
+            id=int(row["id"]),
+            source="barcode",
+            name=name,
+            brand=brand,
+            generic=False,
+            kcal=round(float(row["kcal"]), 2),
+            protein_g=round(float(row["protein_g"]), 2),
+            carbs_g=round(float(row["carbs_g"]), 2),
+            fat_g=round(float(row["fat_g"]), 2),
+            serving_g=serving if serving == serving else None,
+            code=str(key),
+        )
+
+
+def build_barcode_index(conn: sqlite3.Connection, path: str) -> int:
+    """Write the barcode index for every food with a valid barcode; returns the count."""
+    keys, rows, strings = [], [], bytearray()
+    seen = set()
+    cursor = conn.execute(
+        "SELECT id, code, name, brand, kcal, protein_g, carbs_g, fat_g, serving_g FROM foods "
+        "WHERE code IS NOT NULL ORDER BY id"
+    )
+    for food_id, code, name, brand, kcal, protein, carbs, fat, serving in cursor:
+        key = barcode_key(code)
+        if key is None or key in seen:
+            continue
+        seen.add(key)
+        name_bytes = name.encode("utf-8")[:65535]
+        brand_bytes = (brand or "").encode("utf-8")[:65535]
+        keys.append(key)
+        rows.append((
+            food_id, kcal, protein, carbs, fat, serving if serving else np.nan,
+            len(strings), len(name_bytes), len(brand_bytes),
+        ))
+        strings += name_bytes + brand_bytes
+
+    codes = np.array(keys, dtype="<u8")
+    table = np.array(rows, dtype=ROW_DTYPE)
+    order = np.argsort(codes, kind="stable")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + len(keys).to_bytes(8, "little"))
+        f.write(codes[order].tobytes())
+        f.write(table[order].tobytes())
+        f.write(bytes(strings))
+    os.replace(tmp_path, path)
+    return len(keys)
+
+
+# ============ Singleton ============
+
+_barcode_index: Optional[BarcodeIndex] = None
+_barcode_index_loaded = False
+
+
+def get_barcode_index() -> Optional[BarcodeIndex]:
+    """The barcode index, or None if none has been built."""
+    global _barcode_index, _barcode_index_loaded
+    if not _barcode_index_loaded:
+        _barcode_index_loaded = True
+        path = get_settings().nutrition_barcode_index_path
+        if path and os.path.exists(path):
+            try:
+                _barcode_index = BarcodeIndex(path)
+                print(f"[Nutrition] Loaded {len(_barcode_index)} barcodes from {path}")
+            except (OSError, ValueError) as e:
+                print(f"[Nutrition] Could not open {path}: {e}")
+                _barcode_index = None
+    return _barcode_index
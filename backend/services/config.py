@@ -2,6 +2,7 @@
 
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Optional
 
 
 class Settings(BaseSettings):
@@ -12,6 +13,114 @@ class Settings(BaseSettings):
 
     # Groq API
     groq_api_key: str = ""
+    groq_base_url: Optional[str] = None  # override to point at a proxy or the bench fake LLM
+    groq_text_model: str = "llama-3.3-70b-versatile"
+    groq_vision_model: str = "meta-llama/llama-4-scout-17b-16e-instruct"
+
+    # LLM backend selection: groq | ollama | openai
+    llm_provider: str = "groq"
+    llm_vision_provider: str = "groq"
+    llm_request_timeout_s: float = 60.0
+    # Structured output: schema (constrained decoding where supported) | json | off
+    llm_json_mode: str = "schema"
+    # Prompt/response format for text parses: compact (short keys) | full
+    llm_prompt_style: str = "compact"
+
+    # Per-segment parse cache ("2 eggs" reused for "3 eggs, toast")
+    parse_segment_cache: bool = True
+    parse_segment_cache_size: int = 5000
+    parse_segment_cache_ttl_s: float = 7 * 24 * 3600
+
+    # Embedding-similarity cache for paraphrased logs
+    semantic_cache: bool = False  # needs fastembed
+    semantic_cache_model: str = "BAAI/bge-small-en-v1.5"  # a fastembed model
+    semantic_cache_threshold: float = 0.9
+    semantic_cache_max_entries: int = 20000
+    semantic_cache_path: str = "data/semantic_cache.npz"
+
+    # Per-user memory of confirmed foods and recent meals
+    food_memory: bool = True
+    food_memory_max_foods: int = 500
+    food_memory_meal_history: int = 14  # entries kept per meal label
+
+    # Local nutrition database imported from OpenFoodFacts / FDC (python import_nutrition.py)
+    nutrition_db_path: str = "data/nutrition.sqlite"
+    nutrition_barcode_index_path: str = "data/barcodes.idx"  # written by import_nutrition.py
+    # auto: when the database exists, the LLM only extracts foods and portions and
+    # nutrients are computed locally | llm: the LLM estimates nutrients
+    nutrition_source: str = "auto"
+
+    # Admission control for LLM-bound requests
+    admission_control: bool = True
+    admission_user_rate_per_min: float = 30.0
+    admission_user_burst: int = 10
+    admission_user_max_concurrency: int = 4
+    admission_llm_max_inflight: int = 16  # concurrent LLM calls across all users
+    admission_llm_queue_size: int = 64
+    admission_interactive_deadline_s: float = 5.0  # max queue wait before shedding
+    admission_bulk_deadline_s: float = 60.0
+    admission_draft_rate_per_min: float = 60.0  # draft parses, limited apart from real parses
+    admission_draft_burst: int = 10
+
+    # Speculative draft parses while the user types (/api/parse-food-log/draft)
+    draft_parse: bool = True
+    draft_parse_llm: bool = True  # use an LLM slot when one is free right now
+    draft_cache_size: int = 10000
+    draft_cache_ttl_s: float = 600.0
+
+    # Backend of the segment and draft parse caches, so worker processes share entries:
+    # shm (memory-mapped file, one host) | redis (Redis-compatible server) | local (per process)
+    cache_backend: str = "shm"
+    cache_prefix: str = "nutritrack"  # shm file name / Redis key prefix
+    cache_shm_dir: str = "/dev/shm"
+    cache_redis_url: str = "redis://localhost:6379/0"
+    cache_redis_timeout_s: float = 0.05
+
+    # Asynchronous parse jobs (?async=true / Prefer: respond-async)
+    parse_job_workers: int = 2  # in-process workers; 0 when separate worker.py processes run jobs
+    parse_job_lease_s: float = 120.0
+    parse_job_max_attempts: int = 3
+    parse_job_result_ttl_s: float = 3600.0
+    parse_job_poll_interval_s: float = 0.5
+    parse_job_max_wait_s: float = 30.0
+
+    # Failover routing: ordered "provider[:model]" list, e.g.
+    # "groq:llama-3.3-70b-versatile,groq:llama-3.1-8b-instant,ollama"
+    llm_routes: str = ""
+    llm_route_timeout_s: float = 20.0
+    llm_breaker_failures: int = 5
+    llm_breaker_reset_s: float = 30.0
+    llm_hedge_enabled: bool = False
+    llm_hedge_min_delay_ms: float = 300.0
+    groq_requests_per_minute: int = 30  # account quota; 0 disables the token bucket
+
+    # Token usage accounting (llm_usage collection, GET /api/admin/usage)
+    usage_tracking: bool = True
+    usage_batch_size: int = 500
+    usage_flush_interval_s: float = 5.0
+    usage_max_buffer: int = 20000  # records kept while the database is unreachable
+    # USD per million prompt/completion tokens, "model=input/output,..." (check current provider prices)
+    llm_prices: str = (
+        "llama-3.3-70b-versatile=0.59/0.79,llama-3.1-8b-instant=0.05/0.08,"
+        "meta-llama/llama-4-scout-17b-16e-instruct=0.11/0.34"
+    )
+
+    # Local model scheduling (ollama / openai-compatible)
+    llm_max_concurrency: int = 4  # match OLLAMA_NUM_PARALLEL / server slots
+    llm_keep_alive_interval_s: float = 240.0
+
+    # Ollama
+    ollama_host: str = "http://localhost:11434"
+    ollama_model: str = "llama3.2:1b-instruct-q4_K_M"
+    ollama_vision_model: str = ""
+    ollama_keep_alive: str = "10m"
+    ollama_num_ctx: int = 2048
+
+    # OpenAI-compatible server (vLLM, llama.cpp, LM Studio)
+    openai_base_url: str = "http://localhost:8080/v1"
+    openai_api_key: str = ""
+    openai_model: str = ""
+    openai_vision_model: str = ""
 
     # MongoDB
     mongodb_uri: str = "mongodb://localhost:27017/nutritrack"
@@ -20,9 +129,29 @@ class Settings(BaseSettings):
     jwt_secret: str = "change-this-secret-in-production"
     jwt_algorithm: str = "HS256"
     jwt_expiration_hours: int = 24
+    admin_emails: str = ""  # comma-separated; these users may call /api/admin
+
+    # Tiered storage: entries older than this many months move to monthly buckets (0 disables).
+    # Off by default: enabling it rewrites and deletes old food_entries, so back up first.
+    archive_after_months: int = 0
+    archive_interval_s: float = 6 * 3600
+
+    # Real-time sync (/api/sync): per-client event backlog before a resync
+    sync_queue_size: int = 256
+    sync_heartbeat_s: float = 25.0
 
     # Server
     port: int = 8000
+    web_concurrency: int = 0  # serve.py worker processes; 0 = one per CPU
+    response_compression: bool = True  # gzip (brotli if installed) for responses the client accepts compressed
+    response_compression_min_size: int = 1024
+
+    # Diagnostics: event-loop lag monitor that logs the stacks of callbacks blocking the
+    # loop, and the admin sampling profiler (GET /api/admin/profile)
+    diagnostics: bool = False
+    diagnostics_lag_interval_s: float = 0.05
+    diagnostics_lag_threshold_s: float = 0.1
+    diagnostics_profile_max_s: float = 30.0
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,197 @@
+"""Event-loop diagnostics: lag monitoring and a sampling profiler.
+
+``LoopLagMonitor`` (``DIAGNOSTICS=true``) wakes the event loop every
+``DIAGNOSTICS_LAG_INTERVAL_S`` and records how late each wake-up was. A
+watchdog thread samples the loop thread's stack while the loop has not
+woken up for more than ``DIAGNOSTICS_LAG_THRESHOLD_S``, so a synchronous
+call inside a coroutine (bcrypt, a blocking client) is logged with the
+line that blocked.
+
+``profile_stacks`` samples every thread's stack for a few seconds and
+returns them in the folded ("collapsed") format that flamegraph.pl,
+inferno and speedscope read, with frames labelled like py-spy's.
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .config import get_settings
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    if "site-packages" + os.sep in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[1]
+    elif filename.startswith(os.getcwd() + os.sep):
+        filename = os.path.relpath(filename)
+    else:
+        filename = os.path.basename(filename)
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({filename}:{frame.f_lineno})"
+
+
+def _stack(frame) -> List[str]:
+    """Frame labels from the outermost call to ``frame``."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class LoopLagMonitor:
+    """Event-loop lag, plus the stacks of callbacks that blocked the loop."""
+
+    def __init__(self, interval_s: float = 0.05, threshold_s: float = 0.1, history: int = 1200):
+        self.interval_s = interval_s
+        self.threshold_s = threshold_s
+        self.stalls = 0
+        self.max_lag_s = 0.0
+        self._lags: deque = deque(maxlen=history)
+        self._recent: deque = deque(maxlen=20)
+        self._heartbeat = time.monotonic()
+        self._stall_lag_s = 0.0
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> None:
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._tick())
+        self._thread = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._thread.start()
+        print(f"[Diagnostics] Watching for event-loop stalls over {self.threshold_s * 1000:.0f} ms")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._stop.set()
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._thread.join()
+
+    async def _tick(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_s)
+            now = time.monotonic()
+            # Measured from the last wake-up, like the watchdog, so it includes any wait for this task to run.
+            lag = max(0.0, now - self._heartbeat - self.interval_s)
+            self._lags.append(lag)
+            self.max_lag_s = max(self.max_lag_s, lag)
+            if lag > self.threshold_s:
+                self._stall_lag_s = lag
+                self.stalls += 1
+            self._heartbeat = now
+
+    def _watch(self) -> None:
+        samples: Counter = Counter()
+        reported = self.stalls
+        period = max(0.005, self.threshold_s / 4)
+        while not self._stop.wait(period):
+            if self.stalls != reported:
+                # The loop woke up late: the samples so far belong to the stall that ended.
+                if samples:
+                    self._report(samples, self._stall_lag_s)
+                    samples = Counter()
+                reported = self.stalls
+            if time.monotonic() - self._heartbeat - self.interval_s > self.threshold_s:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    samples[tuple(_stack(frame))] += 1
+                del frame
+
+    def _report(self, samples: Counter, lag_s: float) -> None:
+        stack, count = samples.most_common(1)[0]
+        total = sum(samples.values())
+        self._recent.append({
+            "at": datetime.utcnow().isoformat(),
+            "duration_ms": round(lag_s * 1000, 1),
+            "samples": total,
+            "stack": list(stack),
+        })
+        frames = "\n".join(f"    {label}" for label in stack[-12:])
+        print(
+            f"[Diagnostics] Event loop blocked for {lag_s * 1000:.0f} ms "
+            f"(stack in {count}/{total} samples, innermost last):\n{frames}"
+        )
+
+    def stats(self) -> dict:
+        lags = sorted(self._lags)
+        return {
+            "running": self.running,
+            "interval_ms": self.interval_s * 1000,
+            "threshold_ms": self.threshold_s * 1000,
+            "lag_ms": {
+                "p50": round(statistics.median(lags) * 1000, 2) if lags else 0.0,
+                "p99": round(lags[min(len(lags) - 1, int(len(lags) * 0.99))] * 1000, 2) if lags else 0.0,
+                "max": round(self.max_lag_s * 1000, 2),
+            },
+            "stalls": self.stalls,
+            "recent_stalls": list(self._recent),
+        }
+
+
+# Global monitor for the worker process
+_monitor: Optional[LoopLagMonitor] = None
+_profiling = threading.Lock()
+
+
+def get_loop_monitor() -> LoopLagMonitor:
+    """The process's event-loop monitor (started by the app when DIAGNOSTICS is on)."""
+    global _monitor
+    if _monitor is None:
+        settings = get_settings()
+        _monitor = LoopLagMonitor(settings.diagnostics_lag_interval_s, settings.diagnostics_lag_threshold_s)
+    return _monitor
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is already being taken in this process."""
+
+
+def profile_stacks(duration_s: float, interval_s: float = 0.005) -> Dict[str, int]:
+    """Sample every other thread's stack for ``duration_s``; folded stack -> samples.
+
+    Blocking: run it in a thread. Each stack starts with the thread's name.
+    """
+    if not _profiling.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        own = {threading.get_ident()}
+        if _monitor is not None and _monitor._thread is not None:
+            own.add(_monitor._thread.ident)
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        folded: Counter = Counter()
+        deadline = time.monotonic() + duration_s
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident in own:
+                    continue
+                if ident not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                folded[";".join([names.get(ident, str(ident)), *_stack(frame)])] += 1
+            frame = None  # don't keep the last sampled frame alive while sleeping
+            time.sleep(interval_s)
+        return dict(folded)
+    finally:
+        _profiling.release()
+
+
+def folded_text(folded: Dict[str, int]) -> str:
+    """``stack count`` lines, heaviest first."""
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(folded.items(), key=lambda kv: -kv[1]))
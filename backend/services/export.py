@@ -0,0 +1,82 @@
+"""Streaming export of a user's food history.
+
+Entries are read from a MongoDB cursor in batches (``iter_food_entries``)
+and encoded into chunks of about ``CHUNK_SIZE`` bytes as they arrive, so
+an export holds one cursor batch and one chunk in memory however long the
+history is. Image blobs are never read.
+
+- ``ndjson``: one compact entry view per line
+- ``csv``: one row per food item, with the entry's id, time, meal and text
+"""
+
+import csv
+import io
+import zlib
+from typing import AsyncIterator
+
+from .serialization import dumps, entry_view
+
+EXPORT_FORMATS = ("ndjson", "csv")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+CHUNK_SIZE = 64 * 1024
+
+CSV_COLUMNS = (
+    "entry_id", "logged_at", "meal_label", "raw_text",
+    "item_name", "quantity", "unit", "calories", "protein_g", "carbs_g", "fat_g",
+    "source", "confidence",
+)
+_NUTRIENTS = ("calories", "protein_g", "carbs_g", "fat_g")
+
+
+def csv_rows(entry: dict):
+    """CSV rows for one entry (an entry without items still gets a row)."""
+    head = [entry.get("id"), entry.get("logged_at"), entry.get("meal_label") or "", entry.get("raw_text") or ""]
+    items = entry.get("items") or [None]
+    for item in items:
+        if item is None:
+            yield head + [""] * (len(CSV_COLUMNS) - len(head))
+            continue
+        nutrients = item.get("nutrients_total") or {}
+        yield head + [
+            item.get("name"), item.get("quantity"), item.get("unit"),
+            *(nutrients.get(name, 0) for name in _NUTRIENTS),
+            item.get("source"), item.get("confidence"),
+        ]
+
+
+async def export_chunks(entries: AsyncIterator[dict], fmt: str) -> AsyncIterator[bytes]:
+    """Encode entries as ``fmt`` into chunks of roughly ``CHUNK_SIZE`` bytes."""
+    if fmt == "csv":
+        text = io.StringIO()
+        writer = csv.writer(text)
+        writer.writerow(CSV_COLUMNS)
+        async for entry in entries:
+            for row in csv_rows(entry):
+                writer.writerow(row)
+            if text.tell() >= CHUNK_SIZE:
+                yield text.getvalue().encode("utf-8")
+                text.seek(0)
+                text.truncate()
+        if text.tell():
+            yield text.getvalue().encode("utf-8")
+        return
+
+    buffer = bytearray()
+    async for entry in entries:
+        buffer += dumps(entry_view(entry, compact=True))
+        buffer += b"\n"
+        if len(buffer) >= CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """Compress a chunk stream into one gzip file."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,229 @@
+"""Per-user memory of confirmed foods and recent meals.
+
+Each user has one document in the ``food_memory`` collection, updated
+incrementally whenever an entry is saved:
+
+- ``foods``: normalized item name -> last confirmed portion, nutrients per
+  unit of quantity, use count and last use time
+- ``aliases``: other normalized names the user has used for a food
+- ``meals``: per meal label, the most recent entries (date + items)
+
+Reading it back is a single indexed ``find_one``, after which "2 eggs",
+"my usual breakfast" or "same lunch as yesterday" resolve without the LLM.
+"""
+
+import re
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from .food_names import normalize_food_name
+
+MEAL_LABELS = ("Breakfast", "Lunch", "Dinner", "Snack")
+NUTRIENT_FIELDS = ("calories", "protein_g", "carbs_g", "fat_g")
+MEMORY_CONFIDENCE = 0.95
+
+# Units whose quantity is a measured amount rather than a count of portions.
+_MEASURED_UNITS = {"g", "kg", "ml", "l", "oz", "lb", "100g"}
+
+_MEAL_WORD = r"(breakfast|lunch|dinner|supper|snack)"
+_LEAD_IN = r"(?:(?:i\s+)?(?:had|ate|am having|'m having)\s+)?"
+_USUAL_RE = re.compile(rf"^{_LEAD_IN}(?:my\s+|the\s+)?usual\s+{_MEAL_WORD}(?:\s+again)?$", re.IGNORECASE)
+_SAME_AS_RE = re.compile(
+    rf"^{_LEAD_IN}(?:the\s+)?same\s+{_MEAL_WORD}\s+as\s+(yesterday|today|last\s+time)$",
+    re.IGNORECASE,
+)
+_SAME_AS_DAY_RE = re.compile(
+    rf"^{_LEAD_IN}(?:the\s+)?same\s+as\s+(yesterday|today|last\s+time)(?:'s)?\s+{_MEAL_WORD}$",
+    re.IGNORECASE,
+)
+_AGAIN_RE = re.compile(rf"^{_LEAD_IN}(yesterday|today)'s\s+{_MEAL_WORD}(?:\s+again)$", re.IGNORECASE)
+_MEAL_SUFFIX_RE = re.compile(rf"\s+(?:for|at)\s+(?:a\s+)?{_MEAL_WORD}$", re.IGNORECASE)
+
+
+def _meal_label(word: str) -> str:
+    word = word.lower()
+    return "Dinner" if word == "supper" else word.capitalize()
+
+
+def parse_meal_reference(text: str) -> Optional[Tuple[str, str]]:
+    """Recognize a log that refers back to a previous meal.
+
+    Returns ``(meal, when)`` where ``when`` is "usual", "last", "today" or
+    "yesterday", or None if the log is not such a reference.
+    """
+    cleaned = " ".join(text.strip().rstrip(".!").split())
+    match = _USUAL_RE.match(cleaned)
+    if match:
+        return _meal_label(match.group(1)), "usual"
+    match = _SAME_AS_RE.match(cleaned)
+    if match:
+        meal, when = match.group(1), match.group(2)
+    else:
+        match = _SAME_AS_DAY_RE.match(cleaned) or _AGAIN_RE.match(cleaned)
+        if not match:
+            return None
+        when, meal = match.group(1), match.group(2)
+    when = when.lower()
+    return _meal_label(meal), "last" if when.startswith("last") else when
+
+
+def _local_date(iso_datetime: Optional[str]) -> date:
+    try:
+        return datetime.fromisoformat(iso_datetime).date()
+    except (TypeError, ValueError):
+        return datetime.now().date()
+
+
+# ============ Memory ============
+
+class FoodMemory:
+    """A user's food memory document with lookup helpers."""
+
+    def __init__(self, doc: Optional[dict] = None):
+        doc = doc or {}
+        self.foods: dict = doc.get("foods") or {}
+        self.aliases: dict = doc.get("aliases") or {}
+        self.meals: dict = doc.get("meals") or {}
+
+    def __bool__(self) -> bool:
+        return bool(self.foods)
+
+    def food(self, name: str) -> Optional[dict]:
+        """Remembered food for a (raw or normalized) name."""
+        key = normalize_food_name(name)
+        return self.foods.get(self.aliases.get(key, key))
+
+    def match(self, name: str, qty: Optional[float], unit: Optional[str]) -> Optional[dict]:
+        """Extraction item fields for a food mention, scaled to its quantity, or None.
+
+        A mention without a quantity gets the user's last confirmed portion. A
+        mention whose unit differs from the remembered one is not matched,
+        since converting between them needs the nutrition database.
+        """
+        food = self.food(name)
+        if food is None:
+            return None
+        remembered_unit = (food.get("unit") or "").lower()
+        if unit is not None and unit.lower() != remembered_unit:
+            return None
+        if unit is None and qty is not None and remembered_unit in _MEASURED_UNITS:
+            # "2 yogurt" is a count, but the remembered portion is in grams.
+            return None
+        quantity = qty if qty is not None else food["quantity"]
+        return _item_fields(food["name"], quantity, food.get("unit"), food["per_unit"], quantity)
+
+    def meal_items(self, meal: str, when: str, today: date) -> Optional[List[dict]]:
+        """Extraction item fields of a remembered meal, or None.
+
+        ``when`` is "usual" (the most frequently logged combination among the
+        recent entries for that meal), "last", "today" or "yesterday".
+        """
+        history = self.meals.get(meal) or []
+        if not history:
+            return None
+        if when == "usual":
+            combos = Counter(_combo(entry) for entry in history)
+            best = max(combos.values())
+            # Most recent entry among the most frequent combinations.
+            entry = next(e for e in reversed(history) if combos[_combo(e)] == best)
+        elif when == "last":
+            entry = history[-1]
+        else:
+            day = (today - timedelta(days=1 if when == "yesterday" else 0)).isoformat()
+            entry = next((e for e in reversed(history) if e.get("date") == day), None)
+            if entry is None:
+                return None
+        return [
+            _item_fields(
+                item["name"],
+                item["quantity"],
+                item.get("unit"),
+                item.get("nutrients_total") or {},
+                1.0,
+            )
+            for item in entry.get("items", [])
+        ]
+
+
+def _combo(entry: dict) -> Tuple[str, ...]:
+    return tuple(sorted(normalize_food_name(item["name"]) for item in entry.get("items", [])))
+
+
+def _item_fields(name: str, qty: float, unit: Optional[str], nutrients: dict, factor: float) -> dict:
+    fields = {
+        "item_name": name,
+        "qty": qty,
+        "unit": unit,
+        "search_query": name,
+    }
+    for field in NUTRIENT_FIELDS:
+        value = nutrients.get(field)
+        fields[field] = round(value * factor, 1) if value is not None else None
+    return fields
+
+
+# ============ Incremental Updates ============
+
+def _aliases_for(entry: dict, name: str) -> List[str]:
+    """Other normalized names to remember for an item."""
+    aliases = []
+    base = re.split(r"[(,]", name, maxsplit=1)[0]
+    if base != name:
+        aliases.append(normalize_food_name(base))
+    # A single-item entry logged without quantities ("my protein shake") is an alias too.
+    raw = entry.get("raw_text") or ""
+    if len(entry.get("items") or []) == 1 and not re.search(r"\d", raw) and len(raw.split()) <= 6:
+        aliases.append(normalize_food_name(_MEAL_SUFFIX_RE.sub("", raw.strip().rstrip(".!"))))
+    return aliases
+
+
+def build_memory_update(entry: dict, history_size: int) -> Optional[dict]:
+    """MongoDB update document folding one saved entry into the user's memory."""
+    now = datetime.utcnow()
+    update = {"$set": {"updated_at": now}, "$inc": {}}
+    for item in entry.get("items") or []:
+        name = item.get("name") or ""
+        key = normalize_food_name(name)
+        quantity = item.get("quantity") or 0
+        if not key or quantity <= 0:
+            continue
+        nutrients = item.get("nutrients_total") or {}
+        prefix = f"foods.{key}"
+        update["$set"][f"{prefix}.name"] = name
+        update["$set"][f"{prefix}.unit"] = item.get("unit")
+        update["$set"][f"{prefix}.quantity"] = quantity
+        update["$set"][f"{prefix}.per_unit"] = {
+            field: nutrients.get(field, 0) / quantity for field in NUTRIENT_FIELDS
+        }
+        update["$set"][f"{prefix}.last_used"] = now
+        update["$inc"][f"{prefix}.count"] = 1
+        for alias in _aliases_for(entry, name):
+            if alias and alias != key:
+                update["$set"][f"aliases.{alias}"] = key
+    if not update["$inc"]:
+        return None
+
+    meal = entry.get("meal_label")
+    if meal in MEAL_LABELS:
+        update["$push"] = {f"meals.{meal}": {
+            "$each": [{
+                "entry_id": entry.get("id"),
+                "date": _local_date(entry.get("logged_at")).isoformat(),
+                "items": [
+                    {k: item.get(k) for k in ("name", "quantity", "unit", "nutrients_total")}
+                    for item in entry["items"]
+                ],
+            }],
+            "$slice": -history_size,
+        }}
+    return update
+
+
+def stale_food_keys(memory_doc: dict, max_foods: int) -> List[str]:
+    """Least recently used food keys beyond ``max_foods``."""
+    foods = memory_doc.get("foods") or {}
+    if len(foods) <= max_foods:
+        return []
+    by_age = sorted(foods, key=lambda k: foods[k].get("last_used") or datetime.min)
+    return by_age[:len(foods) - max_foods]
@@ -0,0 +1,29 @@
+"""Food name normalization shared by the parse caches and the per-user food memory."""
+
+import re
+
+_FILLER_RE = re.compile(r"\b(?:some|of|my|the)\b", re.IGNORECASE)
+# Portion sizes: part of a cache key ("a large pizza" is not "a small pizza"), noise in a food search.
+_SIZE_RE = re.compile(r"\b(?:small|medium|large|big)\b", re.IGNORECASE)
+_NON_WORD_RE = re.compile(r"[^a-z0-9%\s]")
+
+
+def _singular(word: str) -> str:
+    if len(word) <= 3 or word.endswith(("ss", "us", "is")):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("oes", "ches", "shes", "xes")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def normalize_food_name(name: str, keep_sizes: bool = True) -> str:
+    """Lowercase, drop filler words (and size words unless ``keep_sizes``) and punctuation, and singularize each word."""
+    text = _FILLER_RE.sub(" ", name.lower())
+    if not keep_sizes:
+        text = _SIZE_RE.sub(" ", text)
+    text = _NON_WORD_RE.sub(" ", text)
+    return " ".join(_singular(w) for w in text.split())
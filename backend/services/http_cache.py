@@ -0,0 +1,48 @@
+"""Conditional GET support for per-user data.
+
+ETags come from the per-user data versions that the write functions in
+``mongodb.py`` bump, and those versions are on the user document that
+``get_current_user`` has already loaded. Answering ``If-None-Match`` with
+``304 Not Modified`` therefore needs no query beyond authentication, and
+the entries, goals or settings read and the response body are skipped.
+"""
+
+import hashlib
+from typing import Dict
+
+from fastapi import Request
+from fastapi.responses import Response
+
+# Bump when the representation of a cached resource changes, so old ETags stop matching.
+ETAG_REVISION = 1
+
+
+def data_version(user: dict, kind: str) -> int:
+    """Current version of one kind of the user's data (0 before its first write)."""
+    return (user.get("data_versions") or {}).get(kind, 0)
+
+
+def make_etag(user: dict, kind: str, variant: str = "") -> str:
+    """Weak ETag for a user's resource; ``variant`` distinguishes query parameters."""
+    digest = hashlib.blake2s(f"{user['id']}|{variant}".encode("utf-8"), digest_size=6).hexdigest()
+    return f'W/"{kind}-{ETAG_REVISION}-{data_version(user, kind)}-{digest}"'
+
+
+def cache_headers(etag: str) -> Dict[str, str]:
+    """Headers making clients revalidate the private response on every use."""
+    return {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether ``If-None-Match`` matches ``etag`` (weak comparison)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag))
@@ -0,0 +1,324 @@
+"""MongoDB-backed queue for asynchronous parse jobs.
+
+Jobs live in the ``parse_jobs`` collection, so they survive restarts and can
+be claimed by any process running a ``JobWorkerPool`` (the API itself or
+``python worker.py``). A worker claims a job atomically with a lease; a job
+whose worker died is reclaimed once its lease expires (a live worker renews
+it while the handler runs, and only the lease holder can settle the job), up to
+``PARSE_JOB_MAX_ATTEMPTS`` times (a job that keeps killing its worker then
+fails). Finished jobs expire through a TTL index.
+"""
+
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+
+from .config import get_settings
+from . import mongodb
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+JobHandler = Callable[[dict, str], Awaitable[dict]]
+
+
+class RetryJob(Exception):
+    """Raised by a handler to put the job back on the queue after ``delay_s``."""
+
+    def __init__(self, message: str, delay_s: float = 1.0):
+        super().__init__(message)
+        self.delay_s = delay_s
+
+
+# Wakes local workers on enqueue and local long-pollers on completion; other
+# processes notice changes by polling.
+_job_added: Optional[asyncio.Event] = None
+_job_finished: Optional[asyncio.Event] = None
+
+
+def _added_event() -> asyncio.Event:
+    global _job_added
+    if _job_added is None:
+        _job_added = asyncio.Event()
+    return _job_added
+
+
+def _finished_event() -> asyncio.Event:
+    global _job_finished
+    if _job_finished is None:
+        _job_finished = asyncio.Event()
+    return _job_finished
+
+
+def _notify_finished() -> None:
+    """Wake every local long-poller; each re-reads its own job."""
+    global _job_finished
+    event, _job_finished = _finished_event(), asyncio.Event()
+    event.set()
+
+
+def serialize_job(doc: Optional[dict]) -> Optional[dict]:
+    """Public view of a job document."""
+    if doc is None:
+        return None
+    return {
+        "id": doc["_id"],
+        "kind": doc["kind"],
+        "status": doc["status"],
+        "result": doc.get("result"),
+        "error": doc.get("error"),
+        "attempts": doc.get("attempts", 0),
+        "created_at": doc["created_at"],
+        "updated_at": doc["updated_at"],
+    }
+
+
+# ============ Queue Operations ============
+
+async def ensure_job_indexes() -> None:
+    db = mongodb.get_database()
+    await db.parse_jobs.create_index([("status", 1), ("run_after", 1)])
+    await db.parse_jobs.create_index([("user_id", 1), ("created_at", -1)])
+    await db.parse_jobs.create_index("expires_at", expireAfterSeconds=0)
+
+
+async def enqueue_job(user_id: str, kind: str, payload: dict) -> dict:
+    """Insert a queued job and wake local workers."""
+    db = mongodb.get_database()
+    now = datetime.utcnow()
+    job = {
+        "_id": uuid.uuid4().hex,
+        "user_id": user_id,
+        "kind": kind,
+        "payload": payload,
+        "status": QUEUED,
+        "attempts": 0,
+        "run_after": now,
+        "created_at": now,
+        "updated_at": now,
+    }
+    await db.parse_jobs.insert_one(job)
+    _added_event().set()
+    return serialize_job(job)
+
+
+async def get_job(job_id: str, user_id: str) -> Optional[dict]:
+    """Get a job owned by the user."""
+    db = mongodb.get_database()
+    job = await db.parse_jobs.find_one({"_id": job_id, "user_id": user_id}, {"payload": 0})
+    return serialize_job(job)
+
+
+async def wait_for_job(job_id: str, user_id: str, timeout_s: float) -> Optional[dict]:
+    """Long-poll: return the job once finished, or its current state after ``timeout_s``."""
+    settings = get_settings()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout_s
+    while True:
+        event = _finished_event()
+        job = await get_job(job_id, user_id)
+        remaining = deadline - loop.time()
+        if job is None or job["status"] in (DONE, FAILED) or remaining <= 0:
+            return job
+        try:
+            await asyncio.wait_for(event.wait(), timeout=min(remaining, settings.parse_job_poll_interval_s))
+        except asyncio.TimeoutError:
+            pass
+
+
+async def claim_job(worker_id: str) -> Optional[dict]:
+    """Atomically claim the oldest runnable job (or one whose lease has expired with attempts left)."""
+    from pymongo import ReturnDocument
+
+    db = mongodb.get_database()
+    settings = get_settings()
+    now = datetime.utcnow()
+    return await db.parse_jobs.find_one_and_update(
+        {"$or": [
+            {"status": QUEUED, "run_after": {"$lte": now}},
+            {
+                "status": RUNNING,
+                "lease_until": {"$lt": now},
+                "attempts": {"$lt": settings.parse_job_max_attempts},
+            },
+        ]},
+        {
+            "$set": {
+                "status": RUNNING,
+                "worker_id": worker_id,
+                "lease_until": now + timedelta(seconds=settings.parse_job_lease_s),
+                "updated_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("run_after", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def _settle(status: str, result: Optional[dict], error: Optional[str]) -> dict:
+    now = datetime.utcnow()
+    return {
+        "$set": {
+            "status": status,
+            "result": result,
+            "error": error,
+            "updated_at": now,
+            "expires_at": now + timedelta(seconds=get_settings().parse_job_result_ttl_s),
+        },
+        # Images can be large; keep only the result once the job is settled.
+        "$unset": {"payload": "", "lease_until": "", "worker_id": ""},
+    }
+
+
+async def renew_lease(job_id: str, worker_id: str) -> bool:
+    """Extend a claimed job's lease; False if the worker no longer holds it."""
+    db = mongodb.get_database()
+    now = datetime.utcnow()
+    result = await db.parse_jobs.update_one(
+        {"_id": job_id, "status": RUNNING, "worker_id": worker_id},
+        {"$set": {"lease_until": now + timedelta(seconds=get_settings().parse_job_lease_s), "updated_at": now}},
+    )
+    return result.matched_count == 1
+
+
+async def _finish_job(job_id: str, worker_id: str, status: str, result: Optional[dict], error: Optional[str]) -> None:
+    db = mongodb.get_database()
+    outcome = await db.parse_jobs.update_one({"_id": job_id, "worker_id": worker_id}, _settle(status, result, error))
+    if outcome.matched_count == 0:
+        print(f"[Jobs] Job {job_id} was reclaimed by another worker; dropping this result")
+        return
+    _notify_finished()
+
+
+async def complete_job(job_id: str, worker_id: str, result: dict) -> None:
+    await _finish_job(job_id, worker_id, DONE, result, None)
+
+
+async def fail_job(job_id: str, worker_id: str, error: str) -> None:
+    await _finish_job(job_id, worker_id, FAILED, None, error)
+
+
+async def fail_abandoned_jobs() -> int:
+    """Fail jobs whose lease expired on their last allowed attempt; returns how many."""
+    db = mongodb.get_database()
+    settings = get_settings()
+    result = await db.parse_jobs.update_many(
+        {
+            "status": RUNNING,
+            "lease_until": {"$lt": datetime.utcnow()},
+            "attempts": {"$gte": settings.parse_job_max_attempts},
+        },
+        _settle(FAILED, None, f"Worker lost the job {settings.parse_job_max_attempts} times"),
+    )
+    if result.modified_count:
+        print(f"[Jobs] Failed {result.modified_count} job(s) that outlived their workers")
+        _notify_finished()
+    return result.modified_count
+
+
+async def requeue_job(job_id: str, worker_id: str, delay_s: float = 0.0) -> None:
+    """Put a claimed job back on the queue."""
+    db = mongodb.get_database()
+    now = datetime.utcnow()
+    await db.parse_jobs.update_one(
+        {"_id": job_id, "worker_id": worker_id},
+        {
+            "$set": {"status": QUEUED, "run_after": now + timedelta(seconds=delay_s), "updated_at": now},
+            "$unset": {"lease_until": "", "worker_id": ""},
+        },
+    )
+
+
+# ============ Worker Pool ============
+
+class JobWorkerPool:
+    """Runs queued jobs on at most ``concurrency`` concurrent workers."""
+
+    def __init__(self, handlers: Dict[str, JobHandler], concurrency: int = 2):
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._tasks = []
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+        print(f"[Jobs] Started {self.concurrency} worker(s) as {self.worker_id}")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self) -> None:
+        settings = get_settings()
+        added = _added_event()
+        while True:
+            # Clear before claiming so an enqueue during the claim is not missed.
+            added.clear()
+            try:
+                job = await claim_job(self.worker_id)
+            except Exception as e:
+                print(f"[Jobs] Claim failed: {type(e).__name__}: {str(e)}")
+                job = None
+            if job is None:
+                try:
+                    await fail_abandoned_jobs()
+                except Exception as e:
+                    print(f"[Jobs] Sweeping abandoned jobs failed: {type(e).__name__}: {str(e)}")
+                try:
+                    await asyncio.wait_for(added.wait(), timeout=settings.parse_job_poll_interval_s)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._execute(job)
+            except Exception as e:
+                # Settling failed (e.g. a step-down); the lease expires and the job is retried.
+                print(f"[Jobs] Settling job {job['_id']} failed: {type(e).__name__}: {str(e)}")
+
+    async def _keep_lease(self, job_id: str) -> None:
+        interval = get_settings().parse_job_lease_s / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not await renew_lease(job_id, self.worker_id):
+                    print(f"[Jobs] Lost the lease on job {job_id}")
+                    return
+            except Exception as e:
+                print(f"[Jobs] Renewing the lease on job {job_id} failed: {type(e).__name__}: {str(e)}")
+
+    async def _execute(self, job: dict) -> None:
+        settings = get_settings()
+        job_id = job["_id"]
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            await fail_job(job_id, self.worker_id, f"Unknown job kind: {job['kind']}")
+            return
+        lease = asyncio.create_task(self._keep_lease(job_id))
+        try:
+            result = await handler(job["payload"], job["user_id"])
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back instead of waiting for the lease to expire.
+            await asyncio.shield(requeue_job(job_id, self.worker_id))
+            raise
+        except RetryJob as e:
+            if job["attempts"] >= settings.parse_job_max_attempts:
+                await fail_job(job_id, self.worker_id, str(e))
+            else:
+                print(f"[Jobs] Job {job_id} retrying in {e.delay_s:.1f}s: {str(e)}")
+                await requeue_job(job_id, self.worker_id, e.delay_s)
+            return
+        except Exception as e:
+            print(f"[Jobs] Job {job_id} failed: {type(e).__name__}: {str(e)}")
+            await fail_job(job_id, self.worker_id, str(e))
+            return
+        finally:
+            lease.cancel()
+        await complete_job(job_id, self.worker_id, result)
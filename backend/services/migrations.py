@@ -0,0 +1,82 @@
+"""Versioned database migrations.
+
+Each migration runs once per database and is recorded in the
+``migrations`` collection. They run at startup, after the connection
+indexes. Migrations must be idempotent: several API processes starting
+together may run the same one before any of them records it.
+"""
+
+from datetime import datetime
+from typing import Awaitable, Callable, List, Tuple
+
+from .mongodb import get_database, item_terms
+
+Migration = Callable[[object], Awaitable[None]]
+MIGRATIONS: List[Tuple[int, str, Migration]] = []
+
+
+def migration(number: int, name: str):
+    """Register ``fn(db)`` as migration ``number``."""
+    def register(fn: Migration) -> Migration:
+        MIGRATIONS.append((number, name, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+async def run_migrations() -> List[int]:
+    """Apply the migrations not yet recorded; returns their numbers."""
+    db = get_database()
+    done = {doc["_id"] async for doc in db.migrations.find({}, {"_id": 1})}
+    applied = []
+    for number, name, fn in MIGRATIONS:
+        if number in done:
+            continue
+        print(f"[Migrations] Applying {number}: {name}")
+        await fn(db)
+        await db.migrations.update_one(
+            {"_id": number},
+            {"$set": {"name": name, "applied_at": datetime.utcnow()}},
+            upsert=True,
+        )
+        applied.append(number)
+    return applied
+
+
+# ============ Migrations ============
+
+@migration(1, "entry filter indexes and item search terms")
+async def _entry_filters(db) -> None:
+    from pymongo import UpdateOne
+
+    # Backfill the search terms create_food_entry now stores.
+    batch = []
+    async for entry in db.food_entries.find({"item_terms": {"$exists": False}}, {"items.name": 1}):
+        batch.append(UpdateOne({"_id": entry["_id"]}, {"$set": {"item_terms": item_terms(entry.get("items"))}}))
+        if len(batch) >= 1000:
+            await db.food_entries.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        await db.food_entries.bulk_write(batch, ordered=False)
+
+    # Date ranges use the existing (user_id, logged_at) index.
+    await db.food_entries.create_index([("user_id", 1), ("meal_label", 1), ("logged_at", -1)])
+    await db.food_entries.create_index([("user_id", 1), ("item_terms", 1), ("logged_at", -1)])
+
+
+@migration(2, "monthly entry archive indexes")
+async def _entry_archive(db) -> None:
+    await db.food_entry_archive.create_index([("user_id", 1), ("month", 1), ("seq", 1)], unique=True)
+    await db.food_entry_archive.create_index([("user_id", 1), ("entries.id", 1)])
+
+
+@migration(3, "llm usage indexes")
+async def _llm_usage(db) -> None:
+    await db.llm_usage.create_index([("t", 1)])
+    await db.llm_usage.create_index([("u", 1), ("t", 1)])
+
+
+@migration(4, "entry archive compaction index")
+async def _archive_compaction(db) -> None:
+    # compact_archives looks for old entries across all users.
+    await db.food_entries.create_index([("logged_at", 1)])
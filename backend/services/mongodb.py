@@ -1,19 +1,36 @@
 """MongoDB connection and database operations."""
 
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
-from typing import Optional, List
-from datetime import datetime
+import re
+from typing import TYPE_CHECKING, AsyncIterator, Optional, List
+from datetime import date, datetime, timedelta
 from bson import ObjectId
 
 from .config import get_settings
+from .food_memory import FoodMemory, MEAL_LABELS, build_memory_update, stale_food_keys
+from .sync import publish_change
+from .archive import (
+    NUTRIENTS,
+    archived_entries,
+    delete_archived_entry,
+    find_archived_entry,
+    iter_archived_entries,
+    merge_newest,
+    merge_oldest,
+)
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 
 # Global database client
-_client: Optional[AsyncIOMotorClient] = None
-_db: Optional[AsyncIOMotorDatabase] = None
+_client: Optional["AsyncIOMotorClient"] = None
+_db: Optional["AsyncIOMotorDatabase"] = None
 
 
 async def connect_to_mongodb():
     """Connect to MongoDB."""
+    # The driver is imported on first connect, not when the app module is imported.
+    from motor.motor_asyncio import AsyncIOMotorClient
+
     global _client, _db
     settings = get_settings()
     _client = AsyncIOMotorClient(settings.mongodb_uri)
@@ -22,6 +39,7 @@ async def connect_to_mongodb():
     # Create indexes
     await _db.users.create_index("email", unique=True)
     await _db.food_entries.create_index([("user_id", 1), ("logged_at", -1)])
+    await _db.food_memory.create_index("user_id", unique=True)
 
     print(f"Connected to MongoDB: {_db.name}")
 
@@ -34,7 +52,7 @@ async def close_mongodb_connection():
         print("MongoDB connection closed")
 
 
-def get_database() -> AsyncIOMotorDatabase:
+def get_database() -> "AsyncIOMotorDatabase":
     """Get database instance."""
     if _db is None:
         raise RuntimeError("Database not connected. Call connect_to_mongodb() first.")
@@ -83,6 +101,19 @@ async def get_user_by_id(user_id: str) -> Optional[dict]:
     return serialize_doc(user)
 
 
+# ============ Data Versions ============
+
+# Per-user counters on the user document, bumped after every write to the
+# data behind a cacheable GET; ETags are derived from them (see http_cache.py).
+DATA_KINDS = ("entries", "goals", "settings")
+
+
+async def bump_data_version(user_id: str, kind: str) -> None:
+    """Mark one kind of the user's data as changed."""
+    db = get_database()
+    await db.users.update_one({"_id": ObjectId(user_id)}, {"$inc": {f"data_versions.{kind}": 1}})
+
+
 # ============ Food Entry Operations ============
 
 async def create_food_entry(user_id: str, entry_data: dict) -> dict:
@@ -92,20 +123,142 @@ async def create_food_entry(user_id: str, entry_data: dict) -> dict:
     entry = {
         **entry_data,
         "user_id": user_id,
+        "item_terms": item_terms(entry_data.get("items")),
         "created_at": now,
         "updated_at": now,
     }
     result = await db.food_entries.insert_one(entry)
     entry["_id"] = result.inserted_id
-    return serialize_doc(entry)
+    entry = serialize_doc(entry)
+    await bump_data_version(user_id, "entries")
+    publish_change(user_id, "entries", "upsert", entry)
+    try:
+        await record_food_memory(user_id, entry)
+    except Exception as e:
+        # The entry is saved: failing the request now would make the client retry and save it twice.
+        print(f"[Memory] Could not update food memory for entry {entry['id']}: {type(e).__name__}: {str(e)}")
+    return entry
+
+
+async def get_food_entries(
+    user_id: str,
+    limit: int = 100,
+    projection: Optional[dict] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    meal: Optional[str] = None,
+    text: Optional[str] = None,
+) -> List[dict]:
+    """Get a user's latest food entries, optionally filtered (see ``entries_filter``).
+
+    Archived entries are merged in; when the hot collection fills the page,
+    only archive buckets overlapping it are read.
+    """
+    db = get_database()
+    query = entries_filter(user_id, start, end, meal, text)
+    cursor = db.food_entries.find(query, projection).sort("logged_at", -1).limit(limit)
+    entries = [serialize_doc(e) for e in await cursor.to_list(length=limit)]
+    not_before = entries[-1]["logged_at"] if len(entries) >= limit else None
+    first, after_last = _day_bounds(start, end)
+    archived = await archived_entries(db, user_id, limit, first, after_last, meal, _search_words(text), not_before)
+    if not archived:
+        return entries
+    return merge_newest(entries, archived, limit)
+
+
+_TERM_RE = re.compile(r"\w+")
+
+
+def item_terms(items: Optional[list]) -> List[str]:
+    """Lowercased words of an entry's item names, stored for item search."""
+    terms = set()
+    for item in items or []:
+        terms.update(_TERM_RE.findall((item.get("name") or "").lower()))
+    return sorted(terms)
+
+
+def entries_filter(
+    user_id: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    meal: Optional[str] = None,
+    text: Optional[str] = None,
+) -> dict:
+    """Query for a user's entries logged from ``start`` through ``end`` (inclusive days).
+
+    ``logged_at`` is an ISO string, so day bounds compare as string prefixes.
+    ``text`` matches entries with an item word starting with each of its
+    words ("chick bre" finds "Chicken breast"), an anchored prefix the
+    ``(user_id, item_terms, logged_at)`` index can bound.
+    """
+    query: dict = {"user_id": user_id}
+    first, after_last = _day_bounds(start, end)
+    logged_at = {}
+    if first is not None:
+        logged_at["$gte"] = first
+    if after_last is not None:
+        logged_at["$lt"] = after_last
+    if logged_at:
+        query["logged_at"] = logged_at
+    if meal is not None:
+        query["meal_label"] = meal
+    words = _search_words(text)
+    if words:
+        query["$and"] = [{"item_terms": {"$regex": "^" + re.escape(word)}} for word in words]
+    return query
+
+
+def _day_bounds(start: Optional[date], end: Optional[date]) -> tuple:
+    """``logged_at`` string bounds: first day inclusive, the day after ``end`` exclusive."""
+    return (
+        start.isoformat() if start is not None else None,
+        (end + timedelta(days=1)).isoformat() if end is not None else None,
+    )
+
+
+def _search_words(text: Optional[str]) -> List[str]:
+    return _TERM_RE.findall(text.lower()) if text else []
 
 
-async def get_food_entries(user_id: str, limit: int = 100) -> List[dict]:
-    """Get food entries for a user."""
+async def iter_food_entries(
+    user_id: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    projection: Optional[dict] = None,
+    batch_size: int = 500,
+) -> AsyncIterator[dict]:
+    """Stream a user's entries oldest first, ``batch_size`` documents per round trip.
+
+    Archived entries are merged in one bucket at a time.
+    """
     db = get_database()
-    cursor = db.food_entries.find({"user_id": user_id}).sort("logged_at", -1).limit(limit)
-    entries = await cursor.to_list(length=limit)
-    return [serialize_doc(e) for e in entries]
+    cursor = db.food_entries.find(entries_filter(user_id, start, end), projection)
+    cursor = cursor.sort("logged_at", 1).batch_size(batch_size)
+
+    async def hot():
+        async for entry in cursor:
+            yield serialize_doc(entry)
+
+    async for entry in merge_oldest(hot(), iter_archived_entries(db, user_id, *_day_bounds(start, end))):
+        yield entry
+
+
+async def get_daily_totals(user_id: str, start: Optional[date] = None, end: Optional[date] = None) -> List[dict]:
+    """Nutrient totals and entry counts per day (the date part of ``logged_at``), oldest first."""
+    days: dict = {}
+    async for entry in iter_food_entries(user_id, start, end, projection={"logged_at": 1, "totals": 1}):
+        day = (entry.get("logged_at") or "")[:10]
+        totals = entry.get("totals") or {}
+        summary = days.get(day)
+        if summary is None:
+            summary = days[day] = {"date": day, "entries": 0, **{name: 0.0 for name in NUTRIENTS}}
+        summary["entries"] += 1
+        for name in NUTRIENTS:
+            summary[name] += totals.get(name) or 0
+    for summary in days.values():
+        for name in NUTRIENTS:
+            summary[name] = round(summary[name], 1)
+    return list(days.values())
 
 
 async def get_food_entry_by_id(entry_id: str, user_id: str) -> Optional[dict]:
@@ -115,17 +268,61 @@ async def get_food_entry_by_id(entry_id: str, user_id: str) -> Optional[dict]:
         "_id": ObjectId(entry_id),
         "user_id": user_id
     })
+    if entry is None:
+        return await find_archived_entry(db, entry_id, user_id)
     return serialize_doc(entry)
 
 
 async def delete_food_entry(entry_id: str, user_id: str) -> bool:
     """Delete a food entry."""
     db = get_database()
-    result = await db.food_entries.delete_one({
-        "_id": ObjectId(entry_id),
-        "user_id": user_id
-    })
-    return result.deleted_count > 0
+    doc = await db.food_entries.find_one_and_delete(
+        {"_id": ObjectId(entry_id), "user_id": user_id},
+        projection={"archiving": 1},
+    )
+    if doc is not None and doc.get("archiving"):
+        # Being compacted: its archived copy may already be written.
+        await delete_archived_entry(db, entry_id, user_id)
+    deleted = doc is not None or await delete_archived_entry(db, entry_id, user_id)
+    if deleted:
+        await bump_data_version(user_id, "entries")
+        publish_change(user_id, "entries", "delete", doc_id=entry_id)
+        await db.food_memory.update_one(
+            {"user_id": user_id},
+            {"$pull": {f"meals.{meal}": {"entry_id": entry_id} for meal in MEAL_LABELS}},
+        )
+    return deleted
+
+
+# ============ Food Memory Operations ============
+
+async def record_food_memory(user_id: str, entry: dict) -> None:
+    """Fold a saved entry into the user's food memory."""
+    settings = get_settings()
+    if not settings.food_memory:
+        return
+    update = build_memory_update(entry, settings.food_memory_meal_history)
+    if update is None:
+        return
+    db = get_database()
+    await db.food_memory.update_one({"user_id": user_id}, update, upsert=True)
+
+
+async def get_food_memory(user_id: str) -> FoodMemory:
+    """Get the user's food memory (one indexed read), trimming it if it has grown too large."""
+    db = get_database()
+    doc = await db.food_memory.find_one({"user_id": user_id}, {"_id": 0})
+    if doc is None:
+        return FoodMemory()
+    stale = stale_food_keys(doc, get_settings().food_memory_max_foods)
+    if stale:
+        await db.food_memory.update_one(
+            {"user_id": user_id},
+            {"$unset": {f"foods.{key}": "" for key in stale}},
+        )
+        for key in stale:
+            del doc["foods"][key]
+    return FoodMemory(doc)
 
 
 # ============ Goals Operations ============
@@ -160,8 +357,10 @@ async def update_user_goals(user_id: str, goals_data: dict) -> dict:
         {"$set": goals},
         upsert=True
     )
-    result = await db.user_goals.find_one({"user_id": user_id})
-    return serialize_doc(result)
+    await bump_data_version(user_id, "goals")
+    result = serialize_doc(await db.user_goals.find_one({"user_id": user_id}))
+    publish_change(user_id, "goals", "upsert", result)
+    return result
 
 
 # ============ Settings Operations ============
@@ -194,5 +393,7 @@ async def update_user_settings(user_id: str, settings_data: dict) -> dict:
         {"$set": settings},
         upsert=True
     )
-    result = await db.user_settings.find_one({"user_id": user_id})
-    return serialize_doc(result)
+    await bump_data_version(user_id, "settings")
+    result = serialize_doc(await db.user_settings.find_one({"user_id": user_id}))
+    publish_change(user_id, "settings", "upsert", result)
+    return result
@@ -0,0 +1,354 @@
+"""Local nutrition database built from OpenFoodFacts / FoodData Central dumps.
+
+Foods are stored per 100 g in a SQLite file (``NUTRITION_DB_PATH``) together
+with their household portions (grams per cup, slice, medium piece, ...) and
+an FTS5 search index over name and brand. ``import_nutrition.py`` builds
+the file; at runtime it is opened read-only and ``resolve()`` turns a food
+name, quantity and unit into nutrient totals without any network call.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from .cache import TTLCache
+from .config import get_settings
+from .food_names import normalize_food_name
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS foods (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    source_id TEXT NOT NULL,
+    code TEXT,
+    name TEXT NOT NULL,
+    brand TEXT,
+    generic INTEGER NOT NULL DEFAULT 0,
+    kcal REAL NOT NULL,
+    protein_g REAL NOT NULL,
+    carbs_g REAL NOT NULL,
+    fat_g REAL NOT NULL,
+    serving_g REAL,
+    UNIQUE (source, source_id)
+);
+CREATE TABLE IF NOT EXISTS portions (
+    food_id INTEGER NOT NULL,
+    unit TEXT NOT NULL,
+    grams REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS portions_food ON portions (food_id);
+CREATE INDEX IF NOT EXISTS foods_code ON foods (code);
+CREATE VIRTUAL TABLE IF NOT EXISTS foods_fts USING fts5(
+    name, brand, content='foods', content_rowid='id', tokenize='porter unicode61'
+);
+"""
+
+# Grams per unit for mass units.
+MASS_UNITS = {
+    "g": 1.0, "gram": 1.0, "grams": 1.0, "gr": 1.0,
+    "kg": 1000.0, "kilogram": 1000.0, "kilograms": 1000.0,
+    "mg": 0.001, "milligram": 0.001, "milligrams": 0.001,
+    "oz": 28.3495, "ounce": 28.3495, "ounces": 28.3495,
+    "lb": 453.592, "lbs": 453.592, "pound": 453.592, "pounds": 453.592,
+    "100g": 100.0,
+}
+# Millilitres per unit; converted at water density unless the food has a matching portion.
+VOLUME_UNITS = {
+    "ml": 1.0, "milliliter": 1.0, "milliliters": 1.0, "millilitre": 1.0, "millilitres": 1.0,
+    "l": 1000.0, "liter": 1000.0, "liters": 1000.0, "litre": 1000.0, "litres": 1000.0,
+    "cup": 240.0, "cups": 240.0,
+    "tbsp": 15.0, "tablespoon": 15.0, "tablespoons": 15.0,
+    "tsp": 5.0, "teaspoon": 5.0, "teaspoons": 5.0,
+    "fl oz": 29.5735, "floz": 29.5735,
+    "glass": 250.0, "glasses": 250.0,
+    "can": 330.0, "cans": 330.0,
+    "bottle": 500.0, "bottles": 500.0,
+}
+# Units that count portions; resolved through the food's portions or serving size.
+COUNT_UNITS = {
+    "serving", "servings", "piece", "pieces", "pc", "pcs", "item", "items", "slice", "slices",
+    "bowl", "bowls", "scoop", "scoops", "handful", "handfuls", "bar", "bars",
+    "small", "medium", "large", "whole",
+}
+# Portion names tried, in order, for a bare count ("2 eggs").
+_DEFAULT_PORTIONS = ("medium", "piece", "serving", "whole", "large", "small", "slice")
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def canonical_unit(unit: Optional[str]) -> Optional[str]:
+    """Singular lowercase unit name ("Cups" -> "cup", "slices" -> "slice")."""
+    if unit is None:
+        return None
+    unit = unit.strip().lower().rstrip(".")
+    if not unit:
+        return None
+    if unit in ("fl oz", "fl. oz", "fluid ounce", "fluid ounces"):
+        return "fl oz"
+    if unit.endswith("es") and unit[:-2] in ("glass", "dish", "pouch"):
+        return unit[:-2]
+    if unit.endswith("s") and not unit.endswith("ss") and unit not in ("lbs", "gs") and len(unit) > 3:
+        return unit[:-1]
+    return unit
+
+
+@dataclass
+class FoodRecord:
+    """One food per 100 g."""
+    id: int
+    source: str
+    name: str
+    brand: Optional[str]
+    generic: bool
+    kcal: float
+    protein_g: float
+    carbs_g: float
+    fat_g: float
+    serving_g: Optional[float]
+    code: Optional[str] = None
+
+
+@dataclass
+class ResolvedNutrients:
+    """Nutrient totals for an eaten portion of a database food."""
+    calories: float
+    protein_g: float
+    carbs_g: float
+    fat_g: float
+    grams: float
+    food: FoodRecord
+
+
+# ============ Database ============
+
+class NutritionDatabase:
+    """Read-only access to the imported nutrition database."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._search_cache = TTLCache(max_entries=5000, ttl_s=24 * 3600)
+        self._portion_cache = TTLCache(max_entries=5000, ttl_s=24 * 3600)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _query(self, sql: str, params: Iterable = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, tuple(params)).fetchall()
+
+    def count(self) -> int:
+        return self._query("SELECT COUNT(*) FROM foods")[0][0]
+
+    def get(self, food_id: int) -> Optional[FoodRecord]:
+        rows = self._query("SELECT * FROM foods WHERE id = ?", (food_id,))
+        return _record(rows[0]) if rows else None
+
+    def get_by_code(self, code: str) -> Optional[FoodRecord]:
+        """Food with the given barcode, if imported."""
+        rows = self._query("SELECT * FROM foods WHERE code = ? LIMIT 1", (code,))
+        return _record(rows[0]) if rows else None
+
+    def portions(self, food_id: int) -> Dict[str, float]:
+        """Grams per household unit for a food (first listed portion wins per unit)."""
+        cached = self._portion_cache.get(food_id)
+        if cached is not None:
+            return cached
+        portions: Dict[str, float] = {}
+        for row in self._query("SELECT unit, grams FROM portions WHERE food_id = ? ORDER BY rowid", (food_id,)):
+            portions.setdefault(row["unit"], row["grams"])
+        self._portion_cache.set(food_id, portions)
+        return portions
+
+    def search(self, query: str, brand: Optional[str] = None, limit: int = 10) -> List[FoodRecord]:
+        """Best matches for a food name, most relevant first."""
+        key = (normalize_food_name(query, keep_sizes=False), (brand or "").lower(), limit)
+        cached = self._search_cache.get(key)
+        if cached is not None:
+            return cached
+
+        tokens = _TOKEN_RE.findall(key[0])
+        if not tokens:
+            return []
+        terms = " ".join(f'"{t}"' for t in tokens)
+        sql = (
+            "SELECT foods.* FROM foods_fts JOIN foods ON foods.id = foods_fts.rowid "
+            "WHERE foods_fts MATCH ? ORDER BY bm25(foods_fts, 10.0, 1.0) LIMIT 50"
+        )
+        rows = self._query(sql, (terms,))
+        if not rows and len(tokens) > 1:
+            # No food has every word; fall back to any word.
+            rows = self._query(sql, (" OR ".join(f'"{t}"' for t in tokens),))
+
+        records = [_record(row) for row in rows]
+        records.sort(key=lambda r: _match_score(r, tokens, brand), reverse=True)
+        results = records[:limit]
+        self._search_cache.set(key, results)
+        return results
+
+    def grams_for(self, food: FoodRecord, qty: Optional[float], unit: Optional[str],
+                  estimated_grams: Optional[float] = None) -> Optional[float]:
+        """Grams eaten for a quantity and unit of ``food``, or None if the unit can't be converted.
+
+        Order: explicit mass units, the food's own portion for the unit,
+        then the model's gram estimate; failing those, volume at water
+        density, or (for counts and servings) a default portion or the
+        serving size. Water density only suits drinks: a cup of cereal
+        weighs ~30 g, a cup of cooked rice ~160 g.
+        """
+        quantity = qty if qty is not None and qty > 0 else 1.0
+        unit = canonical_unit(unit)
+        if unit in MASS_UNITS:
+            return quantity * MASS_UNITS[unit]
+
+        portions = self.portions(food.id)
+        if unit is not None and unit in portions:
+            return quantity * portions[unit]
+        if estimated_grams is not None and estimated_grams > 0:
+            return estimated_grams
+        if unit in VOLUME_UNITS:
+            return quantity * VOLUME_UNITS[unit]
+        if unit is not None and unit not in COUNT_UNITS:
+            # Unknown unit ("bowl of", "plate") and no estimate from the model.
+            return None
+        for name in _DEFAULT_PORTIONS:
+            if name in portions:
+                return quantity * portions[name]
+        if food.serving_g:
+            return quantity * food.serving_g
+        return None
+
+    def resolve(self, name: str, qty: Optional[float], unit: Optional[str],
+                estimated_grams: Optional[float] = None, brand: Optional[str] = None) -> Optional[ResolvedNutrients]:
+        """Nutrient totals for an eaten portion of the best-matching food, or None."""
+        matches = self.search(name, brand=brand, limit=1)
+        if not matches or _coverage(matches[0], _TOKEN_RE.findall(normalize_food_name(name, keep_sizes=False))) < 0.5:
+            return None
+        food = matches[0]
+        grams = self.grams_for(food, qty, unit, estimated_grams)
+        if grams is None:
+            return None
+        factor = grams / 100.0
+        return ResolvedNutrients(
+            calories=round(food.kcal * factor, 1),
+            protein_g=round(food.protein_g * factor, 1),
+            carbs_g=round(food.carbs_g * factor, 1),
+            fat_g=round(food.fat_g * factor, 1),
+            grams=round(grams, 1),
+            food=food,
+        )
+
+
+def _record(row: sqlite3.Row) -> FoodRecord:
+    return FoodRecord(
+        id=row["id"],
+        source=row["source"],
+        name=row["name"],
+        brand=row["brand"],
+        generic=bool(row["generic"]),
+        kcal=row["kcal"],
+        protein_g=row["protein_g"],
+        carbs_g=row["carbs_g"],
+        fat_g=row["fat_g"],
+        serving_g=row["serving_g"],
+        code=row["code"],
+    )
+
+
+def _coverage(record: FoodRecord, tokens: List[str]) -> float:
+    """Share of the query words that appear in the food's name."""
+    if not tokens:
+        return 0.0
+    name_tokens = set(_TOKEN_RE.findall(normalize_food_name(record.name)))
+    return len(set(tokens) & name_tokens) / len(set(tokens))
+
+
+def _match_score(record: FoodRecord, tokens: List[str], brand: Optional[str]) -> float:
+    """Relevance of a candidate: query-word coverage, few extra words, generic foods first."""
+    name_tokens = set(_TOKEN_RE.findall(normalize_food_name(record.name)))
+    extra = len(name_tokens - set(tokens))
+    score = 3.0 * _coverage(record, tokens) - 0.25 * extra
+    if brand:
+        if record.brand and brand.lower() in record.brand.lower():
+            score += 2.0
+    elif record.generic:
+        score += 1.0
+    # A name that starts with the query ("banana, raw") beats one that merely contains it.
+    if name_tokens and tokens and normalize_food_name(record.name).startswith(tokens[0]):
+        score += 0.5
+    return score
+
+
+# ============ Writing (import) ============
+
+def create_database(path: str) -> sqlite3.Connection:
+    """Open (creating if needed) a database file for importing."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def insert_foods(conn: sqlite3.Connection, foods: Iterable[dict]) -> int:
+    """Upsert parsed foods (see services/nutrition_import.py) and their portions."""
+    count = 0
+    for food in foods:
+        cursor = conn.execute(
+            "INSERT INTO foods (source, source_id, code, name, brand, generic, kcal, protein_g, carbs_g, fat_g, serving_g) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (source, source_id) DO UPDATE SET code = excluded.code, name = excluded.name, "
+            "brand = excluded.brand, generic = excluded.generic, kcal = excluded.kcal, "
+            "protein_g = excluded.protein_g, carbs_g = excluded.carbs_g, fat_g = excluded.fat_g, "
+            "serving_g = excluded.serving_g "
+            "RETURNING id",
+            (
+                food["source"], food["source_id"], food.get("code"), food["name"], food.get("brand"),
+                1 if food.get("generic") else 0, food["kcal"], food["protein_g"], food["carbs_g"],
+                food["fat_g"], food.get("serving_g"),
+            ),
+        )
+        food_id = cursor.fetchone()[0]
+        portions = food.get("portions") or {}
+        if portions:
+            conn.execute("DELETE FROM portions WHERE food_id = ?", (food_id,))
+            conn.executemany(
+                "INSERT INTO portions (food_id, unit, grams) VALUES (?, ?, ?)",
+                [(food_id, unit, grams) for unit, grams in portions.items()],
+            )
+        count += 1
+    return count
+
+
+def rebuild_search_index(conn: sqlite3.Connection) -> None:
+    conn.execute("INSERT INTO foods_fts (foods_fts) VALUES ('rebuild')")
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+# ============ Singleton ============
+
+_nutrition_db: Optional[NutritionDatabase] = None
+_nutrition_db_loaded = False
+
+
+def get_nutrition_db() -> Optional[NutritionDatabase]:
+    """The imported nutrition database, or None if none has been imported."""
+    global _nutrition_db, _nutrition_db_loaded
+    if not _nutrition_db_loaded:
+        _nutrition_db_loaded = True
+        path = get_settings().nutrition_db_path
+        if path and os.path.exists(path):
+            try:
+                _nutrition_db = NutritionDatabase(path)
+                print(f"[Nutrition] Loaded {_nutrition_db.count()} foods from {path}")
+            except sqlite3.Error as e:
+                print(f"[Nutrition] Could not open {path}: {e}")
+                _nutrition_db = None
+    return _nutrition_db
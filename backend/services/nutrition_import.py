@@ -0,0 +1,274 @@
+"""Parsers turning OpenFoodFacts and FoodData Central dumps into per-100 g food rows.
+
+Each parser yields dicts accepted by ``nutrition_db.insert_foods``::
+
+    {"source", "source_id", "code", "name", "brand", "generic",
+     "kcal", "protein_g", "carbs_g", "fat_g", "serving_g", "portions": {unit: grams}}
+
+Supported inputs:
+
+- OpenFoodFacts CSV export (``en.openfoodfacts.org.products.csv[.gz]``, tab separated)
+  or JSONL dump (``openfoodfacts-products.jsonl[.gz]``)
+- FoodData Central JSON downloads (Foundation, SR Legacy, Survey, Branded) or an
+  unpacked FDC CSV download directory (``food.csv``, ``food_nutrient.csv``, ...)
+"""
+
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import sys
+from typing import Dict, Iterator, Optional
+
+from .nutrition_db import canonical_unit
+
+KJ_PER_KCAL = 4.184
+
+# FDC nutrient ids: energy (kcal, Atwater general/specific), energy (kJ), protein, carbs, fat.
+FDC_KCAL_IDS = (1008, 2047, 2048)
+FDC_KJ_ID = 1062
+FDC_MACRO_IDS = {1003: "protein_g", 1005: "carbs_g", 1004: "fat_g"}
+FDC_NUTRIENT_IDS = set(FDC_KCAL_IDS) | {FDC_KJ_ID} | set(FDC_MACRO_IDS)
+FDC_GENERIC_TYPES = {"foundation_food", "sr_legacy_food", "survey_fndds_food", "Foundation", "SR Legacy", "Survey (FNDDS)"}
+
+_GRAMS_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*(g|gr|grams?|ml)\b", re.IGNORECASE)
+_PORTION_WORDS = ("medium", "large", "small", "slice", "piece", "serving", "whole", "cup", "tbsp", "tsp")
+
+
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(path, "rb"), encoding="utf-8", errors="replace", newline="")
+    return open(path, encoding="utf-8", errors="replace", newline="")
+
+
+def _number(value) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    try:
+        number = float(str(value).replace(",", "."))
+    except ValueError:
+        return None
+    return number if number == number and number >= 0 else None  # drops NaN and negatives
+
+
+def _plausible(kcal: float, protein: float, carbs: float, fat: float) -> bool:
+    """Reject rows whose per-100 g values cannot be real (typos, per-package values)."""
+    if kcal > 950 or protein > 100 or carbs > 100 or fat > 100:
+        return False
+    return protein + carbs + fat <= 105
+
+
+def _food(source, source_id, code, name, brand, generic, kcal, protein, carbs, fat, serving_g, portions) -> Optional[dict]:
+    name = (name or "").strip()
+    if not name or kcal is None:
+        return None
+    protein, carbs, fat = protein or 0.0, carbs or 0.0, fat or 0.0
+    if not _plausible(kcal, protein, carbs, fat):
+        return None
+    return {
+        "source": source,
+        "source_id": str(source_id),
+        "code": code or None,
+        "name": name,
+        "brand": (brand or "").strip() or None,
+        "generic": generic,
+        "kcal": round(kcal, 2),
+        "protein_g": round(protein, 2),
+        "carbs_g": round(carbs, 2),
+        "fat_g": round(fat, 2),
+        "serving_g": serving_g if serving_g and 0 < serving_g < 5000 else None,
+        "portions": portions or {},
+    }
+
+
+# ============ OpenFoodFacts ============
+
+def off_record(record: dict) -> Optional[dict]:
+    """Normalize one OFF product (CSV row or JSONL ``nutriments`` layout) to per 100 g."""
+    nutriments = record.get("nutriments") if isinstance(record.get("nutriments"), dict) else record
+
+    def per_100g(key: str) -> Optional[float]:
+        return _number(nutriments.get(f"{key}_100g"))
+
+    serving_g = _number(record.get("serving_quantity"))
+    if serving_g is None:
+        match = _GRAMS_RE.search(str(record.get("serving_size") or ""))
+        serving_g = _number(match.group(1)) if match else None
+
+    kcal = per_100g("energy-kcal")
+    if kcal is None and per_100g("energy") is not None:
+        kcal = per_100g("energy") / KJ_PER_KCAL  # OFF "energy" is kJ
+    protein, carbs, fat = per_100g("proteins"), per_100g("carbohydrates"), per_100g("fat")
+
+    if kcal is None and serving_g:
+        # Per-serving only labels: scale to 100 g.
+        per_serving = _number(nutriments.get("energy-kcal_serving"))
+        if per_serving is not None:
+            factor = 100.0 / serving_g
+            kcal = per_serving * factor
+            protein, carbs, fat = (
+                (_number(nutriments.get(f"{k}_serving")) or 0.0) * factor
+                for k in ("proteins", "carbohydrates", "fat")
+            )
+
+    code = str(record.get("code") or "").strip()
+    portions = {"serving": serving_g} if serving_g and 0 < serving_g < 5000 else {}
+    return _food(
+        "off", code, code if code.isdigit() else None,
+        record.get("product_name") or record.get("generic_name"),
+        record.get("brands"), False, kcal, protein, carbs, fat, serving_g, portions,
+    )
+
+
+def iter_off(path: str) -> Iterator[dict]:
+    """Foods from an OFF CSV export or JSONL dump."""
+    with _open_text(path) as f:
+        if ".jsonl" in path or ".json" in path:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    food = off_record(json.loads(line))
+                except ValueError:
+                    continue
+                if food:
+                    yield food
+            return
+        csv.field_size_limit(sys.maxsize)
+        for row in csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+            food = off_record(row)
+            if food:
+                yield food
+
+
+# ============ FoodData Central ============
+
+def _fdc_portion_unit(measure_unit: str, modifier: str, description: str) -> Optional[str]:
+    """Household unit name for an FDC portion ("cup", "medium", "slice", ...)."""
+    unit = canonical_unit(measure_unit)
+    if unit and unit not in ("undetermined", "unit"):
+        return {"tablespoon": "tbsp", "teaspoon": "tsp"}.get(unit, unit)
+    text = f"{modifier} {description}".lower()
+    for word in _PORTION_WORDS:
+        if re.search(rf"\b{word}", text):
+            return word
+    return None
+
+
+def _fdc_food(fdc_id, data_type, description, brand, code, nutrients: Dict[int, float],
+              serving_g: Optional[float], portions: Dict[str, float]) -> Optional[dict]:
+    kcal = next((nutrients[i] for i in FDC_KCAL_IDS if i in nutrients), None)
+    if kcal is None and FDC_KJ_ID in nutrients:
+        kcal = nutrients[FDC_KJ_ID] / KJ_PER_KCAL
+    return _food(
+        "fdc", fdc_id, code, description, brand, data_type in FDC_GENERIC_TYPES,
+        kcal, nutrients.get(1003), nutrients.get(1005), nutrients.get(1004), serving_g, portions,
+    )
+
+
+def fdc_json_food(food: dict) -> Optional[dict]:
+    """Normalize one food from an FDC JSON download (amounts are already per 100 g)."""
+    nutrients: Dict[int, float] = {}
+    for entry in food.get("foodNutrients") or []:
+        nutrient = entry.get("nutrient") or {}
+        nutrient_id = nutrient.get("id")
+        amount = _number(entry.get("amount"))
+        if nutrient_id in FDC_NUTRIENT_IDS and amount is not None:
+            nutrients.setdefault(nutrient_id, amount)
+
+    portions: Dict[str, float] = {}
+    for portion in food.get("foodPortions") or []:
+        grams = _number(portion.get("gramWeight"))
+        amount = _number(portion.get("amount")) or 1.0
+        unit = _fdc_portion_unit(
+            (portion.get("measureUnit") or {}).get("name") or "",
+            portion.get("modifier") or "",
+            portion.get("portionDescription") or "",
+        )
+        if unit and grams and amount:
+            portions.setdefault(unit, grams / amount)
+
+    serving_g = None
+    if str(food.get("servingSizeUnit") or "").lower() in ("g", "grm", "ml", "mlt"):
+        serving_g = _number(food.get("servingSize"))
+        if serving_g:
+            portions.setdefault("serving", serving_g)
+
+    return _fdc_food(
+        food.get("fdcId"), food.get("dataType"), food.get("description"),
+        food.get("brandName") or food.get("brandOwner"), food.get("gtinUpc"),
+        nutrients, serving_g, portions,
+    )
+
+
+def iter_fdc_json(path: str) -> Iterator[dict]:
+    """Foods from an FDC JSON download (the whole file is loaded; prefer CSV for Branded)."""
+    with _open_text(path) as f:
+        data = json.load(f)
+    lists = data.values() if isinstance(data, dict) else [data]
+    for foods in lists:
+        for food in foods if isinstance(foods, list) else []:
+            parsed = fdc_json_food(food)
+            if parsed:
+                yield parsed
+
+
+def iter_fdc_csv(directory: str, data_types: Optional[set] = None) -> Iterator[dict]:
+    """Foods from an unpacked FDC CSV download, streaming ``food_nutrient.csv``."""
+    def rows(name: str):
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            return iter(())
+        f = _open_text(path)
+        return csv.DictReader(f)
+
+    foods = {}
+    for row in rows("food.csv"):
+        if data_types is None or row["data_type"] in data_types:
+            foods[row["fdc_id"]] = row
+
+    nutrients: Dict[str, Dict[int, float]] = {}
+    for row in rows("food_nutrient.csv"):
+        fdc_id = row["fdc_id"]
+        if fdc_id not in foods:
+            continue
+        nutrient_id = int(row["nutrient_id"]) if row["nutrient_id"].isdigit() else None
+        amount = _number(row["amount"])
+        if nutrient_id in FDC_NUTRIENT_IDS and amount is not None:
+            nutrients.setdefault(fdc_id, {}).setdefault(nutrient_id, amount)
+
+    measure_units = {row["id"]: row["name"] for row in rows("measure_unit.csv")}
+    portions: Dict[str, Dict[str, float]] = {}
+    for row in rows("food_portion.csv"):
+        if row["fdc_id"] not in foods:
+            continue
+        grams = _number(row.get("gram_weight"))
+        amount = _number(row.get("amount")) or 1.0
+        unit = _fdc_portion_unit(
+            measure_units.get(row.get("measure_unit_id"), ""),
+            row.get("modifier") or "",
+            row.get("portion_description") or "",
+        )
+        if unit and grams:
+            portions.setdefault(row["fdc_id"], {}).setdefault(unit, grams / amount)
+
+    branded = {row["fdc_id"]: row for row in rows("branded_food.csv") if row["fdc_id"] in foods}
+
+    for fdc_id, food in foods.items():
+        brand_row = branded.get(fdc_id, {})
+        serving_g = None
+        if str(brand_row.get("serving_size_unit") or "").lower() in ("g", "grm", "ml", "mlt"):
+            serving_g = _number(brand_row.get("serving_size"))
+        food_portions = portions.get(fdc_id, {})
+        if serving_g:
+            food_portions.setdefault("serving", serving_g)
+        parsed = _fdc_food(
+            fdc_id, food["data_type"], food["description"],
+            brand_row.get("brand_name") or brand_row.get("brand_owner"), brand_row.get("gtin_upc"),
+            nutrients.get(fdc_id, {}), serving_g, food_portions,
+        )
+        if parsed:
+            yield parsed
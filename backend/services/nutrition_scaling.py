@@ -0,0 +1,140 @@
+"""Unit-aware nutrient scaling over NumPy arrays.
+
+Quantities are converted to grams by unit kind, all items at once:
+
+- mass units ("g", "oz", "lb", ...): fixed grams per unit
+- volume units ("ml", "cup", "tbsp", ...): millilitres times the food's density
+- counts and anything else ("piece", "slice", "serving", no unit): the food's
+  portion weight
+
+Nutrients per 100 g are then scaled by ``grams / 100`` as one matrix
+operation, so a whole log or a bulk import costs a few array operations
+rather than a Python loop per item. A single item takes a scalar path
+(``FoodTable.nutrients_one``) instead: NumPy's per-call overhead is much
+larger than the arithmetic for one row.
+"""
+
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .nutrition_db import MASS_UNITS, VOLUME_UNITS, canonical_unit
+
+MASS = 0
+VOLUME = 1
+COUNT = 2
+
+NUTRIENT_COLUMNS = ("calories", "protein_g", "carbs_g", "fat_g")
+
+
+@lru_cache(maxsize=1024)
+def unit_kind(unit: Optional[str]) -> Tuple[int, float]:
+    """``(kind, factor)``: grams per unit for mass, millilitres per unit for volume, 1 for counts."""
+    unit = canonical_unit(unit)
+    if unit in MASS_UNITS:
+        return MASS, MASS_UNITS[unit]
+    if unit in VOLUME_UNITS:
+        return VOLUME, VOLUME_UNITS[unit]
+    return COUNT, 1.0
+
+
+def encode_units(units: Sequence[Optional[str]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Unit kinds and factors for a batch of unit strings."""
+    encoded = [unit_kind(unit) for unit in units]
+    kinds = np.fromiter((k for k, _ in encoded), dtype=np.int8, count=len(encoded))
+    factors = np.fromiter((f for _, f in encoded), dtype=np.float64, count=len(encoded))
+    return kinds, factors
+
+
+def quantities(qtys: Sequence[Optional[float]]) -> np.ndarray:
+    """Quantities as floats; missing or non-positive quantities count as 1."""
+    qty = np.array([np.nan if q is None else q for q in qtys], dtype=np.float64)
+    return np.where(np.isnan(qty) | (qty <= 0), 1.0, qty)
+
+
+def grams_for(qty: np.ndarray, kinds: np.ndarray, factors: np.ndarray,
+              portion_g: np.ndarray, density: np.ndarray) -> np.ndarray:
+    """Grams eaten per item for arrays of quantities, unit kinds/factors and per-food portion weight and density."""
+    per_unit = np.where(kinds == MASS, factors, np.where(kinds == VOLUME, factors * density, portion_g))
+    return qty * per_unit
+
+
+def scale_per_100g(per_100g: np.ndarray, grams: np.ndarray) -> np.ndarray:
+    """Nutrient totals (rounded to 0.1) for an (n, 4) per-100 g matrix and n gram amounts."""
+    return np.round(per_100g * (grams / 100.0)[:, None], 1)
+
+
+# ============ Food Table ============
+
+class FoodTable:
+    """Per-100 g nutrients, portion weights and densities of a fixed set of foods, matched by name.
+
+    ``foods`` maps a name fragment to ``calories``/``protein_g``/``carbs_g``/
+    ``fat_g`` per 100 g, the food's usual ``unit`` and the ``weight`` in
+    grams of one such unit, and optionally ``density`` (g/ml). Without an
+    explicit density, a food measured in a volume unit gets
+    ``weight / millilitres`` (a cup of cooked rice weighs 158 g, not 240 g)
+    and anything else is taken as water. Names that match no food use
+    ``default``.
+    """
+
+    def __init__(self, foods: Dict[str, dict], default: dict):
+        self.keys = list(foods)
+        rows = [*foods.values(), default]
+        self.per_100g = np.array([[row[c] for c in NUTRIENT_COLUMNS] for row in rows], dtype=np.float64)
+        self.portion_g = np.array([row["weight"] for row in rows], dtype=np.float64)
+        self.density = np.array([_density(row) for row in rows], dtype=np.float64)
+        self.default_index = len(self.keys)
+        self._match_cache: Dict[str, int] = {}
+        # Plain-float copies for the scalar path.
+        self._per_100g_rows = self.per_100g.tolist()
+        self._portion_list = self.portion_g.tolist()
+        self._density_list = self.density.tolist()
+
+    def match(self, name: str) -> int:
+        """Row of the first food whose key occurs in ``name`` (``default_index`` if none)."""
+        index = self._match_cache.get(name)
+        if index is None:
+            lowered = name.lower()
+            index = next((i for i, key in enumerate(self.keys) if key in lowered), self.default_index)
+            if len(self._match_cache) < 10_000:
+                self._match_cache[name] = index
+        return index
+
+    def nutrients(self, names: Sequence[str], qtys: Sequence[Optional[float]],
+                  units: Sequence[Optional[str]]) -> np.ndarray:
+        """(n, 4) nutrient totals for a batch of food mentions."""
+        rows = np.fromiter((self.match(name) for name in names), dtype=np.intp, count=len(names))
+        return self.nutrients_for_rows(rows, quantities(qtys), *encode_units(units))
+
+    def nutrients_one(self, name: str, qty: Optional[float], unit: Optional[str]) -> Tuple[int, List[float]]:
+        """Matched row and nutrient totals for one food mention; same numbers as ``nutrients``."""
+        row = self.match(name)
+        if qty is None or not qty > 0:  # also catches NaN
+            qty = 1.0
+        kind, factor = unit_kind(unit)
+        if kind == MASS:
+            per_unit = factor
+        elif kind == VOLUME:
+            per_unit = factor * self._density_list[row]
+        else:
+            per_unit = self._portion_list[row]
+        scale = qty * per_unit / 100.0
+        # round(x * 10) / 10 rounds half to even like np.round(x, 1).
+        return row, [round(value * scale * 10) / 10 for value in self._per_100g_rows[row]]
+
+    def nutrients_for_rows(self, rows: np.ndarray, qty: np.ndarray, kinds: np.ndarray,
+                           factors: np.ndarray) -> np.ndarray:
+        """(n, 4) nutrient totals for pre-encoded rows, quantities and units (bulk path)."""
+        grams = grams_for(qty, kinds, factors, self.portion_g[rows], self.density[rows])
+        return scale_per_100g(self.per_100g[rows], grams)
+
+
+def _density(food: dict) -> float:
+    if food.get("density"):
+        return food["density"]
+    kind, millilitres = unit_kind(food.get("unit"))
+    if kind == VOLUME and food.get("weight"):
+        return food["weight"] / millilitres
+    return 1.0
@@ -0,0 +1,44 @@
+"""Token bucket rate limiter."""
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``rate_per_s`` up to ``capacity``."""
+
+    def __init__(self, rate_per_s: float, capacity: float):
+        self.rate_per_s = rate_per_s
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_s)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take tokens if available, without waiting."""
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    def wait_time(self, tokens: float = 1.0) -> float:
+        """Seconds until ``tokens`` will be available."""
+        self._refill()
+        if self._tokens >= tokens or self.rate_per_s <= 0:
+            return 0.0
+        return (tokens - self._tokens) / self.rate_per_s
+
+    async def acquire(self, tokens: float = 1.0, timeout: float = 0.0) -> bool:
+        """Wait up to ``timeout`` seconds for tokens."""
+        deadline = time.monotonic() + timeout
+        while not self.try_acquire(tokens):
+            wait = self.wait_time(tokens)
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+        return True
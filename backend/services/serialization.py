@@ -0,0 +1,83 @@
+"""Fast JSON responses for trusted database documents.
+
+Routes that return documents written by this API (food entries) do not need
+FastAPI to re-validate them through a ``response_model`` and encode them
+with ``jsonable_encoder`` + ``json.dumps``: ``entry_view`` projects a
+document onto the public ``FoodEntry`` fields and ``FastJSONResponse``
+encodes it with orjson (stdlib ``json`` when orjson is not installed).
+Routes keep their ``response_model`` for the OpenAPI schema.
+"""
+
+import json
+from datetime import date, datetime
+from typing import Any, Iterable, List, Optional
+
+from bson import ObjectId
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib encoder
+    orjson = None
+
+ENTRY_FIELDS = (
+    "id", "user_id", "logged_at", "raw_text", "meal_label", "items", "totals",
+    "image_base64", "created_at", "updated_at",
+)
+# Left out of compact list payloads: large or implied by the request.
+COMPACT_EXCLUDED_FIELDS = {"user_id", "image_base64"}
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode to JSON bytes (ObjectIds as strings, datetimes as ISO 8601)."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: bytes) -> Any:
+    """Decode JSON bytes written by ``dumps``."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(Response):
+    """JSON response rendered with orjson, without FastAPI's encoding pass."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def entry_view(doc: dict, compact: bool = False) -> dict:
+    """Public view of a stored food entry without re-validating it.
+
+    Compact views drop null fields and the fields in
+    ``COMPACT_EXCLUDED_FIELDS``.
+    """
+    if not compact:
+        return {field: doc.get(field) for field in ENTRY_FIELDS}
+    return {
+        field: doc[field]
+        for field in ENTRY_FIELDS
+        if field not in COMPACT_EXCLUDED_FIELDS and doc.get(field) is not None
+    }
+
+
+def entries_view(docs: Iterable[dict], compact: bool = False) -> List[dict]:
+    return [entry_view(doc, compact) for doc in docs]
+
+
+def entry_projection(compact: bool) -> Optional[dict]:
+    """MongoDB projection for entry reads (compact reads skip the image)."""
+    return {"image_base64": 0} if compact else None
@@ -0,0 +1,276 @@
+"""Caches shared by every worker process on a host, or by every host.
+
+``create_cache`` returns the backend selected by ``CACHE_BACKEND``, with the
+``TTLCache`` interface (``get``/``set``/``delete``/``clear``/``stats``):
+
+- ``local``: a ``TTLCache`` in each process
+- ``shm``: a fixed-size hash table in a memory-mapped file under
+  ``CACHE_SHM_DIR`` (``/dev/shm`` is RAM), shared by all processes on the
+  host that open it, with no server to run; it also survives restarts
+- ``redis``: a Redis-compatible server at ``CACHE_REDIS_URL`` (needs the
+  ``redis`` package); eviction follows the server's ``maxmemory-policy``
+
+Shared backends take string keys and JSON values, encoded with
+``services.serialization.dumps`` on both, and entries expire ``ttl_s``
+seconds after they are set. They are best effort: a server that does not
+answer within ``CACHE_REDIS_TIMEOUT_S`` or a value larger than a slot is a
+miss, never an error. Calls are synchronous like ``TTLCache``'s, so the
+Redis server should be close (same host or zone).
+
+A namespace names one cache; bump its version suffix when the format of
+its values changes, as entries outlive a deploy.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Optional, Union
+
+from .cache import TTLCache
+from .config import get_settings
+from .serialization import dumps, loads
+
+try:
+    import fcntl
+except ImportError:  # no POSIX record locks (Windows): shm falls back to local caches
+    fcntl = None
+
+_MAGIC = b"NTCACHE1"
+_HEADER_SIZE = 64
+_SLOT_HEADER = struct.Struct("<16sdI4x")  # key digest, expires at (epoch s), value length
+_WAYS = 4
+_REDIS_RETRY_S = 5.0
+
+
+def _digest(key: str) -> bytes:
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+class ShmCache:
+    """Set-associative hash table in a shared memory-mapped file.
+
+    A key hashes to a set of ``_WAYS`` slots. A new entry replaces the same
+    key, else an empty or expired slot, else the slot closest to expiry.
+    Each set is guarded by a POSIX record lock on its own byte, so processes
+    only wait for each other on the same set. The file name encodes the
+    geometry: a cache resized by a new deploy gets a new file.
+    """
+
+    def __init__(self, path: str, max_entries: int, ttl_s: float, max_value_bytes: int = 2048):
+        self.ttl_s = ttl_s
+        self.max_value_bytes = max_value_bytes
+        self.slot_size = _SLOT_HEADER.size + max_value_bytes
+        self.sets = max(1, -(-max_entries // _WAYS))
+        self.max_entries = self.sets * _WAYS
+        self.path = f"{path}-{self.max_entries}x{max_value_bytes}.cache"
+        self.hits = 0
+        self.misses = 0
+        self.oversized = 0
+        self._lock = threading.Lock()  # record locks are per process; this serializes threads
+        self._fd, self._map = self._open()
+
+    def _open(self):
+        size = _HEADER_SIZE + self.max_entries * self.slot_size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX, 1, 0)
+            try:
+                if os.fstat(fd).st_size < size:
+                    # Reserve the pages now: a full tmpfs fails here instead of with SIGBUS on a write.
+                    if hasattr(os, "posix_fallocate"):
+                        os.posix_fallocate(fd, 0, size)
+                    else:
+                        os.ftruncate(fd, size)
+                    os.pwrite(fd, _MAGIC, 0)
+                elif os.pread(fd, len(_MAGIC), 0) != _MAGIC:
+                    raise OSError(f"{self.path} is not a cache file")
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, 1, 0)
+            return fd, mmap.mmap(fd, size)
+        except BaseException:
+            os.close(fd)
+            raise
+
+    @contextmanager
+    def _locked(self, index: int, exclusive: bool):
+        # len 0 locks every set (clear)
+        start, length = (_HEADER_SIZE + index, 1) if index >= 0 else (_HEADER_SIZE, 0)
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH, length, start)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, start)
+
+    def _set_of(self, digest: bytes) -> int:
+        return int.from_bytes(digest[:8], "little") % self.sets
+
+    def _slots(self, index: int):
+        base = _HEADER_SIZE + index * _WAYS * self.slot_size
+        return range(base, base + _WAYS * self.slot_size, self.slot_size)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired."""
+        digest = _digest(key)
+        index = self._set_of(digest)
+        data = None
+        with self._locked(index, exclusive=False):
+            for offset in self._slots(index):
+                slot_digest, expires_at, length = _SLOT_HEADER.unpack_from(self._map, offset)
+                if slot_digest == digest:
+                    if expires_at > time.time() and length <= self.max_value_bytes:
+                        start = offset + _SLOT_HEADER.size
+                        data = self._map[start:start + length]
+                    break
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return loads(data)
+
+    def set(self, key: str, value: Any, ttl_s: Optional[float] = None) -> None:
+        """Insert or replace a value; values over ``max_value_bytes`` are not cached."""
+        data = dumps(value)
+        if len(data) > self.max_value_bytes:
+            self.oversized += 1
+            return
+        digest = _digest(key)
+        index = self._set_of(digest)
+        expires_at = time.time() + (self.ttl_s if ttl_s is None else ttl_s)
+        with self._locked(index, exclusive=True):
+            victim, victim_expiry = None, float("inf")
+            for offset in self._slots(index):
+                slot_digest, slot_expiry, _ = _SLOT_HEADER.unpack_from(self._map, offset)
+                if slot_digest == digest:
+                    victim = offset
+                    break
+                if slot_expiry < victim_expiry:
+                    victim, victim_expiry = offset, slot_expiry
+            start = victim + _SLOT_HEADER.size
+            self._map[start:start + len(data)] = data
+            _SLOT_HEADER.pack_into(self._map, victim, digest, expires_at, len(data))
+
+    def delete(self, key: str) -> None:
+        digest = _digest(key)
+        index = self._set_of(digest)
+        with self._locked(index, exclusive=True):
+            for offset in self._slots(index):
+                if self._map[offset:offset + len(digest)] == digest:
+                    _SLOT_HEADER.pack_into(self._map, offset, bytes(16), 0.0, 0)
+                    break
+
+    def clear(self) -> None:
+        with self._locked(-1, exclusive=True):
+            for offset in range(_HEADER_SIZE, len(self._map), self.slot_size):
+                _SLOT_HEADER.pack_into(self._map, offset, bytes(16), 0.0, 0)
+
+    def __len__(self) -> int:
+        now = time.time()
+        return sum(
+            1 for offset in range(_HEADER_SIZE, len(self._map), self.slot_size)
+            if _SLOT_HEADER.unpack_from(self._map, offset)[1] > now
+        )
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "oversized": self.oversized,
+        }
+
+
+class RedisCache:
+    """Cache entries as ``PX``-expiring keys on a Redis-compatible server.
+
+    After a failed call the server is skipped for ``_REDIS_RETRY_S`` seconds,
+    so an outage costs one timeout rather than one per lookup.
+    """
+
+    def __init__(self, url: str, prefix: str, ttl_s: float, timeout_s: float = 0.05):
+        import redis
+
+        self.ttl_s = ttl_s
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._error_types = (redis.RedisError, OSError)
+        # redis-py reconnects in a forked child instead of sharing the parent's sockets.
+        self._client = redis.Redis.from_url(url, socket_timeout=timeout_s, socket_connect_timeout=timeout_s)
+        self._down_until = 0.0
+
+    def _call(self, fn, *args, **kwargs):
+        if time.monotonic() < self._down_until:
+            return None
+        try:
+            return fn(*args, **kwargs)
+        except self._error_types as e:
+            self.errors += 1
+            print(f"[Cache] Redis unavailable ({e}); retrying in {_REDIS_RETRY_S:.0f}s")
+            self._down_until = time.monotonic() + _REDIS_RETRY_S
+            return None
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None if missing, expired or the server is unavailable."""
+        data = self._call(self._client.get, self.prefix + key)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return loads(data)
+
+    def set(self, key: str, value: Any, ttl_s: Optional[float] = None) -> None:
+        ttl_ms = max(1, int((self.ttl_s if ttl_s is None else ttl_s) * 1000))
+        self._call(self._client.set, self.prefix + key, dumps(value), px=ttl_ms)
+
+    def delete(self, key: str) -> None:
+        self._call(self._client.delete, self.prefix + key)
+
+    def _keys(self) -> list:
+        return self._call(lambda: list(self._client.scan_iter(match=self.prefix + "*", count=1000))) or []
+
+    def clear(self) -> None:
+        keys = self._keys()
+        for i in range(0, len(keys), 1000):
+            self._call(self._client.delete, *keys[i:i + 1000])
+
+    def __len__(self) -> int:
+        return len(self._keys())
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "errors": self.errors,
+        }
+
+
+Cache = Union[TTLCache, ShmCache, RedisCache]
+
+
+def create_cache(namespace: str, max_entries: int, ttl_s: float, max_value_bytes: int = 2048) -> Cache:
+    """The ``namespace`` cache on the configured backend (a local ``TTLCache`` if it is unavailable)."""
+    settings = get_settings()
+    backend = settings.cache_backend
+    name = f"{settings.cache_prefix}-{namespace}"
+    try:
+        if backend == "shm":
+            if fcntl is None:
+                raise OSError("no POSIX record locks on this platform")
+            return ShmCache(os.path.join(settings.cache_shm_dir, name), max_entries, ttl_s, max_value_bytes)
+        if backend == "redis":
+            return RedisCache(settings.cache_redis_url, f"{settings.cache_prefix}:{namespace}:", ttl_s,
+                              settings.cache_redis_timeout_s)
+    except (ImportError, OSError, ValueError) as e:
+        print(f"[Cache] {backend} cache {namespace!r} unavailable ({e}); using a per-process cache")
+    return TTLCache(max_entries, ttl_s)
@@ -0,0 +1,224 @@
+"""Real-time sync of a user's entries, goals and settings.
+
+One MongoDB change stream per process watches ``food_entries``,
+``user_goals`` and ``user_settings``. Each change is routed by ``user_id``
+to the in-memory queues of that user's connected clients, so 10 devices
+cost one stream, not 10 polls. Clients receive deltas:
+
+- ``{"type": "upsert", "kind": "entries", "data": {...}}``: compact entry view,
+  or the goals/settings document
+- ``{"type": "delete", "kind": "entries", "id": "..."}``
+- ``{"type": "resync"}``: events were lost (a slow client or a stream
+  restart), so the client should refetch with its ETags
+
+Change streams need a replica set. Deletes carry the ``user_id`` only
+through pre-images, which need MongoDB 6.0+ and are enabled on
+``food_entries`` when the stream starts. Without a replica set (a
+standalone mongod, mongomock), the feed runs in local mode: the write
+functions in ``mongodb.py`` publish their own changes, which reaches
+clients connected to the same process only.
+"""
+
+import asyncio
+from typing import Dict, Optional, Set
+
+from .config import get_settings
+from .serialization import entry_view
+
+# Watched collection -> data kind (the same kinds as the ETag versions).
+SYNC_COLLECTIONS = {"food_entries": "entries", "user_goals": "goals", "user_settings": "settings"}
+RESYNC = {"type": "resync"}
+
+
+def document_view(kind: str, doc: dict) -> dict:
+    """Delta payload for a stored document (``_id`` or ``id``)."""
+    doc = dict(doc)
+    if "_id" in doc:
+        doc["id"] = str(doc.pop("_id"))
+    if kind == "entries":
+        return entry_view(doc, compact=True)
+    return doc
+
+
+def change_to_event(change: dict) -> Optional[tuple]:
+    """``(user_id, event)`` for a change stream document, or None if it cannot be routed."""
+    kind = SYNC_COLLECTIONS.get(change.get("ns", {}).get("coll"))
+    op = change.get("operationType")
+    if kind is None:
+        return None
+    if op in ("insert", "update", "replace"):
+        doc = change.get("fullDocument")
+        if not doc or not doc.get("user_id") or doc.get("archiving"):
+            return None  # deleted again before the lookup, or moving to the archive
+        return doc["user_id"], {"type": "upsert", "kind": kind, "data": document_view(kind, doc)}
+    if op == "delete":
+        before = change.get("fullDocumentBeforeChange")
+        if not before or not before.get("user_id") or before.get("archiving"):
+            return None  # no pre-image (the owner is unknown), or archived rather than deleted
+        return before["user_id"], {"type": "delete", "kind": kind, "id": str(change["documentKey"]["_id"])}
+    return None
+
+
+class Subscription:
+    """One connected client's bounded event queue."""
+
+    def __init__(self, user_id: str, max_queue: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(max_queue)
+
+    def put(self, event: dict) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow to keep up: drop the backlog and ask the client to refetch.
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Next event, or None after ``timeout`` seconds without one."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class ChangeFeed:
+    """Per-process change stream fanned out to subscribed clients by user."""
+
+    def __init__(self, max_queue: int = 256):
+        self.max_queue = max_queue
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.streaming = False  # the change stream is delivering events
+        self.local = False  # no change streams: writes publish in-process
+
+    # ---- subscribers ----
+
+    def subscribe(self, user_id: str, db) -> Subscription:
+        self._ensure_started(db)
+        sub = Subscription(user_id, self.max_queue)
+        self._subscribers.setdefault(user_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        subs = self._subscribers.get(sub.user_id)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del self._subscribers[sub.user_id]
+
+    def publish(self, user_id: str, event: dict) -> None:
+        for sub in self._subscribers.get(user_id, ()):
+            sub.put(event)
+
+    def _broadcast(self, event: dict) -> None:
+        for subs in self._subscribers.values():
+            for sub in subs:
+                sub.put(event)
+
+    # ---- change stream ----
+
+    def _ensure_started(self, db) -> None:
+        if self._task is None and not self.local:
+            self._task = asyncio.create_task(self._watch(db))
+
+    async def _watch(self, db) -> None:
+        from pymongo.errors import OperationFailure
+
+        pipeline = [{"$match": {
+            "ns.coll": {"$in": list(SYNC_COLLECTIONS)},
+            "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+        }}]
+        resume_token = None
+        opened = False
+        delay = 1.0
+        while True:
+            try:
+                async with db.watch(
+                    pipeline,
+                    full_document="updateLookup",
+                    full_document_before_change="whenAvailable",
+                    resume_after=resume_token,
+                ) as stream:
+                    if not opened:
+                        await _enable_pre_images(db)
+                    self.streaming = opened = True
+                    print("[Sync] Change stream open")
+                    delay = 1.0
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        routed = change_to_event(change)
+                        if routed is not None:
+                            self.publish(*routed)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not opened and _streams_unsupported(e):
+                    print(f"[Sync] Change streams unavailable ({e}); publishing local writes only")
+                    self.local = True
+                    self._task = None
+                    return
+                print(f"[Sync] Change stream error, reopening in {delay:.0f}s: {e}")
+                if isinstance(e, OperationFailure):
+                    resume_token = None  # e.g. the token fell off the oplog
+            self.streaming = False
+            self._broadcast(RESYNC)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        self.streaming = False
+
+
+def _streams_unsupported(error: Exception) -> bool:
+    """Standalone mongod (no replica set) or a mock database without change streams."""
+    from pymongo.errors import OperationFailure, PyMongoError
+
+    if isinstance(error, OperationFailure):
+        return error.code in (40573, 40324)  # replica sets only / unknown $changeStream stage
+    return not isinstance(error, PyMongoError)
+
+
+async def _enable_pre_images(db) -> None:
+    """Let delete events on food_entries carry the deleted document (MongoDB 6.0+)."""
+    try:
+        await db.command({"collMod": "food_entries", "changeStreamPreAndPostImages": {"enabled": True}})
+    except Exception as e:
+        print(f"[Sync] Pre-images not enabled, entry deletes will not be synced: {e}")
+
+
+# ============ Singleton ============
+
+_change_feed: Optional[ChangeFeed] = None
+
+
+def get_change_feed() -> ChangeFeed:
+    global _change_feed
+    if _change_feed is None:
+        _change_feed = ChangeFeed(get_settings().sync_queue_size)
+    return _change_feed
+
+
+def publish_change(user_id: str, kind: str, op: str, doc: Optional[dict] = None,
+                   doc_id: Optional[str] = None) -> None:
+    """Called by the write functions; only delivers anything in local mode."""
+    if _change_feed is None or not _change_feed.local:
+        return
+    if op == "delete":
+        event = {"type": "delete", "kind": kind, "id": doc_id}
+    else:
+        event = {"type": "upsert", "kind": kind, "data": document_view(kind, doc)}
+    _change_feed.publish(user_id, event)
+
+
+async def close_change_feed() -> None:
+    if _change_feed is not None:
+        await _change_feed.close()
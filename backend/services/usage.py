@@ -0,0 +1,281 @@
+"""LLM token usage accounting.
+
+Every completion, and every parse answered without one, is appended to the
+``llm_usage`` collection as a compact document:
+
+- ``t``: time (UTC), ``u``: user id
+- ``e``: endpoint: ``parse``, ``image``, ``edit`` or ``draft``, with a
+  ``-job`` suffix for queued jobs
+- ``k``: call: ``parse``, ``reask`` or ``vision`` (absent for cache hits)
+- ``m``/``p``: model and provider, ``pt``/``ct``: prompt and completion
+  tokens, ``ms``: LLM latency
+- ``c``: cache status: ``miss`` (the whole log went to the LLM),
+  ``partial`` (only uncached segments did), or what answered a parse
+  without the LLM: ``barcode``, ``draft``, ``memory``, ``semantic``,
+  ``segments``, ``edit``
+
+Documents are buffered in memory and written with one unordered
+``insert_many`` every ``USAGE_FLUSH_INTERVAL_S`` or ``USAGE_BATCH_SIZE``
+documents, whichever comes first. ``aggregate_usage`` sums them per user,
+day, model, endpoint and/or cache status and prices them with
+``LLM_PRICES``.
+"""
+
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .admission import BULK, request_priority
+from .config import get_settings
+from .mongodb import get_database
+
+USAGE_GROUPS = ("user", "day", "model", "endpoint", "cache")
+_GROUP_FIELDS = {"user": "$u", "model": "$m", "endpoint": "$e", "cache": "$c"}
+
+
+@dataclass
+class UsageScope:
+    """The user and endpoint LLM calls are charged to, and how the parse was answered."""
+    user_id: str
+    endpoint: str
+    completions: int = 0
+    cache: Optional[str] = None
+
+
+_scope: ContextVar[Optional[UsageScope]] = ContextVar("usage_scope", default=None)
+
+
+@contextmanager
+def usage_scope(user_id: str, endpoint: str):
+    """Charge the LLM calls made inside to ``user_id`` and ``endpoint``.
+
+    Nested scopes (an image analysis parsing its description) join the
+    outer one. A scope that made no completion is recorded as a cache hit
+    if ``note_cache`` named the source.
+    """
+    current = _scope.get()
+    if current is not None:
+        yield current
+        return
+    if request_priority.get() == BULK:
+        endpoint = f"{endpoint}-job"
+    scope = UsageScope(user_id, endpoint)
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+        if scope.completions == 0 and scope.cache is not None:
+            get_usage_recorder().record({
+                "t": datetime.utcnow(), "u": scope.user_id, "e": scope.endpoint, "c": scope.cache,
+            })
+
+
+def note_cache(source: str) -> None:
+    """Name what answered the current parse without the LLM."""
+    scope = _scope.get()
+    if scope is not None:
+        scope.cache = source
+
+
+def record_completion(result, kind: str, cache: str = "miss") -> None:
+    """Record the tokens of one completion (a ``ChatResult``) against the current scope."""
+    scope = _scope.get()
+    if scope is not None:
+        scope.completions += 1
+    get_usage_recorder().record({
+        "t": datetime.utcnow(),
+        "u": scope.user_id if scope else None,
+        "e": scope.endpoint if scope else None,
+        "k": kind,
+        "m": result.model,
+        "p": result.provider,
+        "pt": result.prompt_tokens,
+        "ct": result.completion_tokens,
+        "ms": round(result.latency_ms, 1),
+        "c": cache,
+    })
+
+
+class UsageRecorder:
+    """Buffers usage documents and writes them in batches."""
+
+    def __init__(self, get_db: Callable[[], object], batch_size: int, interval_s: float, max_buffer: int):
+        self.get_db = get_db
+        self.batch_size = batch_size
+        self.interval_s = interval_s
+        self.max_buffer = max_buffer
+        self.enabled = True
+        self.written = 0
+        self.dropped = 0
+        self._buffer: List[dict] = []
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, doc: dict) -> None:
+        if not self.enabled:
+            return
+        if len(self._buffer) >= self.max_buffer:
+            # The database is unreachable or too slow: keep the newest documents.
+            del self._buffer[0]
+            self.dropped += 1
+        self._buffer.append(doc)
+        if len(self._buffer) >= self.batch_size:
+            self._full.set()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> int:
+        """Write the buffered documents; returns how many were written."""
+        written = 0
+        while self._buffer:
+            batch = self._buffer[:self.batch_size]
+            del self._buffer[:len(batch)]
+            try:
+                await self.get_db().llm_usage.insert_many(batch, ordered=False)
+            except Exception as e:
+                print(f"[Usage] Writing {len(batch)} usage record(s) failed: {type(e).__name__}: {str(e)}")
+                if getattr(e, "details", None) is None:
+                    # Nothing was written (BulkWriteError details a partial write): retry next time.
+                    self._buffer[:0] = batch[:max(0, self.max_buffer - len(self._buffer))]
+                break
+            written += len(batch)
+        self.written += written
+        return written
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.interval_s)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+    def stats(self) -> dict:
+        return {"buffered": len(self._buffer), "written": self.written, "dropped": self.dropped}
+
+
+# Global recorder for the process
+_recorder: Optional[UsageRecorder] = None
+
+
+def get_usage_recorder() -> UsageRecorder:
+    global _recorder
+    if _recorder is None:
+        settings = get_settings()
+        _recorder = UsageRecorder(
+            get_database, settings.usage_batch_size, settings.usage_flush_interval_s, settings.usage_max_buffer,
+        )
+        _recorder.enabled = settings.usage_tracking
+    return _recorder
+
+
+# ============ Aggregation ============
+
+def parse_prices(spec: str) -> Dict[str, Tuple[float, float]]:
+    """``"model=input/output,..."`` (USD per million tokens) -> model -> (input, output)."""
+    prices = {}
+    for part in spec.split(","):
+        model, _, price = part.strip().rpartition("=")
+        if not model:
+            continue
+        prompt, _, completion = price.partition("/")
+        prices[model] = (float(prompt), float(completion or prompt))
+    return prices
+
+
+async def aggregate_usage(
+    db,
+    start: datetime,
+    end: datetime,
+    by: List[str],
+    user_id: Optional[str] = None,
+) -> dict:
+    """Completions, cache hits, tokens and cost from ``start`` up to ``end``, grouped ``by``."""
+    query = {"t": {"$gte": start, "$lt": end}}
+    if user_id:
+        query["u"] = user_id
+    # Always grouped by model so rows can be priced; merged into the requested groups below.
+    keys = {"model": "$m"}
+    for group in by:
+        if group == "day":
+            keys["day"] = {"$dateToString": {"format": "%Y-%m-%d", "date": "$t"}}
+        elif group in _GROUP_FIELDS:
+            keys[group] = _GROUP_FIELDS[group]
+    pipeline = [
+        {"$match": query},
+        {"$group": {
+            "_id": keys,
+            "n": {"$sum": 1},
+            "pt": {"$sum": "$pt"},
+            "ct": {"$sum": "$ct"},
+            "ms": {"$sum": "$ms"},
+        }},
+    ]
+    prices = parse_prices(get_settings().llm_prices)
+    rows: Dict[tuple, dict] = {}
+    totals = _empty_row({})
+    async for group in db.llm_usage.aggregate(pipeline):
+        key = group["_id"]
+        model = key.get("model")
+        row_key = tuple(key.get(g) for g in by)
+        row = rows.setdefault(row_key, _empty_row(dict(zip(by, row_key))))
+        for target in (row, totals):
+            if model is None:
+                target["cache_hits"] += group["n"]
+                continue
+            target["completions"] += group["n"]
+            target["prompt_tokens"] += group["pt"] or 0
+            target["completion_tokens"] += group["ct"] or 0
+            target["llm_ms"] += group["ms"] or 0.0
+            price = prices.get(model)
+            if price is None:
+                target["unpriced_tokens"] += (group["pt"] or 0) + (group["ct"] or 0)
+            else:
+                target["cost_usd"] += ((group["pt"] or 0) * price[0] + (group["ct"] or 0) * price[1]) / 1e6
+    ordered = sorted(rows.values(), key=lambda r: [str(r.get(g)) for g in by])
+    return {
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "by": by,
+        "rows": [_finish_row(row) for row in ordered],
+        "totals": _finish_row(totals),
+    }
+
+
+def _empty_row(keys: dict) -> dict:
+    return {
+        **keys,
+        "completions": 0,
+        "cache_hits": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "unpriced_tokens": 0,
+        "cost_usd": 0.0,
+        "llm_ms": 0.0,
+    }
+
+
+def _finish_row(row: dict) -> dict:
+    row["cost_usd"] = round(row["cost_usd"], 6)
+    llm_ms = row.pop("llm_ms")
+    row["avg_llm_ms"] = round(llm_ms / row["completions"], 1) if row["completions"] else None
+    return row
+
+
+def day_range(start_day, end_day) -> Tuple[datetime, datetime]:
+    """``[start of start_day, end of end_day)`` in UTC."""
+    start = datetime.combine(start_day, datetime.min.time())
+    return start, datetime.combine(end_day, datetime.min.time()) + timedelta(days=1)
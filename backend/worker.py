@@ -0,0 +1,54 @@
+"""Standalone parse job worker: runs queued /api/parse-food-log and
+/api/analyze-food-image jobs from MongoDB.
+
+Run any number of these next to API processes started with
+PARSE_JOB_WORKERS=0:
+
+    python worker.py [--concurrency N]
+"""
+
+import argparse
+import asyncio
+import signal
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from services import (
+    connect_to_mongodb,
+    close_mongodb_connection,
+    ensure_job_indexes,
+    get_settings,
+    get_usage_recorder,
+    JobWorkerPool,
+)
+from agents import close_food_agent_service, JOB_HANDLERS
+
+
+async def run(concurrency: int) -> None:
+    await connect_to_mongodb()
+    await ensure_job_indexes()
+    get_usage_recorder().start()
+    pool = JobWorkerPool(JOB_HANDLERS, concurrency)
+    pool.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    await pool.stop()
+    await close_food_agent_service()
+    await get_usage_recorder().stop()
+    await close_mongodb_connection()
+    print("Parse job worker stopped.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run queued parse jobs from MongoDB.")
+    parser.add_argument("--concurrency", type=int, default=max(1, get_settings().parse_job_workers))
+    args = parser.parse_args()
+    asyncio.run(run(args.concurrency))